@@ -1,13 +1,27 @@
 import streamlit as st
-import streamlit.components.v1 as components  # Importante para notificações JS
 import json
-import pandas as pd
-import gspread
 import time
-import base64  # Necessário para o fix do Safari
-import requests  # Necessário para baixar o som no servidor
-from datetime import datetime
-from oauth2client.service_account import ServiceAccountCredentials
+import os
+import uuid
+import math
+import copy
+import re
+import weakref
+import heapq
+import csv
+import io
+import tempfile
+from datetime import datetime, timedelta
+# pandas, gspread, oauth2client e requests são importados só onde são usados:
+# quem abre o Edital ou o Pomodoro não paga ~1 s de imports no primeiro acesso
+# Infraestrutura (armazenamento, diário, write-behind, codec, Sheets): módulos do
+# pacote estudamed, definidos uma vez por processo e não a cada rerun do script
+from estudamed.codec import DIFFICULTY_OPTIONS, key_for_id, legacy_syllabus_id, syllabus_id
+from estudamed.metrics import MetricsRegistry
+from estudamed.sheets import SheetsConnection, SheetsGuard, open_worksheet
+from estudamed.storage import (ENTRY_DEFAULTS, HISTORY_MONTHS_KEY, HISTORY_WEEK_PREFIX, SHEET_HEADER, Journal,
+                               MemoryStore, SheetsStore, SQLiteStore, WriteBehind, journal_namespaces,
+                               overlay_journal)
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -29,91 +43,303 @@ st.markdown(REQUEST_PERMISSION, unsafe_allow_html=True)
 
 # --- CONFIGURAÇÕES DO POMODORO ---
 POMODORO_SETTINGS = {
-    'som_url': 'https://assets.mixkit.co/active_storage/sfx/2869/2869-preview.mp3',
+    # Som embutido no repositório (static/alarme.wav), tocado com st.audio
+    'som_arquivo': 'alarme.wav',
+    # Usado pelo navegador só se o arquivo local não carregar (pode trocar via secrets/ambiente)
+    'som_fallback_url': 'https://assets.mixkit.co/active_storage/sfx/2869/2869-preview.mp3',
     'volume': 0.7,
     'vibrar': True,
     'notificacao_persistente': True
 }
 
+# --- CONFIGURAÇÕES (st.secrets OU VARIÁVEIS DE AMBIENTE) ---
+def get_setting(name, env_var, default=None):
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass
+    return os.environ.get(env_var, default)
+
+# "sheets" (padrão), "sqlite" ou "memory"
+STORAGE_BACKEND = str(get_setting("storage_backend", "ESTUDAMED_STORAGE", "sheets")).lower()
+
+# Cache de leitura compartilhado entre sessões: até CACHE_TTL segundos confia na cópia
+# do processo; depois só confere a versão (1 célula) e rebaixa tudo se ela mudou ou
+# se a cópia passou de CACHE_MAX_AGE (pega edições feitas à mão na planilha).
+CACHE_TTL = float(get_setting("cache_ttl", "ESTUDAMED_CACHE_TTL", 30))
+CACHE_MAX_AGE = float(get_setting("cache_max_age", "ESTUDAMED_CACHE_MAX_AGE", 600))
+
+# Liga as métricas internas e a página "⚙️ Diagnóstico"
+DIAGNOSTICS_ENABLED = str(get_setting("diagnostics", "ESTUDAMED_DIAGNOSTICS", "")).lower() in ("1", "true", "sim")
+
+# --- MÉTRICAS (REGISTRO ÚNICO POR PROCESSO) ---
+@st.cache_resource
+def get_metrics():
+    return MetricsRegistry(DIAGNOSTICS_ENABLED)
+
+METRICS = get_metrics()
+_script_started = time.perf_counter()
+
+# --- CLIENTE DO SHEETS COM COTA, RETRY E CIRCUIT BREAKER ---
+# Cota do Sheets por usuário (ver estudamed/sheets.py): as chamadas além dela esperam
+# no balde de tokens em vez de voltarem com 429
+SHEETS_READS_PER_MIN = float(get_setting("sheets_reads_per_min", "ESTUDAMED_SHEETS_READS_PER_MIN", 60))
+SHEETS_WRITES_PER_MIN = float(get_setting("sheets_writes_per_min", "ESTUDAMED_SHEETS_WRITES_PER_MIN", 60))
+SHEETS_TIMEOUT = float(get_setting("sheets_timeout", "ESTUDAMED_SHEETS_TIMEOUT", 20))
+
+@st.cache_resource
+def get_sheets_guard():
+    return SheetsGuard(SHEETS_READS_PER_MIN, SHEETS_WRITES_PER_MIN, metrics=METRICS)
+
 # --- CONEXÃO ROBUSTA COM GOOGLE SHEETS ---
+# A conexão é preguiçosa: nada de rede na execução do script. Quem abre a planilha
+# é a primeira leitura (em segundo plano, ver ProgressStore.prefetch).
+SPREADSHEET_ID = get_setting("spreadsheet_id", "ESTUDAMED_SPREADSHEET_ID",
+                             "1BxiM-uQ2j3k4l5m6n7o8p9q0r1s2t3u4v5w6x7y8z") # <--- SEU ID AQUI
+
 @st.cache_resource
-def connect_to_gsheets():
+def get_sheets_connection():
     try:
         if "gcp_service_account" not in st.secrets:
             st.error("⚠️ Secrets não configurados! Vá nas configurações do App no Streamlit Cloud.")
             return None
-
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["gcp_service_account"], scope)
-        client = gspread.authorize(creds)
-        
-        # --- ID DA PLANILHA ---
-        SPREADSHEET_ID = "1BxiM-uQ2j3k4l5m6n7o8p9q0r1s2t3u4v5w6x7y8z" # <--- SEU ID AQUI
-        
-        try:
-             return client.open_by_key(SPREADSHEET_ID).sheet1
-        except:
-             return client.open("EstudaMed").sheet1
-
+        return SheetsConnection(dict(st.secrets["gcp_service_account"]), SPREADSHEET_ID, get_sheets_guard(),
+                                SHEETS_TIMEOUT)
     except Exception as e:
         st.error(f"Erro na conexão: {e}")
         return None
 
-SHEET = connect_to_gsheets()
+# --- SOM DO ALARME ---
+# O WAV do repositório (static/alarme.wav) toca via st.audio: passa pelo gerenciador
+# de mídia do Streamlit, que o serve com o Content-Type certo. (No app/static/ o
+# Tornado manda .wav como text/plain com nosniff e o Firefox não toca.) É um clipe
+# curto em PCM, sem decodificação, e toca mesmo sem internet; sem ele, vai a URL reserva.
+ALARM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", POMODORO_SETTINGS['som_arquivo'])
+ALARM_FALLBACK_URL = get_setting("alarm_fallback_url", "ESTUDAMED_ALARM_URL", POMODORO_SETTINGS['som_fallback_url'])
 
-# --- FUNÇÕES DE SISTEMA & AUDIO FIX ---
+def alarm_source():
+    if os.path.exists(ALARM_PATH):
+        return ALARM_PATH, "audio/wav"
+    return ALARM_FALLBACK_URL, "audio/mpeg"
 
-# Cache para não baixar o áudio repetidamente
-@st.cache_data(show_spinner=False)
-def get_audio_base64(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return base64.b64encode(response.content).decode('utf-8')
-    except Exception as e:
-        st.error(f"Erro ao carregar áudio: {e}")
+# Última cópia conhecida de cada namespace em disco: sobrevive a reinícios do app e
+# é mostrada na hora enquanto a primeira leitura do Sheets roda em segundo plano
+SNAPSHOT_DIR = get_setting("snapshot_dir", "ESTUDAMED_SNAPSHOT_DIR", ".estudamed_cache")
+
+# Um namespace por aluno: "" é o progresso compartilhado de sempre (sheet1 / aluno = '')
+def normalize_user(name):
+    return re.sub(r"[^a-z0-9._-]+", "-", str(name or "").strip().lower()).strip("-")[:40]
+
+@st.cache_resource
+def get_store(aluno=""):
+    # O índice do edital é montado mais abaixo no script: o store só o pede na primeira leitura
+    options = dict(index=lambda: get_syllabus_index(), metrics=METRICS, cache_ttl=CACHE_TTL, cache_max_age=CACHE_MAX_AGE)
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStore(get_setting("sqlite_path", "ESTUDAMED_SQLITE_PATH", "estudamed.db"), aluno, **options)
+    if STORAGE_BACKEND == "memory":
+        return MemoryStore(**options)
+    conn = get_sheets_connection()
+    if conn is None:
+        return None
+    if not aluno:
+        store = SheetsStore(lambda: conn.spreadsheet().sheet1, **options)
+    else:
+        store = SheetsStore(lambda: open_worksheet(conn.spreadsheet(), f"progresso_{aluno}", SHEET_HEADER), f"_{aluno}",
+                            **options)
+    store.snapshot_path = os.path.join(SNAPSHOT_DIR, f"{aluno or '_compartilhado'}.json")
+    return store
+
+# Cada nome novo cria store, fila, diário e abas no Sheets que vivem enquanto o
+# processo viver, e descartar do cache um store com gravações na fila não é seguro.
+# Por isso, além do compartilhado, só entram os nomes da lista "alunos": um limite
+# por contagem se esgotaria com qualquer um trocando o ?aluno= da URL.
+def allowed_users():
+    raw = get_setting("alunos", "ESTUDAMED_ALUNOS", "")
+    names = raw.split(",") if isinstance(raw, str) else raw
+    return {normalize_user(n) for n in names} - {""}
+
+def admit_user(aluno):
+    # -> None se o namespace pode ser usado, senão o motivo da recusa
+    if not aluno:
+        return None
+    allowed = allowed_users()
+    if not allowed:
+        return 'para usar mais de um aluno, configure a lista "alunos" (secrets ou ESTUDAMED_ALUNOS)'
+    if aluno not in allowed:
+        return "não está na lista de alunos deste app"
+    return None
+
+# --- ALUNO (NAMESPACE DO PROGRESSO) ---
+if 'aluno' not in st.session_state:
+    st.session_state['aluno'] = normalize_user(st.query_params.get("aluno", ""))
+with st.sidebar:
+    ALUNO = normalize_user(st.text_input(
+        "👤 Aluno", key="aluno",
+        help="Cada aluno tem o próprio progresso. Vazio = progresso compartilhado."))
+if ALUNO:
+    st.query_params["aluno"] = ALUNO
+elif "aluno" in st.query_params:
+    del st.query_params["aluno"]
+
+_refused = admit_user(ALUNO)
+if _refused:
+    st.error(f"❌ Aluno {ALUNO!r}: {_refused}. Use outro nome ou deixe vazio.")
+    st.stop()
+
+STORE = get_store(ALUNO)
+
+# --- DIÁRIO LOCAL + GRAVAÇÃO EM SEGUNDO PLANO ---
+# save_data só põe a alteração no diário local (SQLite, fsync) e na fila do
+# write-behind; uma thread por namespace grava em lote e confirma no diário. Se o
+# processo cair, o que sobrou é reenviado em ordem de sequência na próxima partida.
+JOURNAL_PATH = get_setting("journal_path", "ESTUDAMED_JOURNAL_PATH", "estudamed_journal.db")
+
+@st.cache_resource
+def get_writer(aluno=""):
+    store = get_store(aluno)
+    if store is None:
         return None
+    # Memória não sobrevive ao processo: não há o que reenviar depois de uma queda
+    journal = None
+    if JOURNAL_PATH and STORAGE_BACKEND != "memory":
+        journal = Journal(JOURNAL_PATH, f"{STORAGE_BACKEND}:{aluno}", METRICS)
+    return WriteBehind(store, journal)
+
+@st.cache_resource
+def replay_journals():
+    # Uma vez por processo: todo namespace com itens no diário volta para a fila na
+    # partida, e não só quando aquele aluno abrir o app de novo
+    if not JOURNAL_PATH or STORAGE_BACKEND == "memory":
+        return []
+    prefix = f"{STORAGE_BACKEND}:"
+    alunos = [ns[len(prefix):] for ns in journal_namespaces(JOURNAL_PATH) if ns.startswith(prefix)]
+    for aluno in alunos:
+        get_writer(aluno)  # mesmo fora da lista atual: o que já foi aceito ainda chega ao backend
+    return alunos
+
+replay_journals()
+WRITER = get_writer(ALUNO)
 
 def load_data():
-    if SHEET is None: return {}
-    try:
-        val = SHEET.cell(1, 1).value
-        return json.loads(val) if val else {}
-    except:
-        return {}
+    # -> (progresso, origem). Falhas sobem para quem chamou: "não consegui ler" nunca
+    # pode virar "progresso vazio". Origem "snapshot": cópia local mostrada enquanto
+    # a primeira leitura do Sheets roda em segundo plano.
+    if STORE is None: return {}, "store"
+    if STORE.deferred and not STORE.ready():
+        STORE.prefetch()
+        snapshot = STORE.load_snapshot()
+        if snapshot is not None:
+            METRICS.inc("snapshot_renders")
+            return overlay_journal(snapshot, WRITER.unconfirmed()), "snapshot"
+    with METRICS.span("load_data"):
+        # Sem esperar a fila: o que ainda não foi gravado (de qualquer sessão, ou com o
+        # Sheets fora do ar) vem do diário local — ou da fila, sem diário — por cima
+        return overlay_journal(STORE.load(), WRITER.unconfirmed()), "store"
 
-def save_data(data):
-    if SHEET is None: return
-    try:
-        SHEET.update('A1', [[json.dumps(data, ensure_ascii=False)]])
-    except Exception as e:
-        st.warning(f"Salvando alterações... (Google Sheets)")
+def save_data(data, keys=None, bases=None):
+    # keys: chaves alteradas nesta interação (None = compara o dicionário inteiro)
+    # bases: valores vistos antes da edição, para o merge por campo em caso de conflito
+    if WRITER is None: return
+    METRICS.inc("save_data_calls")
+    with METRICS.span("save_data_enqueue"):
+        WRITER.submit(data, keys, bases)
+
+def render_sync_status():
+    if WRITER is None: return
+    status = WRITER.status()
+    if status["erro"]:
+        st.error(f"⚠️ Falha ao salvar em {STORE.label} ({status['erro']}). "
+                 f"{status['pendentes']} alteração(ões) aguardando há {status['atraso']:.0f}s — nova tentativa automática."
+                 + (" Elas já estão no diário local e sobrevivem a um reinício." if WRITER.journal is not None else ""))
+    elif status["pendentes"]:
+        st.caption(f"⏳ Salvando {status['pendentes']} alteração(ões)... ({status['atraso']:.1f}s)")
+    else:
+        ultimo = status["ultimo"].strftime("%H:%M:%S") if status["ultimo"] else "—"
+        duracao = f" ({status['duracao'] * 1000:.0f} ms)" if status["duracao"] is not None else ""
+        st.info(f"💡 Dados sincronizados com {STORE.label}. Último salvamento: {ultimo}{duracao}")
+    if status["descartados"]:
+        st.warning(f"🗑️ {len(status['descartados'])} alteração(ões) recusada(s) pelo {STORE.label} foram separadas "
+                   "para não travar as demais (detalhes no Diagnóstico).")
+    if status["conflitos"]:
+        st.caption(f"🔀 {status['conflitos']} gravação(ões) concorrente(s) mesclada(s) campo a campo.")
+    if STORAGE_BACKEND == "sheets":
+        pausa = get_sheets_guard().retry_in()
+        if pausa > 0:
+            st.warning(f"🛑 Google Sheets instável: gravações pausadas por {pausa:.0f}s (nada foi perdido, ficam na fila).")
+
+# Sessão encerrada (aba fechada) -> o estado é descartado e pedimos um flush imediato
+class _SessionFlushGuard:
+    pass
+
+if WRITER is not None and '_flush_guard' not in st.session_state:
+    _guard = _SessionFlushGuard()
+    weakref.finalize(_guard, WRITER.flush, wait=False)
+    st.session_state['_flush_guard'] = _guard
+
+# --- SESSÕES DE POMODORO: LOG + ROLLUPS ---
+# Cada sessão vai para o log do backend (só acréscimos, gravados em lote). No
+# progresso fica apenas "pomodoro_rollup": totais por dia (últimos N dias) e por
+# semana ISO, compactados a cada nova sessão para o payload não crescer.
+POMODORO_DAYS_KEPT = 90
+
+def empty_rollup():
+    return {"total_min": 0, "sessoes": 0, "dias": {}, "semanas": {}}
+
+def add_to_rollup(rollup, date_iso, minutes):
+    d = datetime.fromisoformat(date_iso)
+    iso = d.isocalendar()
+    day, week = d.date().isoformat(), f"{iso[0]}-S{iso[1]:02d}"
+    rollup["total_min"] += minutes
+    rollup["sessoes"] += 1
+    rollup["dias"][day] = rollup["dias"].get(day, 0) + minutes
+    rollup["semanas"][week] = rollup["semanas"].get(week, 0) + minutes
+
+def compact_rollup(rollup, today=None):
+    # Dias antigos já estão somados na semana correspondente: basta descartá-los
+    cutoff = ((today or datetime.now()) - timedelta(days=POMODORO_DAYS_KEPT)).date().isoformat()
+    for day in [d for d in rollup["dias"] if d < cutoff]:
+        del rollup["dias"][day]
+
+def migrate_pomodoro_sessions(progress):
+    # Migração única: a lista antiga "pomodoro_sessions" vira log + rollup
+    sessions = progress.pop("pomodoro_sessions", None)
+    if sessions is None:
+        return False
+    rollup = progress.setdefault("pomodoro_rollup", empty_rollup())
+    for sess in sessions:
+        add_to_rollup(rollup, sess["date"], sess["minutes"])
+    compact_rollup(rollup)
+    if WRITER is not None:
+        WRITER.append_sessions(sessions)
+    save_data(progress, ["pomodoro_sessions", "pomodoro_rollup"])
+    return True
 
 def save_pomodoro_session(minutes):
     if 'progress' not in st.session_state: st.session_state['progress'] = {}
-    if "pomodoro_sessions" not in st.session_state['progress']:
-        st.session_state['progress']["pomodoro_sessions"] = []
+    rollup = st.session_state['progress'].setdefault("pomodoro_rollup", empty_rollup())
+    base = copy.deepcopy(rollup)
 
     session_data = {
         "date": datetime.now().isoformat(),
         "minutes": minutes
     }
-    st.session_state['progress']["pomodoro_sessions"].append(session_data)
-    save_data(st.session_state['progress'])
+    add_to_rollup(rollup, session_data["date"], minutes)
+    compact_rollup(rollup)
+    get_aggregates()["foco_min"] += minutes
+    bump_progress_rev()
+    if WRITER is not None:
+        WRITER.append_sessions([session_data])
+    # Com a base, o save soma esta sessão ao rollup relido (merge_counters): duas
+    # sessões terminando juntas não se sobrescrevem
+    save_data(st.session_state['progress'], ["pomodoro_rollup"], {"pomodoro_rollup": base})
 
-# --- NOVA FUNÇÃO PLAY_SOUND ROBUSTA (BASE64) ---
+# --- NOVA FUNÇÃO PLAY_SOUND ROBUSTA ---
 def play_sound():
-    # 1. Recupera o áudio em formato texto (Base64)
-    audio_base64 = get_audio_base64(POMODORO_SETTINGS['som_url'])
-    
-    # 2. Injeta o áudio diretamente no HTML com autoplay
-    if audio_base64:
-        audio_html = f"""
-            <audio autoplay="true" style="display:none;">
-                <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-            </audio>
-        """
-        st.markdown(audio_html, unsafe_allow_html=True)
+    # 1 e 2. Som do alarme (arquivo local ou URL reserva)
+    src, mime = alarm_source()
+    if src:
+        st.audio(src, format=mime, autoplay=True)
 
     # 3. Feedback Visual Nativo (Toast + Balloons)
     st.balloons()
@@ -130,89 +356,1020 @@ def play_sound():
         }
     </script>
     """
-    components.html(js_notification, height=0)
+    st.html(js_notification, unsafe_allow_javascript=True)
 
 def sync_timer():
     st.session_state['pomo_running'] = False
+    st.session_state['pomo_deadline'] = None
     st.session_state['time_left'] = st.session_state['timer_input_value'] * 60
 
-# Inicializa o estado global
-if 'progress' not in st.session_state:
-    st.session_state['progress'] = load_data()
+# --- POMODORO SEM BLOQUEIO ---
+# O timer guarda só o instante de término (relógio de parede). A contagem é
+# desenhada no navegador e o servidor acorda uma única vez, no término, para
+# tocar o alarme e registrar a sessão.
+def pomodoro_remaining():
+    deadline = st.session_state.get('pomo_deadline')
+    if deadline is None:
+        return st.session_state['time_left']
+    return max(0, math.ceil(deadline - time.time()))
+
+def start_pomodoro():
+    if st.session_state.get('pomo_deadline') is None and st.session_state['time_left'] > 0:
+        st.session_state['pomo_deadline'] = time.time() + st.session_state['time_left']
+    st.session_state['pomo_running'] = True
+
+def pause_pomodoro():
+    st.session_state['time_left'] = pomodoro_remaining()
+    st.session_state['pomo_deadline'] = None
+    st.session_state['pomo_running'] = False
+
+def finish_pomodoro_if_due():
+    # Zera o deadline antes de disparar: alarme e registro acontecem uma vez só
+    deadline = st.session_state.get('pomo_deadline')
+    if deadline is None or time.time() < deadline:
+        return False
+    st.session_state['pomo_deadline'] = None
+    st.session_state['pomo_running'] = False
+    st.session_state['time_left'] = 0
+    return True
+
+def render_pomodoro_countdown(deadline, time_left, total_sec):
+    # O HTML só depende do deadline: igual em todo rerun enquanto o timer corre, então o
+    # navegador não remonta o elemento. O fim é calculado no navegador na primeira
+    # montagem (sem depender do relógio do servidor) e guardado por deadline no sessionStorage
+    st.html(f"""
+    <div style="font-family: 'Source Sans Pro', sans-serif; color: #31333F;">
+        <div style="font-size: 14px;">Tempo</div>
+        <div id="pomo-time" style="font-size: 36px; line-height: 1.4;"></div>
+        <div style="background: #f0f2f6; border-radius: 4px; height: 8px;">
+            <div id="pomo-bar" style="background: #ff4b4b; border-radius: 4px; height: 8px; width: 0%;"></div>
+        </div>
+    </div>
+    <script>
+        (() => {{
+            const key = 'pomo-end-{deadline:.3f}';
+            const end = Number(sessionStorage.getItem(key)) || Date.now() + {time_left * 1000};
+            sessionStorage.setItem(key, end);
+            const total = {total_sec * 1000};
+            const clock = document.getElementById('pomo-time'), bar = document.getElementById('pomo-bar');
+            function tick() {{
+                if (!clock.isConnected) return;  // pausado ou resetado: o elemento saiu da página
+                const left = Math.max(0, end - Date.now());
+                const s = Math.ceil(left / 1000);
+                clock.textContent = String(Math.floor(s / 60)).padStart(2, '0') + ':' + String(s % 60).padStart(2, '0');
+                bar.style.width = Math.min(100, 100 * (1 - left / total)) + '%';
+                if (left > 0) setTimeout(tick, 1000 - (left % 1000 || 1000) + 20);
+            }}
+            tick();
+        }})();
+    </script>
+    """, unsafe_allow_javascript=True)
 
 # --- DADOS DO EDITAL ---
-SYLLABUS = {
-    "Medicina": {
-        "1. Cuidados gerais": ["1.1 Nutrição", "1.2 Hidratação", "1.3 Prevenção câncer", "1.4 Prevenção aterosclerose"],
-        "2. Doenças cardiovasculares": ["2.1 Hipertensão arterial", "2.2 Insuficiência cardíaca", "2.3 Miocardiopatias",
-                                        "2.4 Valvulopatias", "2.5 Arritmias cardíacas", "2.6 Síndromes isquêmicas",
-                                        "2.7 Placa aterosclerótica", "2.8 Doença coronariana crônica",
-                                        "2.9 Doença arterial periférica", "2.10 Tromboembolismo venoso",
-                                        "2.11 Risco cardiovascular", "2.12 Prevenção CV", "2.13 ECG básico",
-                                        "2.14 Dor torácica", "2.15 Síncope"],
-        "3. Doenças pulmonares": ["3.1 Asma", "3.2 DPOC", "3.3 Embolia pulmonar", "3.4 Pneumonias"],
-        "4. Gastrointestinais": ["4.1 Úlcera péptica", "4.2 DRGE", "4.3 Doenças inflamatórias/parasitárias",
-                                 "4.4 Diarreia", "4.5 Colelitíase", "4.6 Pancreatite", "4.7 Hepatites virais",
-                                 "4.8 Insuficiência hepática", "4.9 Disabsorção"],
-        "5. Urgências Comuns": ["5.1 Tontura", "5.2 Rinossinusopatias", "5.3 Urticária", "5.4 Rinite", "5.5 Cefaleias"],
-        "6. Doenças Renais": ["6.1 IRA e IRC", "6.2 Glomerulonefrites", "6.3 Síndrome nefrótica", "6.4 Litíase",
-                              "6.5 Ácido-base"],
-        "7. Endócrinas": ["7.1 Diabetes", "7.2 Obesidade", "7.3 S. Metabólica", "7.4 Tireoide (Hipo/Hiper)",
-                          "7.5 Nódulos tireoidianos", "7.6 Suprarrenais", "7.7 Paratireoides"],
-        "8. Reumáticas": ["8.1 Artrite reumatoide", "8.2 Espondiloartropatias", "8.3 Colagenoses", "8.4 Gota"],
-        "9. Infectologia": ["9.1 AIDS", "9.2 Endocardite", "9.3 Estafilocócicas", "9.4 Endemias nacionais",
-                            "9.5 Candidíase", "9.6 DSTs", "9.7 Herpes", "9.8 Antibióticos"],
-        "10. Exames": ["10.1 Invasivos e não invasivos"],
-        "11. Emergências": ["11.1 Vias aéreas", "11.2 RCP", "11.3 EAP", "11.4 Crise Hipertensiva", "11.5 HDA/HDB",
-                            "11.6 Choque", "11.7 Anafilaxia", "11.8 Intoxicações", "11.9 Convulsão", "11.10 AVE",
-                            "11.11 Consciência", "11.12 Glicemia"],
-        "12. Psiquiatria": ["12.1 Avaliação", "12.2 Ansiedade", "12.3 Depressão", "12.4 Psicose", "12.5 Bipolar",
-                            "12.6 Álcool/Drogas", "12.7 Somatoformes", "12.8 Emergências Psi", "12.9 Suicídio",
-                            "12.10 Psicofármacos", "12.11 Interações"],
-        "13. Saúde Trabalhador": ["13.1 Doenças profissionais", "13.2 Sofrimento psíquico", "13.3 Agentes físicos",
-                                  "13.4 Químicos", "13.5 Biológicos", "13.6 Ergonomia",
-                                  "13.7 Trabalho noturno e em turnos", "13.8 Acidentes", "13.9 Legislação"],
-        "14. Perícia": ["14.1 Conduta médico-pericial"],
-        "15. Documentos Legais": ["15.1 Atestados/Laudos", "15.2 Licenças", "15.3 Bases legais"],
-        "16. Conceitos Clínicos": ["16.1 Fundamentos"],
-        "17. Ética": ["17.1 Ética e Bioética"],
-        "18. Epidemiologia": ["18.1 Fisiopatologia geral"]
-    },
-    "Conhecimentos Gerais": {
-        "1. Língua Portuguesa": ["1.1 Interpretação", "1.2 Tipos textuais", "1.3 Ortografia", "1.4 Coesão", 
-                                 "1.5 Tempos verbais", "1.6 Morfossintaxe", "1.7 Pontuação", "1.8 Concordância",
-                                 "1.9 Crase", "1.10 Pronomes", "1.11 Reescrita"],
-        "2. Língua Inglesa": ["2.1 Compreensão textos", "2.2 Vocabulário", "2.3 Gramática semântica", "2.4 Inglês contemporâneo"],
-        "3. Controle Externo": ["3.1 Tipos de controle", "3.2 Tribunais de Contas", "3.3 Improbidade (8.429)",
-                                "3.4 Controle jurisdicional", "3.5 Controle financeiro", "3.6 Regimento TCE/RN", "3.7 Lei Orgânica TCE/RN"],
-        "4. Informática": ["4.1 Cultura digital/BNCC", "4.2 Pensamento computacional", "4.3 Office", "4.4 Redes/Protocolos",
-                           "4.5 Colaboração", "4.6 Segurança", "4.7 LGPD", "4.8 Gov Digital", "4.9 Sistemas públicos",
-                           "4.10 IA/Big Data", "4.11 Fake news"],
-        "5. Raciocínio Lógico": ["5.1 Estruturas lógicas", "5.2 Proposições", "5.3 De Morgan", "5.4 Lógica 1ª ordem",
-                                 "5.5 Contagem/Probabilidade", "5.6 Conjuntos", "5.7 Problemas matriciais"],
-        "6. Constitucional": ["6.1 Normas constitucionais", "6.2 Direitos fundamentais", "6.3 Organização do Estado",
-                              "6.4 Poderes", "6.5 Fiscalização", "6.6 Funções essenciais"],
-        "7. Administrativo": ["7.1 Organização adm.", "7.2 Atos adm.", "7.3 Agentes públicos", "7.4 Poderes",
-                              "7.5 Licitação", "7.6 Controle", "7.7 Resp. Civil"],
-        "8. AFO": ["8.1 Orçamento Público", "8.2 Ciclo orçamentário", "8.3 PPA/LDO/LOA", "8.4 Classificações",
-                   "8.5 Execução financeira", "8.6 Receita/Despesa", "8.7 LRF", "8.8 Lei 4.320"]
+# Cada edital é um arquivo versionado em editais/ (JSON; YAML se o PyYAML estiver
+# instalado): {"id", "nome", "versao", "prefixo", "materias": [{"nome", "topicos":
+# [{"nome", "subtopicos": ["nome" | {"nome", "id"}]}]}]}. Com o mesmo "id" em dois
+# arquivos vale a maior versão. "prefixo" vai na frente das chaves de progresso
+# (padrão "<id>:"); o edital original usa "" e mantém as chaves de sempre.
+EDITAIS_DIR = get_setting("editais_dir", "ESTUDAMED_EDITAIS_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "editais"))
+SUBTOPIC_ID_RE = re.compile(r"^[0-9a-z]{1,13}$")  # vai para a planilha como "#<id>"
+
+def read_edital_file(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"{path}: instale o PyYAML para usar editais em YAML") from None
+        try:
+            return yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            # Mesmo tipo de erro do JSON inválido: a página mostra o erro em vez de quebrar
+            raise ValueError(f"{path}: YAML inválido ({e})") from None
+
+def validate_edital(raw, source):
+    # Confere o tipo de cada nível: qualquer problema sai como ValueError
+    def fail(msg):
+        raise ValueError(f"Edital inválido ({source}): {msg}")
+
+    def nonempty_list(value, msg):
+        if not isinstance(value, list) or not value:
+            fail(msg)
+        return value
+
+    def names(items, where, allow_str=False):
+        seen = set()
+        for item in items:
+            if isinstance(item, dict):
+                nome = item.get("nome")
+            elif isinstance(item, str) and allow_str:
+                nome = item
+            else:
+                fail(f"item inválido em {where}: {item!r}")
+            if not isinstance(nome, str) or not nome.strip():
+                fail(f"nome vazio ou inválido em {where}")
+            if nome in seen:
+                fail(f"{nome!r} repetido em {where}")
+            seen.add(nome)
+
+    if not isinstance(raw, dict):
+        fail("o arquivo deve conter um objeto")
+    if not isinstance(raw.get("id"), str) or not re.fullmatch(r"[a-z0-9_-]+", raw["id"]):
+        fail('"id" deve ser texto em minúsculas (a-z, 0-9, _ e -)')
+    versao = raw.get("versao")
+    if not isinstance(raw.get("nome"), str) or not isinstance(versao, int) or isinstance(versao, bool):
+        fail('"nome" (texto) e "versao" (inteiro) são obrigatórios')
+    if not isinstance(raw.get("prefixo", ""), str):
+        fail('"prefixo" deve ser texto')
+    materias = nonempty_list(raw.get("materias"), '"materias" deve ser uma lista não vazia')
+    names(materias, "materias")
+    for m in materias:
+        topicos = nonempty_list(m.get("topicos"), f"matéria {m['nome']!r} sem tópicos")
+        names(topicos, f"tópicos de {m['nome']!r}")
+        for t in topicos:
+            subtopicos = nonempty_list(t.get("subtopicos"), f"tópico {t['nome']!r} sem subtópicos")
+            names(subtopicos, f"subtópicos de {t['nome']!r}", allow_str=True)
+            for sub in subtopicos:
+                if not isinstance(sub, dict) or "id" not in sub:
+                    continue
+                sid = sub["id"]
+                if not isinstance(sid, (str, int)) or isinstance(sid, bool) or not SUBTOPIC_ID_RE.match(str(sid)):
+                    fail(f"id {sid!r} de {sub['nome']!r}: use de 1 a 13 caracteres a-z/0-9")
+    return raw
+
+def load_editais(path):
+    editais = {}
+    for name in sorted(os.listdir(path)):
+        if not name.endswith((".json", ".yaml", ".yml")):
+            continue
+        source = os.path.join(path, name)
+        raw = validate_edital(read_edital_file(source), source)
+        if raw["id"] not in editais or raw["versao"] > editais[raw["id"]]["versao"]:
+            editais[raw["id"]] = raw
+    if not editais:
+        raise ValueError(f"Nenhum edital encontrado em {path}")
+    # O edital com prefixo "" (chaves antigas) vem primeiro; os demais pelo nome
+    return sorted(editais.values(), key=lambda e: (e.get("prefixo", f"{e['id']}:") != "", e["nome"]))
+
+# --- ÍNDICE DO EDITAL & AGREGADOS ---
+# Os editais são compilados uma vez por processo num índice: chave -> subtópico
+# (matéria, tópico, posição, edital, id estável e o tópico pai), tópicos com a lista
+# e o total de subtópicos e cada edital com suas matérias e chaves. As páginas só
+# consultam a fatia do edital escolhido; os números do dashboard ficam em agregados
+# atualizados a cada gravação, em vez de varrer todo o progresso a cada rerun.
+def subtopic_key(materia, topico, subtopico):
+    return f"{materia}-{topico}-{subtopico}"
+
+@st.cache_resource
+def get_syllabus_index():
+    keys, ids, legacy_ids, topics, materias, editais = {}, {}, {}, {}, {}, {}
+    legacy_clashes = set()
+    for ed in load_editais(EDITAIS_DIR):
+        eid, prefixo = ed["id"], ed.get("prefixo", f"{ed['id']}:")
+        ed_keys = []
+        for m in ed["materias"]:
+            materias[(eid, m["nome"])] = []
+            for t in m["topicos"]:
+                tid = (eid, m["nome"], t["nome"])
+                materias[(eid, m["nome"])].append(tid)
+                t_keys = []
+                for pos, sub in enumerate(t["subtopicos"]):
+                    nome, sid = (sub, None) if isinstance(sub, str) else (sub["nome"], sub.get("id"))
+                    key = prefixo + subtopic_key(m["nome"], t["nome"], nome)
+                    if key in keys:
+                        raise ValueError(f"Subtópico repetido entre editais: {key!r}")
+                    # Sem id explícito: hash da chave. O crc32 das versões anteriores fica como
+                    # alias para ler as linhas antigas; crc repetido não aponta para ninguém
+                    if sid is None:
+                        sid = syllabus_id(key)
+                        old_sid = legacy_syllabus_id(key)
+                        if old_sid in legacy_ids:
+                            legacy_clashes.add(old_sid)
+                        legacy_ids[old_sid] = key
+                    sid = str(sid)
+                    if sid in ids:
+                        raise ValueError(f"IDs de subtópico repetidos: {ids[sid]!r} e {key!r}")
+                    ids[sid] = key
+                    keys[key] = {"materia": m["nome"], "topico": t["nome"], "subtopico": nome, "pos": pos,
+                                 "edital": eid, "id": sid, "parent": tid}
+                    t_keys.append(key)
+                topics[tid] = {"total": len(t_keys), "keys": t_keys}
+                ed_keys += t_keys
+        editais[eid] = {"nome": ed["nome"], "versao": ed["versao"],
+                        "materias": [m["nome"] for m in ed["materias"]], "keys": ed_keys}
+    for old_sid in legacy_clashes:
+        del legacy_ids[old_sid]
+    return {"keys": keys, "ids": ids, "legacy_ids": legacy_ids, "topics": topics, "materias": materias,
+            "editais": editais}
+
+def _entry_contrib(entry):
+    teoria = bool(entry.get("teoria"))
+    concluido = teoria and bool(entry.get("questoes")) and bool(entry.get("revisao"))
+    n_q = entry.get("num_questoes", 0)
+    iniciado = teoria or bool(entry.get("questoes")) or n_q > 0
+    return teoria, concluido, iniciado, n_q
+
+def _apply_entry(agg, info, old, new):
+    o_teoria, _, _, o_nq = _entry_contrib(old)
+    n_teoria, _, _, n_nq = _entry_contrib(new)
+    for bucket in (agg, agg["editais"][info["edital"]]):
+        bucket["teoria"] += n_teoria - o_teoria
+        bucket["questoes"] += n_nq - o_nq
+
+def build_aggregates(progress):
+    index = get_syllabus_index()
+    agg = {
+        "teoria": 0, "questoes": 0,
+        "total_subtopicos": len(index["keys"]),
+        "foco_min": progress.get("pomodoro_rollup", {}).get("total_min", 0),
+        "editais": {eid: {"teoria": 0, "questoes": 0, "total_subtopicos": len(ed["keys"])}
+                    for eid, ed in index["editais"].items()},
+    }
+    for key, entry in progress.items():
+        info = index["keys"].get(key)
+        if info is not None:
+            _apply_entry(agg, info, {}, entry)
+    return agg
+
+def get_aggregates():
+    if 'agg' not in st.session_state:
+        st.session_state['agg'] = build_aggregates(st.session_state['progress'])
+    return st.session_state['agg']
+
+def set_progress_entries(entries, history=True, extra=None):
+    # Aplica várias entradas e manda todas num único save_data
+    # history=False: não gera eventos (restauração de backup já traz o histórico)
+    # extra: outras chaves (fora do edital) gravadas no mesmo save, sem merge por campo
+    progress = st.session_state['progress']
+    index_keys = get_syllabus_index()["keys"]
+    agg = get_aggregates()
+    due_index = st.session_state.get('due_index')
+    bases = {key: progress.get(key, {}) for key in entries}
+    now = datetime.now()
+    events, touched = [], set()
+    progress.update(extra or {})  # antes dos eventos: um histórico restaurado recebe os novos por cima
+    for key, entry in entries.items():
+        info = index_keys.get(key)
+        if info is not None:
+            old = progress.get(key, {})
+            entry = entries[key] = apply_schedule(old, entry, now)
+            _apply_entry(agg, info, old, entry)
+            if due_index is not None:
+                due_index.schedule(key, entry_due(entry))
+            event = entry_event(key, old, entry, now) if history else None
+            if event is not None:
+                events.append(event)
+                done, was_done = _entry_contrib(entry)[1], _entry_contrib(old)[1]
+                touched.update(add_to_history(progress, event, info, done, done and not was_done, bases))
+        progress[key] = entry
+    bump_progress_rev()
+    keys = list(entries) + list(extra or {})
+    if events:
+        touched.update(compact_history(progress, bases=bases))
+        if WRITER is not None:
+            WRITER.append_events(events)
+        keys += sorted(touched)
+    for k in extra or {}:
+        bases.pop(k, None)  # valor restaurado (ex.: histórico de um backup) vale inteiro, sem soma
+    save_data(progress, keys, bases)
+
+def set_progress_entry(key, entry):
+    set_progress_entries({key: entry})
+
+# --- HISTÓRICO DE ESTUDO (LOG DE EVENTOS + ROLLUP) ---
+# Cada alteração no edital vira um evento compacto no log (só acrescenta) e é somada
+# na hora aos baldes do histórico: uma chave por semana ("hist_semana:2026-S07") e uma
+# com os meses. Gravar um evento reescreve só a semana atual; o histórico lê os baldes.
+# Os baldes vão com base: o save soma a diferença ao valor relido (merge_counters).
+HISTORY_WEEKS_DETAILED = 26  # semanas mais antigas guardam só os totais
+
+def week_label(d):
+    iso = d.isocalendar()
+    return f"{iso[0]}-S{iso[1]:02d}"
+
+def entry_event(key, old, new, now):
+    campos = [f for f, default in ENTRY_DEFAULTS.items() if old.get(f, default) != new.get(f, default)]
+    if old.get("proxima_revisao") and new.get("proxima_revisao") != old.get("proxima_revisao") and "revisao" not in campos:
+        campos.append("revisado")
+    if not campos:
+        return None
+    return {
+        "t": now.isoformat(timespec="seconds"), "k": key, "f": ",".join(campos),
+        "dq": int(new.get("num_questoes") or 0) - int(old.get("num_questoes") or 0),
+    }
+
+def counter_base(progress, bases, key):
+    # Valor antes da primeira alteração desta interação: o save soma só a diferença
+    if bases is not None and key not in bases:
+        bases[key] = copy.deepcopy(progress.get(key, {}))
+
+def add_to_history(progress, event, info, concluido, concluiu, bases=None):
+    # Devolve as chaves do progresso que mudaram (bases: ver counter_base)
+    d = datetime.fromisoformat(event["t"])
+    week_key = HISTORY_WEEK_PREFIX + week_label(d)
+    counter_base(progress, bases, week_key)
+    counter_base(progress, bases, HISTORY_MONTHS_KEY)
+    week = progress.setdefault(week_key, {"n": 0, "q": 0, "materias": {}, "itens": {}})
+    week["n"] += 1
+    week["q"] += event["dq"]
+    week["materias"][info["materia"]] = week["materias"].get(info["materia"], 0) + 1
+    if "itens" in week:
+        item = week["itens"].setdefault(event["k"], {"q": 0, "ok": False})
+        item["q"] += event["dq"]
+        item["ok"] = concluido
+    month = progress.setdefault(HISTORY_MONTHS_KEY, {}).setdefault(d.strftime("%Y-%m"), {"n": 0, "q": 0, "concluidos": 0})
+    month["n"] += 1
+    month["q"] += event["dq"]
+    month["concluidos"] += int(concluiu)
+    return [week_key, HISTORY_MONTHS_KEY]
+
+def compact_history(progress, today=None, bases=None):
+    cutoff = HISTORY_WEEK_PREFIX + week_label((today or datetime.now()) - timedelta(weeks=HISTORY_WEEKS_DETAILED))
+    changed = []
+    for key, week in progress.items():
+        if key.startswith(HISTORY_WEEK_PREFIX) and key < cutoff and "itens" in week:
+            counter_base(progress, bases, key)
+            del week["itens"]
+            changed.append(key)
+    return changed
+
+def migrate_history(progress):
+    # Migração única: semeia os baldes com o last_modified atual de cada subtópico
+    # (o que o histórico antigo mostrava); daqui em diante só entram eventos reais
+    if HISTORY_MONTHS_KEY in progress:
+        return False
+    touched = {HISTORY_MONTHS_KEY}
+    progress[HISTORY_MONTHS_KEY] = {}
+    index_keys = get_syllabus_index()["keys"]
+    for key, entry in list(progress.items()):
+        info = index_keys.get(key)
+        if info is None or not isinstance(entry, dict) or not entry.get("last_modified"):
+            continue
+        _, concluido, iniciado, n_q = _entry_contrib(entry)
+        if not (iniciado or entry.get("revisao")):
+            continue
+        try:
+            t = datetime.fromisoformat(entry["last_modified"]).isoformat(timespec="seconds")
+        except ValueError:
+            continue
+        touched.update(add_to_history(progress, {"t": t, "k": key, "f": "", "dq": int(n_q or 0)}, info, concluido, concluido))
+    compact_history(progress)
+    bump_progress_rev()
+    save_data(progress, sorted(touched))
+    return True
+
+# --- REVISÃO ESPAÇADA (SM-2) ---
+# Cada subtópico estudado guarda a própria agenda (proxima_revisao, intervalo,
+# ease, repeticoes). A dificuldade marcada vira a nota de qualidade do SM-2.
+# Não há nota de reprovação (q < 3): a dificuldade é do assunto, não um "errei"
+# nesta revisão; se "Difícil" zerasse a agenda, o tópico voltaria todo dia para
+# sempre. Difícil (3) só encolhe o ease, e o intervalo cresce mais devagar.
+SM2_QUALITY = {"🟢 Fácil": 5, "🟡 Médio": 4, "🔴 Difícil": 3, "Não avaliado": 4}
+SM2_EASE_INICIAL = 2.5
+SM2_EASE_MINIMO = 1.3
+
+def sm2_review(entry, now):
+    q = SM2_QUALITY.get(entry.get("dificuldade"), 4)
+    ease = entry.get("ease", SM2_EASE_INICIAL)
+    reps = entry.get("repeticoes", 0)
+    interval = entry.get("intervalo", 0)
+    interval = 1 if reps == 0 else 6 if reps == 1 else max(1, round(interval * ease))
+    reps += 1
+    ease = max(SM2_EASE_MINIMO, ease + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    return {
+        **entry, "revisao": True, "ease": round(ease, 2), "intervalo": interval, "repeticoes": reps,
+        "proxima_revisao": (now + timedelta(days=interval)).isoformat(timespec="seconds"),
+        "last_modified": now.isoformat(),
+    }
+
+def apply_schedule(old, new, now):
+    _, _, iniciado, _ = _entry_contrib(new)
+    if not (iniciado or new.get("revisao")):
+        return new
+    if "proxima_revisao" not in new:
+        # Primeiro estudo conta como a 1ª repetição: revisão no dia seguinte
+        return {**new, "ease": SM2_EASE_INICIAL, "intervalo": 1, "repeticoes": 1,
+                "proxima_revisao": (now + timedelta(days=1)).isoformat(timespec="seconds")}
+    if new.get("revisao") and not old.get("revisao") and new.get("proxima_revisao") == old.get("proxima_revisao"):
+        # Marcar "R" no edital também conta como revisão feita
+        return sm2_review(new, now)
+    return new
+
+def entry_due(entry):
+    if not entry:
+        return None
+    try:
+        if entry.get("proxima_revisao"):
+            return datetime.fromisoformat(entry["proxima_revisao"]).timestamp()
+        # Entradas de antes do agendador: revisão um dia depois da última alteração
+        if (_entry_contrib(entry)[2] or entry.get("revisao")) and entry.get("last_modified"):
+            return (datetime.fromisoformat(entry["last_modified"]) + timedelta(days=1)).timestamp()
+    except (TypeError, ValueError):
+        pass
+    return None
+
+class DueIndex:
+    # Heap de (vencimento, chave) com remoção preguiçosa: reagendar é um push O(log n),
+    # e "o que vence até X" só visita os itens vencidos (mais as entradas obsoletas).
+    def __init__(self, progress, keys):
+        self.due = {}
+        for key in keys:
+            due = entry_due(progress.get(key))
+            if due is not None:
+                self.due[key] = due
+        self.heap = [(due, key) for key, due in self.due.items()]
+        heapq.heapify(self.heap)
+
+    def schedule(self, key, due):
+        if self.due.get(key) == due:
+            return
+        if due is None:
+            self.due.pop(key, None)
+        else:
+            self.due[key] = due
+            heapq.heappush(self.heap, (due, key))
+        if len(self.heap) > 2 * len(self.due) + 64:
+            self.heap = [(d, k) for k, d in self.due.items()]
+            heapq.heapify(self.heap)
+
+    def due_until(self, limit):
+        found, seen = [], set()
+        while self.heap and self.heap[0][0] <= limit:
+            due, key = heapq.heappop(self.heap)
+            if self.due.get(key) == due and key not in seen:
+                found.append((due, key))
+                seen.add(key)
+        for item in found:
+            heapq.heappush(self.heap, item)
+        return found
+
+def get_due_index():
+    if 'due_index' not in st.session_state:
+        st.session_state['due_index'] = DueIndex(st.session_state['progress'], get_syllabus_index()["keys"])
+    return st.session_state['due_index']
+
+def review_due(now, edital):
+    import pandas as pd
+    # Vencidas até o fim do dia de hoje, das mais atrasadas para as mais recentes
+    end_of_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()).timestamp()
+    index_keys = get_syllabus_index()["keys"]
+    progress = st.session_state['progress']
+    rows = []
+    for due, key in get_due_index().due_until(end_of_day):
+        info = index_keys[key]
+        if info["edital"] != edital:
+            continue
+        entry = progress.get(key, {})
+        rows.append({
+            "key": key, "Tópico": info["subtopico"], "Matéria": info["materia"],
+            "Atraso (dias)": max(0, (now - datetime.fromtimestamp(due)).days),
+            "Dificuldade": entry.get("dificuldade", "Não avaliado"),
+            "Intervalo": entry.get("intervalo", 0),
+        })
+    return pd.DataFrame(rows, columns=["key", "Tópico", "Matéria", "Atraso (dias)", "Dificuldade", "Intervalo"])
+
+def review_subtopics(keys):
+    # Todas as revisões marcadas vão num único save_data
+    progress, now = st.session_state['progress'], datetime.now()
+    set_progress_entries({key: sm2_review(progress.get(key, {}), now) for key in keys})
+
+def render_review_list(items):
+    version = st.session_state.get('review_version', 0)
+    with st.form("review_form"):
+        edited = st.data_editor(
+            items.assign(revisei=False),
+            key=f"review_{version}",
+            hide_index=True,
+            disabled=["Tópico", "Matéria", "Atraso (dias)", "Dificuldade", "Intervalo"],
+            column_order=["revisei", "Tópico", "Matéria", "Atraso (dias)", "Dificuldade", "Intervalo"],
+            column_config={"revisei": st.column_config.CheckboxColumn("✅ Revisei")},
+        )
+        submitted = st.form_submit_button("💾 Registrar revisões", type="primary")
+
+    if submitted:
+        keys = edited.loc[edited["revisei"], "key"].tolist()
+        if keys:
+            review_subtopics(keys)
+            st.session_state['review_version'] = version + 1
+            st.toast(f"✅ {len(keys)} revisão(ões) registradas. Próximas datas recalculadas.")
+            st.rerun()
+
+# --- MOTOR DE ANÁLISE (PANDAS) ---
+# O progresso vira um DataFrame tipado uma única vez por versão do conteúdo
+# (progress_rev muda a cada gravação); listas, gráficos e histórico saem de
+# groupby vetorizados e ficam no cache até a próxima alteração.
+def progress_rev():
+    if 'progress_rev' not in st.session_state:
+        st.session_state['progress_rev'] = uuid.uuid4().hex
+    return st.session_state['progress_rev']
+
+def bump_progress_rev():
+    st.session_state['progress_rev'] = uuid.uuid4().hex
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def progress_frame(rev, _progress, edital):
+    import pandas as pd
+    # Só a fatia do edital escolhido: o custo não cresce com os outros editais
+    index = get_syllabus_index()
+    ed = index["editais"][edital]
+    infos = [index["keys"][k] for k in ed["keys"]]
+    entries = [_progress.get(k) or {} for k in ed["keys"]]
+    topicos = list(dict.fromkeys(i["topico"] for i in infos))
+    return pd.DataFrame({
+        "key": ed["keys"],
+        "materia": pd.Categorical([i["materia"] for i in infos], categories=ed["materias"]),
+        "topico": pd.Categorical([i["topico"] for i in infos], categories=topicos),
+        "subtopico": [i["subtopico"] for i in infos],
+        "teoria": pd.array([bool(e.get("teoria")) for e in entries], dtype="bool"),
+        "questoes": pd.array([bool(e.get("questoes")) for e in entries], dtype="bool"),
+        "revisao": pd.array([bool(e.get("revisao")) for e in entries], dtype="bool"),
+        "num_questoes": pd.array([int(e.get("num_questoes") or 0) for e in entries], dtype="int64"),
+        "dificuldade": [e.get("dificuldade", "Não avaliado") for e in entries],
+    })
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def topic_overview(rev, _progress, edital):
+    df = progress_frame(rev, _progress, edital)
+    df = df.assign(
+        concluido=df["teoria"] & df["questoes"] & df["revisao"],
+        iniciado=df["teoria"] | df["questoes"] | (df["num_questoes"] > 0),
+    )
+    g = df.groupby(["materia", "topico"], observed=True, sort=False).agg(
+        total=("key", "size"), concluidos=("concluido", "sum"), iniciados=("iniciado", "sum")
+    ).reset_index()
+    labels = g["topico"].astype(str) + " (" + g["materia"].astype(str) + ")"
+    done = (g["concluidos"] == g["total"]) & (g["total"] > 0)
+    started = ~done & ((g["concluidos"] > 0) | (g["iniciados"] > 0))
+
+    chart = (df.groupby("materia", observed=False, sort=False)["num_questoes"].sum()
+               .rename_axis("Matéria").to_frame("Questões"))
+    return {
+        "finalizadas": labels[done].tolist(),
+        "em_andamento": labels[started].tolist(),
+        "faltando": labels[~done & ~started].tolist(),
+        "chart": chart,
     }
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def weekly_history(rev, _progress):
+    import pandas as pd
+    # Só lê os baldes já somados: custo proporcional ao número de semanas, não ao log
+    index_keys = get_syllabus_index()["keys"]
+    buckets = {k[len(HISTORY_WEEK_PREFIX):]: v for k, v in _progress.items() if k.startswith(HISTORY_WEEK_PREFIX)}
+    weeks = {}
+    for week_key, week in sorted(buckets.items(), reverse=True):
+        itens = week.get("itens")
+        rows = [{
+            "Matéria": index_keys[key]["materia"],
+            "Subtópico": index_keys[key]["subtopico"],
+            "Situação": "✅ Concluído" if item["ok"] else "🚧 Em Estudo",
+            "Questões": item["q"],
+        } for key, item in (itens or {}).items() if key in index_keys]
+        weeks[week_key] = {
+            "topicos": pd.DataFrame(rows, columns=["Matéria", "Subtópico", "Situação", "Questões"]),
+            "questoes": week["q"],
+            "materias": list(week["materias"]),
+            "eventos": week["n"],
+            "detalhado": itens is not None,
+        }
+    return weeks
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def monthly_trend(rev, _progress):
+    import pandas as pd
+    meses = _progress.get(HISTORY_MONTHS_KEY) or {}
+    return pd.DataFrame(
+        [(m, v["q"], v["n"], v["concluidos"]) for m, v in sorted(meses.items())],
+        columns=["Mês", "Questões", "Atividades", "Concluídos"],
+    ).set_index("Mês")
+
+# --- EDIÇÃO EM LOTE DO EDITAL ---
+BULK_COLUMNS = ["teoria", "questoes", "revisao", "num_questoes", "dificuldade", "notes"]
+
+def entry_state(status):
+    return (
+        status.get("teoria", False), status.get("questoes", False), status.get("revisao", False),
+        status.get("num_questoes", 0), status.get("dificuldade", "Não avaliado"), status.get("notes", "")
+    )
+
+def bulk_frame(edital, materia):
+    import pandas as pd
+    index = get_syllabus_index()
+    rows = []
+    for tid in index["materias"][(edital, materia)]:
+        for key in index["topics"][tid]["keys"]:
+            info = index["keys"][key]
+            rows.append((key, info["topico"], info["subtopico"], *entry_state(st.session_state['progress'].get(key, {}))))
+    return pd.DataFrame(rows, columns=["key", "topico", "subtopico", *BULK_COLUMNS]).set_index("key")
+
+def bulk_changes(original, edited):
+    # Diferença entre a tabela original e a editada -> {chave: entrada nova}
+    edited = edited.assign(
+        num_questoes=edited["num_questoes"].fillna(0).astype("int64"),
+        notes=edited["notes"].fillna(""),
+        dificuldade=edited["dificuldade"].fillna("Não avaliado"),
+    )
+    changed = (edited[BULK_COLUMNS] != original[BULK_COLUMNS]).any(axis=1)
+    now = datetime.now().isoformat()
+    entries = {}
+    for key, row in edited.loc[changed, BULK_COLUMNS].iterrows():
+        entries[key] = {
+            **st.session_state['progress'].get(key, {}),
+            "teoria": bool(row["teoria"]), "questoes": bool(row["questoes"]), "revisao": bool(row["revisao"]),
+            "num_questoes": int(row["num_questoes"]), "dificuldade": row["dificuldade"], "notes": row["notes"],
+            "last_modified": now,
+        }
+    return entries
+
+def render_bulk_editor(edital, materia):
+    original = bulk_frame(edital, materia)
+    version = st.session_state.get('bulk_version', 0)
+    with st.form(f"bulk_form_{edital}_{materia}"):
+        edited = st.data_editor(
+            original,
+            key=f"bulk_{edital}_{materia}_{version}",
+            hide_index=True,
+            disabled=["topico", "subtopico"],
+            height=600,
+            column_config={
+                "topico": st.column_config.TextColumn("Tópico"),
+                "subtopico": st.column_config.TextColumn("Subtópico"),
+                "teoria": st.column_config.CheckboxColumn("📖"),
+                "questoes": st.column_config.CheckboxColumn("✍️"),
+                "revisao": st.column_config.CheckboxColumn("🔄"),
+                "num_questoes": st.column_config.NumberColumn("Qtd.", min_value=0, step=1),
+                "dificuldade": st.column_config.SelectboxColumn("Dificuldade", options=DIFFICULTY_OPTIONS),
+                "notes": st.column_config.TextColumn("📝 Notas"),
+            },
+        )
+        submitted = st.form_submit_button("💾 Salvar alterações", type="primary")
+
+    if submitted:
+        entries = bulk_changes(original, edited)
+        if entries:
+            set_progress_entries(entries)
+            st.session_state['bulk_version'] = version + 1
+            st.toast(f"✅ {len(entries)} subtópico(s) salvos de uma vez.")
+            st.rerun()
+        else:
+            st.info("Nenhuma alteração para salvar.")
+
+# --- IMPORTAÇÃO / EXPORTAÇÃO ---
+# Exportação: as linhas são geradas sob demanda (no clique do download, fora do
+# rerun) e escritas em blocos num arquivo temporário; o Parquet sai em row groups.
+# Importação: o arquivo é lido em blocos, cada linha é validada contra o índice do
+# edital e só o resultado por chave fica em memória; tudo vai num único save_data.
+EXPORT_CHUNK_ROWS = 5000
+IMPORT_CHUNK_ROWS = 5000
+IMPORT_MAX_ERRORS = 20  # erros listados na tela (o total é sempre contado)
+SPOOL_MAX_BYTES = 8 * 1024 * 1024  # acima disso o arquivo temporário vai para o disco
+
+ENTRY_EXPORT_FIELDS = ["teoria", "questoes", "revisao", "num_questoes", "dificuldade", "notes",
+                       "last_modified", "ease", "intervalo", "repeticoes", "proxima_revisao"]
+EXPORT_DATASETS = {
+    # nome -> colunas (tipo pyarrow)
+    "progresso": [("chave", "string"), ("id", "string"), ("edital", "string"), ("materia", "string"),
+                  ("topico", "string"), ("subtopico", "string"), ("teoria", "bool"), ("questoes", "bool"),
+                  ("revisao", "bool"), ("num_questoes", "int64"), ("dificuldade", "string"), ("notes", "string"),
+                  ("last_modified", "string"), ("ease", "float64"), ("intervalo", "int64"),
+                  ("repeticoes", "int64"), ("proxima_revisao", "string"), ("valor_json", "string")],
+    "sessoes": [("data", "string"), ("minutos", "int64")],
+    "eventos": [("data", "string"), ("chave", "string"), ("campos", "string"), ("dq", "int64")],
+}
+EXPORT_LABELS = {"progresso": "Progresso (edital, cronograma e histórico)", "sessoes": "Sessões de Pomodoro",
+                 "eventos": "Log de eventos de estudo"}
+EXPORT_MIME = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def progress_export_rows(progress):
+    index_keys = get_syllabus_index()["keys"]
+    for key, value in list(progress.items()):
+        info = index_keys.get(key)
+        if info is not None and isinstance(value, dict) and set(value) <= set(ENTRY_EXPORT_FIELDS):
+            yield [key, info["id"], info["edital"], info["materia"], info["topico"], info["subtopico"],
+                   *(value.get(f) for f in ENTRY_EXPORT_FIELDS), None]
+        else:
+            # Chaves fora do edital (cronograma, histórico, rollups) vão inteiras em JSON
+            yield [key, *([None] * (len(ENTRY_EXPORT_FIELDS) + 5)), json.dumps(value, ensure_ascii=False)]
+
+def export_rows(dataset, progress):
+    if dataset == "progresso":
+        return progress_export_rows(progress)
+    if STORE is None:
+        return iter(())  # sem backend nada foi gravado: o arquivo sai só com o cabeçalho
+    if WRITER is not None:
+        WRITER.flush()  # o que ainda está na fila também entra no arquivo
+    if dataset == "sessoes":
+        return ([r["date"], r["minutes"]] for r in STORE.load_sessions())
+    return ([e["t"], e["k"], e["f"], e["dq"]] for e in STORE.load_events())
+
+def write_csv(columns, rows):
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow([name for name, _ in columns])
+    for chunk in chunked(rows, EXPORT_CHUNK_ROWS):
+        writer.writerows(chunk)
+    text.flush()
+    text.detach()
+    out.seek(0)
+    return out
+
+def write_parquet(columns, rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns])
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in chunked(rows, EXPORT_CHUNK_ROWS):
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array([row[i] for row in chunk], type=field.type) for i, field in enumerate(schema)],
+                schema=schema))
+    out.seek(0)
+    return out
+
+def export_file(dataset, fmt, progress):
+    with METRICS.span("export"):
+        columns, rows = EXPORT_DATASETS[dataset], export_rows(dataset, progress)
+        return write_parquet(columns, rows) if fmt == "parquet" else write_csv(columns, rows)
+
+def iter_import_rows(uploaded):
+    # -> dicionários linha a linha, lidos em blocos (nunca o arquivo inteiro de uma vez)
+    if uploaded.name.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(uploaded).iter_batches(batch_size=IMPORT_CHUNK_ROWS):
+            yield from batch.to_pylist()
+    else:
+        yield from csv.DictReader(io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline=""))
+
+def _parse_bool(v):
+    if isinstance(v, bool):
+        return v
+    text = str(v).strip().lower()
+    if text in ("1", "true", "sim", "s", "x", "verdadeiro"):
+        return True
+    if text in ("0", "false", "não", "nao", "n", "falso"):
+        return False
+    raise ValueError(f"valor lógico inválido: {v!r}")
+
+def _parse_finite(v):
+    # inf/nan passariam pelo float() e quebrariam depois (int(), codificação compacta)
+    f = float(v)
+    if not math.isfinite(f):
+        raise ValueError(f"número inválido: {v!r}")
+    return f
+
+def _parse_count(v):
+    f = _parse_finite(v)
+    if not f.is_integer():
+        raise ValueError(f"número inteiro esperado: {v!r}")  # 2.5 não vira 2 calado
+    n = int(f)
+    if n < 0:
+        raise ValueError(f"número negativo: {v!r}")
+    return n
+
+def _parse_ease(v):
+    ease = _parse_finite(v)
+    if ease < SM2_EASE_MINIMO:
+        raise ValueError(f"ease abaixo de {SM2_EASE_MINIMO}: {v!r}")
+    return ease
+
+def _parse_difficulty(v):
+    if v not in DIFFICULTY_OPTIONS:
+        raise ValueError(f"dificuldade desconhecida: {v!r}")
+    return v
+
+def _parse_datetime(v):
+    # Com fuso: convertida para o horário local sem fuso, como o app grava (datetime.now()),
+    # para comparar e ordenar junto com as demais datas
+    d = datetime.fromisoformat(str(v).strip())
+    if d.tzinfo is not None:
+        d = d.astimezone().replace(tzinfo=None)
+    return d.isoformat()
+
+IMPORT_PARSERS = {
+    "teoria": _parse_bool, "questoes": _parse_bool, "revisao": _parse_bool,
+    "num_questoes": _parse_count, "dificuldade": _parse_difficulty, "notes": str,
+    "last_modified": _parse_datetime, "ease": _parse_ease, "intervalo": _parse_count,
+    "repeticoes": _parse_count, "proxima_revisao": _parse_datetime,
 }
 
+# Chaves fora do edital aceitas na importação, cada uma conferida contra o formato que
+# o app grava (um valor em outro formato quebraria os agregados ou o cronograma)
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+WEEK_RE = re.compile(r"\d{4}-S\d{2}")
+MONTH_RE = re.compile(r"\d{4}-\d{2}")
+
+def _is_int(v):
+    return isinstance(v, int) and not isinstance(v, bool)
+
+def _check(ok, what):
+    if not ok:
+        raise ValueError(f"valor_json inválido: esperado {what}")
+
+def _check_int_map(value, key_re, what):
+    _check(isinstance(value, dict) and all(isinstance(k, str) and key_re.fullmatch(k) and _is_int(v)
+                                           for k, v in value.items()), what)
+
+def _check_crono(value):
+    _check(isinstance(value, dict) and set(value) <= set(CRONO_DAYS)
+           and all(isinstance(v, str) for v in value.values()), "{dia da semana: texto}")
+
+def _check_rollup(value):
+    _check(isinstance(value, dict) and set(value) == {"total_min", "sessoes", "dias", "semanas"}
+           and _is_int(value["total_min"]) and _is_int(value["sessoes"]), "{total_min, sessoes, dias, semanas}")
+    _check_int_map(value["dias"], DATE_RE, '"dias": {AAAA-MM-DD: minutos}')
+    _check_int_map(value["semanas"], WEEK_RE, '"semanas": {AAAA-Snn: minutos}')
+
+def _check_week(value):
+    _check(isinstance(value, dict) and {"n", "q", "materias"} <= set(value) <= {"n", "q", "materias", "itens"}
+           and _is_int(value["n"]) and _is_int(value["q"]), "{n, q, materias[, itens]}")
+    _check(isinstance(value["materias"], dict) and all(isinstance(k, str) and _is_int(v)
+                                                       for k, v in value["materias"].items()),
+           '"materias": {matéria: eventos}')
+    itens = value.get("itens", {})
+    _check(isinstance(itens, dict) and all(isinstance(i, dict) and set(i) == {"q", "ok"} and _is_int(i["q"])
+                                           and isinstance(i["ok"], bool) for i in itens.values()),
+           '"itens": {chave: {q, ok}}')
+
+def _check_months(value):
+    _check(isinstance(value, dict) and all(
+        isinstance(k, str) and MONTH_RE.fullmatch(k) and isinstance(m, dict)
+        and set(m) == {"n", "q", "concluidos"} and all(_is_int(x) for x in m.values())
+        for k, m in value.items()), "{AAAA-MM: {n, q, concluidos}}")
+
+IMPORT_RAW_CHECKS = {"crono_text": _check_crono, "pomodoro_rollup": _check_rollup, HISTORY_MONTHS_KEY: _check_months}
+
+def raw_key_check(key):
+    if key.startswith(HISTORY_WEEK_PREFIX) and WEEK_RE.fullmatch(key[len(HISTORY_WEEK_PREFIX):]):
+        return _check_week
+    return IMPORT_RAW_CHECKS.get(key)
+
+def parse_import_row(row, index):
+    # -> (chave, campos) de um subtópico ou (chave, valor) de uma chave fora do edital
+    key = str(row.get("chave") or "").strip()
+    if not key and row.get("id") not in (None, ""):
+        key = key_for_id(str(row["id"]).strip(), index)
+        if key is None:
+            raise ValueError(f"id {row['id']!r} não existe em nenhum edital")
+    if not key:
+        raise ValueError('sem "chave" nem "id"')
+    if key in index["keys"]:
+        fields = {}
+        for field, value in row.items():
+            parse = IMPORT_PARSERS.get(field)
+            if parse is None or value is None or value == "" or (isinstance(value, float) and math.isnan(value)):
+                continue  # coluna desconhecida ou célula vazia: o campo atual fica como está
+            fields[field] = parse(value)
+        return key, fields
+    check = raw_key_check(key)
+    if check is None:
+        raise ValueError(f"chave {key!r} desconhecida: nem subtópico de um edital, nem cronograma/histórico")
+    if row.get("valor_json") in (None, ""):
+        raise ValueError(f"chave {key!r} sem valor_json")
+    value = json.loads(row["valor_json"])
+    check(value)
+    return key, value
+
+def read_import(uploaded, somar):
+    # Memória limitada ao número de chaves distintas, não ao número de linhas
+    index = get_syllabus_index()
+    entries, raw, errors = {}, {}, []
+    n_rows = n_errors = 0
+    with METRICS.span("import_read"):
+        for n_rows, row in enumerate(iter_import_rows(uploaded), start=1):
+            try:
+                key, value = parse_import_row(row, index)
+            except (ValueError, TypeError, OverflowError) as e:
+                n_errors += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append(f"linha {n_rows}: {e}")
+                continue
+            if key not in index["keys"]:
+                raw[key] = value
+                continue
+            fields = entries.setdefault(key, {})
+            if somar and "num_questoes" in value:
+                value = {**value, "num_questoes": fields.get("num_questoes", 0) + value["num_questoes"]}
+            fields.update(value)
+    return {"entries": entries, "raw": raw, "linhas": n_rows, "erros": errors, "n_erros": n_errors}
+
+def apply_import(result, somar, history):
+    progress = st.session_state['progress']
+    now = datetime.now().isoformat()
+    entries = {}
+    for key, fields in result["entries"].items():
+        old = progress.get(key, {})
+        new = {**old, **fields}
+        if somar and "num_questoes" in fields:
+            new["num_questoes"] = int(old.get("num_questoes") or 0) + fields["num_questoes"]
+        if new != old:
+            if "last_modified" not in fields:
+                new["last_modified"] = now
+            entries[key] = new
+    if entries or result["raw"]:
+        set_progress_entries(entries, history=history, extra=result["raw"])
+        st.session_state.pop('agg', None)  # rollups restaurados (ex.: foco) entram no próximo cálculo
+    return len(entries), len(result["raw"])
+
+# Edital com erro para tudo antes de ler ou gravar qualquer progresso
+try:
+    get_syllabus_index()
+except (OSError, ValueError) as e:
+    st.error(f"❌ Não foi possível carregar os editais: {e}")
+    st.stop()
+
+# Widgets com chave guardam o próprio valor e ignoram o value= das próximas execuções:
+# com outro progresso carregado eles precisam nascer de novo a partir dele, senão a
+# comparação com o progresso grava os valores antigos por cima
+CRONO_DAYS = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
+PROGRESS_WIDGET_PREFIXES = ("nq", "diff_", "note_", "t", "q", "r")
+
+def reset_progress_widgets():
+    index_keys = get_syllabus_index()["keys"]
+    for name in list(st.session_state):
+        if (name.startswith("bulk_")
+                or (name.startswith("txt") and name[3:] in CRONO_DAYS)
+                or any(name.startswith(p) and name[len(p):] in index_keys for p in PROGRESS_WIDGET_PREFIXES)):
+            del st.session_state[name]
+
+# Inicializa o estado global
+if (st.session_state.get('aluno_carregado') != ALUNO
+        or (st.session_state.get('progress_source') == "snapshot" and STORE.ready())):
+    try:
+        st.session_state['progress'], st.session_state['progress_source'] = load_data()
+    except Exception as e:
+        # Sem os dados reais nada é mostrado nem gravado (evita sobrescrever o progresso)
+        st.session_state.pop('aluno_carregado', None)
+        st.error(f"❌ Não foi possível carregar seu progresso de {STORE.label} ({type(e).__name__}: {e}). "
+                 "Nada foi alterado — tente novamente em instantes.")
+        st.button("🔄 Tentar novamente")
+        st.stop()
+    # Outro aluno ou snapshot trocado pelos dados reais: os valores na tela eram de
+    # outro progresso (o que foi editado sobre o snapshot volta pelo diário)
+    reset_progress_widgets()
+    st.session_state['aluno_carregado'] = ALUNO
+    st.session_state.pop('agg', None)
+    st.session_state.pop('due_index', None)
+    st.session_state.pop('progress_rev', None)
+    if st.session_state['progress_source'] == "store":
+        migrate_pomodoro_sessions(st.session_state['progress'])
+
+# Migração única do histórico (depende do índice do edital); nunca sobre o snapshot
+if st.session_state['progress_source'] == "store":
+    migrate_history(st.session_state['progress'])
+
+@st.fragment(run_every=1.0)
+def wait_for_store():
+    # Enquanto o snapshot está na tela: troca pelos dados reais assim que chegarem
+    if STORE.ready():
+        st.rerun()
+    if STORE.prefetch_error:
+        st.warning(f"⚠️ Ainda sem conexão com {STORE.label} ({STORE.prefetch_error}). "
+                   "Mostrando a última cópia salva neste servidor; tentando de novo…")
+        STORE.prefetch()
+    else:
+        st.info(f"⏳ Conectando ao {STORE.label}… mostrando a última cópia salva neste servidor.")
+
 # --- INTERFACE ---
-st.title("👩‍⚕️ Planner CESAP")
+EDITAIS = get_syllabus_index()["editais"]
+if len(EDITAIS) > 1:
+    with st.sidebar:
+        EDITAL = st.selectbox("📚 Edital", list(EDITAIS), format_func=lambda e: EDITAIS[e]["nome"], key="edital")
+else:
+    EDITAL = next(iter(EDITAIS))
+
+st.title(f"👩‍⚕️ Planner {EDITAIS[EDITAL]['nome']}")
 st.markdown("---")
 
-if SHEET is None:
-    st.warning("⚠️ O aplicativo não está conectado ao Google Sheets. As alterações serão perdidas ao recarregar. Verifique o ID da planilha no código.")
+if st.session_state['progress_source'] == "snapshot":
+    wait_for_store()
+
+if STORE is None:
+    st.warning("⚠️ O aplicativo não está conectado ao Google Sheets. As alterações serão perdidas ao recarregar. Verifique o ID da planilha (spreadsheet_id) ou use storage_backend = \"sqlite\" nos secrets.")
 
 with st.sidebar:
     st.header("🌼 Menu")
-    page = st.radio("Selecione:", ["📊 Dashboard Analytics", "📝 Edital Vertical", "📅 Cronograma"])
+    pages = ["📊 Dashboard Analytics", "📝 Edital Vertical", "📅 Cronograma"]
+    pages.append("💾 Importar / Exportar")
+    if DIAGNOSTICS_ENABLED: pages.append("⚙️ Diagnóstico")
+    page = st.radio("Selecione:", pages, key="pagina")
     st.markdown("---")
 
     # --- POMODORO TIMER ---
     st.subheader("🍅 Pomodoro Timer")
+    _pomo_started = time.perf_counter()
     
     if 'pomo_running' not in st.session_state:
         st.session_state['pomo_running'] = False
@@ -230,44 +1387,47 @@ with st.sidebar:
     if 'time_left' not in st.session_state:
         st.session_state['time_left'] = minutes * 60
 
+    if 'pomo_deadline' not in st.session_state:
+        st.session_state['pomo_deadline'] = None
+
     col_p1, col_p2, col_p3 = st.columns(3)
     start_pomo = col_p1.button("▶️", help="Iniciar/Retomar")
     pause_pomo = col_p2.button("⏸️", help="Pausar")
     reset_pomo = col_p3.button("⏹️", help="Resetar")
     
-    if start_pomo: st.session_state['pomo_running'] = True
-    if pause_pomo: st.session_state['pomo_running'] = False
+    if start_pomo: start_pomodoro()
+    if pause_pomo: pause_pomodoro()
     if reset_pomo:
-        st.session_state['pomo_running'] = False
-        st.session_state['time_left'] = minutes * 60
+        sync_timer()
         st.rerun()
 
-    timer_placeholder = st.empty()
-    progress_bar = st.progress(0)
-    
-    mins, secs = divmod(st.session_state['time_left'], 60)
-    timer_placeholder.metric("Tempo", f"{mins:02d}:{secs:02d}")
-    
     total_sec_ref = minutes * 60
-    if total_sec_ref > 0:
-        curr_prog = 1 - (st.session_state['time_left'] / total_sec_ref)
-        progress_bar.progress(min(max(curr_prog, 0.0), 1.0))
-
-    if st.session_state['pomo_running']:
-        while st.session_state['time_left'] > 0:
-            if not st.session_state['pomo_running']: break
-            st.session_state['time_left'] -= 1
-            mins, secs = divmod(st.session_state['time_left'], 60)
-            timer_placeholder.metric("Tempo", f"{mins:02d}:{secs:02d}")
-            curr_prog = 1 - (st.session_state['time_left'] / total_sec_ref)
-            progress_bar.progress(min(max(curr_prog, 0.0), 1.0))
-            time.sleep(1)
-        
-        if st.session_state['time_left'] == 0 and st.session_state['pomo_running']:
-            st.session_state['pomo_running'] = False
-            # Chama a nova função robusta de áudio
-            play_sound()
-            save_pomodoro_session(minutes)
+
+    if finish_pomodoro_if_due():
+        # Chama a nova função robusta de áudio
+        play_sound()
+        save_pomodoro_session(minutes)
+
+    remaining = pomodoro_remaining()
+    if st.session_state['pomo_deadline'] is not None:
+        render_pomodoro_countdown(st.session_state['pomo_deadline'], st.session_state['time_left'], total_sec_ref)
+
+        # Acorda o script só no término; pausar/resetar causa um rerun e recalcula
+        @st.fragment(run_every=remaining + 0.5)
+        def pomodoro_watchdog():
+            METRICS.inc("pomodoro_watchdog_runs")
+            if st.session_state.get('pomo_deadline') is not None and time.time() >= st.session_state['pomo_deadline']:
+                st.rerun()
+
+        pomodoro_watchdog()
+    else:
+        mins, secs = divmod(remaining, 60)
+        st.metric("Tempo", f"{mins:02d}:{secs:02d}")
+        if total_sec_ref > 0:
+            curr_prog = 1 - (remaining / total_sec_ref)
+            st.progress(min(max(curr_prog, 0.0), 1.0))
+
+    METRICS.observe("pomodoro_render_seconds", time.perf_counter() - _pomo_started)
 
     # --- DICA DO POMODORO ---
     if 'first_load' not in st.session_state:
@@ -279,15 +1439,20 @@ with st.sidebar:
     # ----------------------------------------
 
     st.markdown("---")
-    st.info("💡 Dados sincronizados com Google Sheets.")
+    render_sync_status()
     
     confirm_delete = st.checkbox("Desbloquear exclusão de dados")
     if confirm_delete:
         if st.button("🗑️ APAGAR TUDO AGORA", type="primary"):
             st.session_state['progress'] = {}
+            st.session_state.pop('agg', None)
+            st.session_state.pop('due_index', None)
+            bump_progress_rev()
             save_data({})
+            if WRITER is not None: WRITER.clear_logs()
             if 'time_left' in st.session_state: del st.session_state['time_left']
             if 'pomo_running' in st.session_state: del st.session_state['pomo_running']
+            if 'pomo_deadline' in st.session_state: del st.session_state['pomo_deadline']
             st.success("Tudo limpo!")
             time.sleep(1.5)
             st.rerun()
@@ -296,259 +1461,301 @@ with st.sidebar:
 if page == "📊 Dashboard Analytics":
     st.header("📈 Seu Desempenho")
 
-    tab1, tab2, tab3 = st.tabs(["Visão Geral", "🧠 Revisão Inteligente", "📊 Gráficos Detalhados"])
-
-    total_topics = 0
-    done_teoria = 0
-    total_questoes_resolvidas = 0
-    chart_data = []
-    finalizadas, em_andamento, faltando, revisao_items = [], [], [], []
-
-    for mat_cat, topicos in SYLLABUS.items():
-        q_count_materia = 0
-        for nome_topico, subtopicos in topicos.items():
-            total_sub = len(subtopicos)
-            cont_sub_concluido = 0
-            grupo_iniciado = False
-
-            for s in subtopicos:
-                total_topics += 1
-                key = f"{mat_cat}-{nome_topico}-{s}"
-                st_data = st.session_state['progress'].get(key, {})
-
-                if st_data.get("teoria") and st_data.get("questoes") and st_data.get("revisao"):
-                    cont_sub_concluido += 1
-                if st_data.get("teoria"):
-                    done_teoria += 1
-                    grupo_iniciado = True
-
-                n_q = st_data.get("num_questoes", 0)
-                total_questoes_resolvidas += n_q
-                q_count_materia += n_q
-                
-                if st_data.get("questoes") or n_q > 0: grupo_iniciado = True
-
-                # Revisão
-                if st_data.get("last_modified"):
-                    try:
-                        last_mod = datetime.fromisoformat(st_data.get("last_modified"))
-                        days_diff = (datetime.now() - last_mod).days
-                        if days_diff in [1, 7, 30]:
-                            revisao_items.append({"Tópico": s, "Matéria": mat_cat, "Dias": days_diff})
-                    except: pass
-
-            label = f"{nome_topico} ({mat_cat})"
-            if cont_sub_concluido == total_sub and total_sub > 0: finalizadas.append(label)
-            elif cont_sub_concluido > 0 or grupo_iniciado: em_andamento.append(label)
-            else: faltando.append(label)
-        
-        chart_data.append({"Matéria": mat_cat, "Questões": q_count_materia})
+    # Abas preguiçosas: só a aba aberta é calculada (e só ela importa pandas)
+    tab1, tab2, tab3 = st.tabs(["Visão Geral", "🧠 Revisão Inteligente", "📊 Gráficos Detalhados"],
+                               key="dash_tab", on_change="rerun")
+
+    agg = get_aggregates()
+    agg_edital = agg["editais"][EDITAL]
+    total_topics = agg_edital["total_subtopicos"]
+    done_teoria = agg_edital["teoria"]
+    total_questoes_resolvidas = agg_edital["questoes"]
 
+    rev = progress_rev()
     perc_teoria = (done_teoria / total_topics * 100) if total_topics > 0 else 0
 
-    with tab1:
-        c1, c2, c3, c4 = st.columns(4)
-        c1.metric("📌 Progresso Teoria", f"{perc_teoria:.1f}%")
-        c2.metric("📖 Tópicos Lidos", f"{done_teoria}/{total_topics}")
-        c3.metric("✍️ Questões Totais", f"{total_questoes_resolvidas}")
+    if tab1.open:
+        with METRICS.span("dashboard_aggregation"):
+            overview = topic_overview(rev, st.session_state['progress'], EDITAL)
+        finalizadas, em_andamento, faltando = overview["finalizadas"], overview["em_andamento"], overview["faltando"]
+
+        with tab1:
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("📌 Progresso Teoria", f"{perc_teoria:.1f}%")
+            c2.metric("📖 Tópicos Lidos", f"{done_teoria}/{total_topics}")
+            c3.metric("✍️ Questões Totais", f"{total_questoes_resolvidas}")
         
-        total_minutes_pomo = sum([s['minutes'] for s in st.session_state['progress'].get("pomodoro_sessions", [])])
-        h, m = divmod(total_minutes_pomo, 60)
-        c4.metric("⏱️ Tempo de Foco", f"{int(h)}h {int(m)}m")
-
-        st.progress(perc_teoria / 100)
-
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.success(f"**Concluídas ({len(finalizadas)})**")
-            with st.container(height=300):
-                for item in finalizadas: st.write(f"✅ {item}")
-        with col2:
-            st.warning(f"**Em Andamento ({len(em_andamento)})**")
-            with st.container(height=300):
-                for item in em_andamento: st.write(f"🚧 {item}")
-        with col3:
-            st.error(f"**Não Tocadas ({len(faltando)})**")
-            with st.container(height=300):
-                for item in faltando: st.write(f"⏳ {item}")
-
-    with tab2:
-        if revisao_items:
-            st.table(pd.DataFrame(revisao_items))
-        else:
-            st.info("✅ Nenhuma revisão urgente pendente para hoje.")
+            total_minutes_pomo = agg["foco_min"]
+            h, m = divmod(total_minutes_pomo, 60)
+            iso_now = datetime.now().isocalendar()
+            foco_semana = st.session_state['progress'].get("pomodoro_rollup", {}).get("semanas", {}).get(
+                f"{iso_now[0]}-S{iso_now[1]:02d}", 0)
+            c4.metric("⏱️ Tempo de Foco", f"{int(h)}h {int(m)}m", help=f"{foco_semana} min nesta semana")
 
-        st.markdown("---")
-        with st.container():
-            st.markdown("### 🧠 Como funciona a Revisão Inteligente?")
-            st.markdown("""
-            Este sistema utiliza o conceito de **Repetição Espaçada**.
-            Intervalos críticos monitorados: **1 Dia**, **7 Dias** e **30 Dias**.
-            """)
+            st.progress(perc_teoria / 100)
 
-    with tab3:
-        if chart_data:
-            df_chart = pd.DataFrame(chart_data)
-            st.bar_chart(df_chart.set_index("Matéria"))
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.success(f"**Concluídas ({len(finalizadas)})**")
+                with st.container(height=300):
+                    for item in finalizadas: st.write(f"✅ {item}")
+            with col2:
+                st.warning(f"**Em Andamento ({len(em_andamento)})**")
+                with st.container(height=300):
+                    for item in em_andamento: st.write(f"🚧 {item}")
+            with col3:
+                st.error(f"**Não Tocadas ({len(faltando)})**")
+                with st.container(height=300):
+                    for item in faltando: st.write(f"⏳ {item}")
+
+    if tab2.open:
+        with METRICS.span("dashboard_aggregation"):
+            revisao_items = review_due(datetime.now(), EDITAL)
+
+        with tab2:
+            if not revisao_items.empty:
+                st.caption(f"{len(revisao_items)} revisão(ões) para hoje.")
+                render_review_list(revisao_items)
+            else:
+                st.info("✅ Nenhuma revisão urgente pendente para hoje.")
+
+            st.markdown("---")
+            with st.container():
+                st.markdown("### 🧠 Como funciona a Revisão Inteligente?")
+                st.markdown("""
+                Este sistema utiliza **Repetição Espaçada** (algoritmo SM-2).
+                Cada subtópico estudado entra na agenda com revisão no dia seguinte; a cada
+                revisão o intervalo cresce (1 → 6 → ~15 dias ...) conforme a **dificuldade**
+                marcada no edital. Revisões atrasadas continuam na lista até serem feitas.
+                """)
+
+    if tab3.open:
+        with tab3:
+            st.bar_chart(topic_overview(rev, st.session_state['progress'], EDITAL)["chart"])
 
 # --- EDITAL VERTICALIZADO ---
 elif page == "📝 Edital Vertical":
     st.header("📝 Edital Verticalizado")
-    mat_escolhida = st.selectbox("Escolha a Matéria:", list(SYLLABUS.keys()))
-
-    for topico, subtopicos in SYLLABUS[mat_escolhida].items():
-        with st.expander(f"📁 {topico}"):
-            h_cols = st.columns([2.5, 0.5, 0.5, 0.5, 0.8, 0.5])
-            h_cols[0].markdown("**Subtópico**")
-            h_cols[1].markdown("**📖**")
-            h_cols[2].markdown("**✍️**")
-            h_cols[3].markdown("**🔄**")
-            h_cols[4].markdown("**Qtd.**")
-            h_cols[5].markdown("**Det.**")
-
-            for s in subtopicos:
-                key = f"{mat_escolhida}-{topico}-{s}"
-                status = st.session_state['progress'].get(key, {})
-                cols = st.columns([2.5, 0.5, 0.5, 0.5, 0.8, 0.5])
-                
-                sub_icon = "✅" if status.get("teoria") and status.get("questoes") and status.get("revisao") else "🔹"
-                cols[0].write(f"{sub_icon} {s}")
-
-                t = cols[1].checkbox("T", value=status.get("teoria", False), key=f"t{key}", label_visibility="collapsed")
-                q = cols[2].checkbox("Q", value=status.get("questoes", False), key=f"q{key}", label_visibility="collapsed")
-                r = cols[3].checkbox("R", value=status.get("revisao", False), key=f"r{key}", label_visibility="collapsed")
-                n_q = cols[4].number_input("Nº", min_value=0, step=1, value=status.get("num_questoes", 0), key=f"nq{key}", label_visibility="collapsed")
-
-                with cols[5].popover("⚙️"):
-                    options_diff = ["Não avaliado", "🟢 Fácil", "🟡 Médio", "🔴 Difícil"]
-                    curr_diff = status.get("dificuldade", "Não avaliado")
-                    idx_diff = options_diff.index(curr_diff) if curr_diff in options_diff else 0
+    index = get_syllabus_index()
+    mat_escolhida = st.selectbox("Escolha a Matéria:", EDITAIS[EDITAL]["materias"])
+    bulk_mode = st.toggle("✏️ Edição em lote", help="Edite vários subtópicos numa tabela e salve tudo de uma vez")
+
+    if bulk_mode:
+        render_bulk_editor(EDITAL, mat_escolhida)
+    else:
+        for tid in index["materias"][(EDITAL, mat_escolhida)]:
+            topico, topic = tid[2], index["topics"][tid]
+            # O conteúdo só é montado quando o expander está aberto
+            exp = st.expander(f"📁 {topico} ({topic['total']})", key=f"exp_{mat_escolhida}_{topico}", on_change="rerun")
+            if not exp.open:
+                continue
+
+            with exp:
+                h_cols = st.columns([2.5, 0.5, 0.5, 0.5, 0.8, 0.5])
+                h_cols[0].markdown("**Subtópico**")
+                h_cols[1].markdown("**📖**")
+                h_cols[2].markdown("**✍️**")
+                h_cols[3].markdown("**🔄**")
+                h_cols[4].markdown("**Qtd.**")
+                h_cols[5].markdown("**Det.**")
+
+                for key in topic["keys"]:
+                    s = index["keys"][key]["subtopico"]
+                    status = st.session_state['progress'].get(key, {})
+                    cols = st.columns([2.5, 0.5, 0.5, 0.5, 0.8, 0.5])
                     
-                    new_diff = st.selectbox("Dificuldade:", options_diff, index=idx_diff, key=f"diff_{key}")
-                    st.markdown("**📝 Notas:**")
-                    new_note = st.text_area("Anotações", value=status.get("notes", ""), key=f"note_{key}", height=100)
-
-                current_state = (
-                    status.get("teoria"), status.get("questoes"), status.get("revisao"), 
-                    status.get("num_questoes"), status.get("dificuldade"), status.get("notes")
-                )
-                new_state = (t, q, r, n_q, new_diff, new_note)
-
-                if current_state != new_state:
-                    st.session_state['progress'][key] = {
-                        "teoria": t, "questoes": q, "revisao": r, "num_questoes": n_q,
-                        "dificuldade": new_diff, "notes": new_note,
-                        "last_modified": datetime.now().isoformat()
-                    }
-                    save_data(st.session_state['progress'])
-                    st.rerun()
+                    sub_icon = "✅" if status.get("teoria") and status.get("questoes") and status.get("revisao") else "🔹"
+                    cols[0].write(f"{sub_icon} {s}")
+
+                    t = cols[1].checkbox("T", value=status.get("teoria", False), key=f"t{key}", label_visibility="collapsed")
+                    q = cols[2].checkbox("Q", value=status.get("questoes", False), key=f"q{key}", label_visibility="collapsed")
+                    r = cols[3].checkbox("R", value=status.get("revisao", False), key=f"r{key}", label_visibility="collapsed")
+                    n_q = cols[4].number_input("Nº", min_value=0, step=1, value=status.get("num_questoes", 0), key=f"nq{key}", label_visibility="collapsed")
+
+                    with cols[5].popover("⚙️"):
+                        curr_diff = status.get("dificuldade", "Não avaliado")
+                        idx_diff = DIFFICULTY_OPTIONS.index(curr_diff) if curr_diff in DIFFICULTY_OPTIONS else 0
+                        
+                        new_diff = st.selectbox("Dificuldade:", DIFFICULTY_OPTIONS, index=idx_diff, key=f"diff_{key}")
+                        st.markdown("**📝 Notas:**")
+                        new_note = st.text_area("Anotações", value=status.get("notes", ""), key=f"note_{key}", height=100)
+
+                    # Compara com os mesmos padrões dos widgets: abrir a página não grava nada
+                    current_state = entry_state(status)
+                    new_state = (t, q, r, n_q, new_diff, new_note)
+
+                    if current_state != new_state:
+                        set_progress_entry(key, {
+                            **status,
+                            "teoria": t, "questoes": q, "revisao": r, "num_questoes": n_q,
+                            "dificuldade": new_diff, "notes": new_note,
+                            "last_modified": datetime.now().isoformat()
+                        })
+                        st.rerun()
 
 # --- CRONOGRAMA ---
 elif page == "📅 Cronograma":
     st.header("📅 Planejamento Semanal")
     
-    tab_plan, tab_history = st.tabs(["📝 Planejamento", "📊 Histórico Semanal"])
+    tab_plan, tab_history = st.tabs(["📝 Planejamento", "📊 Histórico Semanal"], key="crono_tab", on_change="rerun")
     
-    with tab_plan:
-        days = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
-        crono_data = st.session_state['progress'].get("crono_text", {d: "" for d in days})
+    if tab_plan.open:
+        with tab_plan:
+            crono_data = st.session_state['progress'].get("crono_text", {d: "" for d in CRONO_DAYS})
         
-        c1, c2 = st.columns(2)
-        for i, d in enumerate(days):
-            with (c1 if i % 2 == 0 else c2):
-                txt = st.text_area(f"📌 {d}", value=crono_data.get(d, ""), key=f"txt{d}", height=120)
-                if txt != crono_data.get(d):
-                    crono_data[d] = txt
-                    st.session_state['progress']["crono_text"] = crono_data
-                    save_data(st.session_state['progress'])
+            c1, c2 = st.columns(2)
+            for i, d in enumerate(CRONO_DAYS):
+                with (c1 if i % 2 == 0 else c2):
+                    txt = st.text_area(f"📌 {d}", value=crono_data.get(d, ""), key=f"txt{d}", height=120)
+                    if txt != crono_data.get(d):
+                        base = dict(crono_data)
+                        crono_data[d] = txt
+                        st.session_state['progress']["crono_text"] = crono_data
+                        save_data(st.session_state['progress'], ["crono_text"], {"crono_text": base})
     
     # --- ÁREA DE HISTÓRICO ---
-    with tab_history:
-        st.subheader("📈 Histórico de Atividades Semanais")
-        
-        weekly_data = {}
+    if tab_history.open:
+        with tab_history:
+            st.subheader("📈 Histórico de Atividades Semanais")
         
-        for mat_cat, topicos in SYLLABUS.items():
-            for nome_topico, subtopicos in topicos.items():
-                for s in subtopicos:
-                    key = f"{mat_cat}-{nome_topico}-{s}"
-                    st_data = st.session_state['progress'].get(key, {})
-                    
-                    if st_data.get("last_modified"):
-                        has_progress = st_data.get("teoria") or st_data.get("questoes") or st_data.get("revisao") or st_data.get("num_questoes", 0) > 0
-                        
-                        if has_progress:
-                            try:
-                                last_mod = datetime.fromisoformat(st_data.get("last_modified"))
-                                week_num = last_mod.isocalendar()[1]
-                                year = last_mod.year
-                                week_key = f"{year}-S{week_num:02d}"
-                                
-                                if week_key not in weekly_data:
-                                    weekly_data[week_key] = {
-                                        "topicos": [],
-                                        "questoes": 0,
-                                        "materias": set()
-                                    }
-                                
-                                is_done = st_data.get("teoria") and st_data.get("questoes") and st_data.get("revisao")
-                                status_label = "✅ Concluído" if is_done else "🚧 Em Estudo"
-                                
-                                weekly_data[week_key]["topicos"].append({
-                                    "Matéria": mat_cat,
-                                    "Subtópico": s,
-                                    "Situação": status_label,
-                                    "Questões": st_data.get("num_questoes", 0)
-                                })
-                                
-                                weekly_data[week_key]["questoes"] += st_data.get("num_questoes", 0)
-                                weekly_data[week_key]["materias"].add(mat_cat)
-                                
-                            except:
-                                pass
+            with METRICS.span("weekly_history"):
+                weekly_data = weekly_history(progress_rev(), st.session_state['progress'])
+                trend = monthly_trend(progress_rev(), st.session_state['progress'])
         
-        if weekly_data:
-            sorted_weeks = sorted(weekly_data.items(), reverse=True)
+            if weekly_data:
+                sorted_weeks = list(weekly_data.items())
             
-            col1, col2, col3 = st.columns(3)
-            total_weeks = len(sorted_weeks)
-            total_questoes_hist = sum([w[1]["questoes"] for w in sorted_weeks])
-            media_questoes = total_questoes_hist / total_weeks if total_weeks > 0 else 0
+                col1, col2, col3 = st.columns(3)
+                total_weeks = len(sorted_weeks)
+                total_questoes_hist = sum([w[1]["questoes"] for w in sorted_weeks])
+                media_questoes = total_questoes_hist / total_weeks if total_weeks > 0 else 0
             
-            col1.metric("📅 Semanas Ativas", total_weeks)
-            col2.metric("✍️ Total de Questões", total_questoes_hist)
-            col3.metric("📊 Média Questões/Semana", f"{media_questoes:.1f}")
+                col1.metric("📅 Semanas Ativas", total_weeks)
+                col2.metric("✍️ Total de Questões", total_questoes_hist)
+                col3.metric("📊 Média Questões/Semana", f"{media_questoes:.1f}")
             
-            st.markdown("---")
+                if len(trend) > 1:
+                    st.markdown("##### 📆 Tendência mensal")
+                    st.bar_chart(trend[["Questões", "Concluídos"]])
+
+                st.markdown("---")
             
-            for week_key, week_info in sorted_weeks:
-                num_topicos = len(week_info["topicos"])
-                num_questoes = week_info["questoes"]
-                materias_str = ", ".join(week_info["materias"])
+                for week_key, week_info in sorted_weeks:
+                    num_topicos = len(week_info["topicos"])
+                    num_questoes = week_info["questoes"]
+                    materias_str = ", ".join(week_info["materias"])
+                    resumo = f"{num_topicos} tópicos ativos" if week_info["detalhado"] else f"{week_info['eventos']} atividades"
                 
-                with st.expander(
-                    f"📅 **Semana {week_key}** • {num_topicos} tópicos ativos",
-                    expanded=False
-                ):
-                    df_week = pd.DataFrame(week_info["topicos"])
+                    with st.expander(
+                        f"📅 **Semana {week_key}** • {resumo}",
+                        expanded=False
+                    ):
+                        if not week_info["detalhado"]:
+                            st.caption("Detalhe por subtópico compactado (semana antiga): restam só os totais.")
+                        df_week = week_info["topicos"]
                     
-                    st.dataframe(
-                        df_week,
-                        use_container_width=True,
-                        hide_index=True,
-                        column_config={
-                            "Situação": st.column_config.TextColumn(
-                                "Status",
-                                help="Se o tópico foi finalizado ou está em andamento",
-                                validate="^✅.*"
-                            ),
-                            "Questões": st.column_config.NumberColumn(
-                                "Questões Feitas",
-                                format="%d ✍️"
-                            )
-                        }
-                    )
+                        st.dataframe(
+                            df_week,
+                            use_container_width=True,
+                            hide_index=True,
+                            column_config={
+                                "Situação": st.column_config.TextColumn(
+                                    "Status",
+                                    help="Se o tópico foi finalizado ou está em andamento",
+                                    validate="^✅.*"
+                                ),
+                                "Questões": st.column_config.NumberColumn(
+                                    "Questões Feitas",
+                                    format="%d ✍️"
+                                )
+                            }
+                        )
                     
-                    st.caption(f"Disciplinas tocadas: {materias_str}")
-        else:
-            st.info("📭 Nenhum histórico ainda. Seus estudos aparecerão aqui organizados por semana assim que você marcar o progresso nos checkboxes!")
+                        st.caption(f"Disciplinas tocadas: {materias_str}")
+            else:
+                st.info("📭 Nenhum histórico ainda. Seus estudos aparecerão aqui organizados por semana assim que você marcar o progresso nos checkboxes!")
+
+# --- IMPORTAR / EXPORTAR ---
+elif page == "💾 Importar / Exportar":
+    st.header("💾 Importar / Exportar")
+
+    st.subheader("⬇️ Exportar")
+    c1, c2 = st.columns([2, 1])
+    dataset = c1.selectbox("Dados:", list(EXPORT_DATASETS), format_func=EXPORT_LABELS.get)
+    fmt = c2.radio("Formato:", ["csv", "parquet"], format_func=str.upper, horizontal=True)
+    progress = st.session_state['progress']
+    # O arquivo só é gerado no clique, numa thread separada do rerun
+    st.download_button(f"⬇️ Baixar {dataset}.{fmt}", lambda: export_file(dataset, fmt, progress),
+                       file_name=f"estudamed-{ALUNO or 'compartilhado'}-{dataset}.{fmt}", mime=EXPORT_MIME[fmt])
+
+    st.markdown("---")
+    st.subheader("⬆️ Importar progresso")
+    st.caption("Uma linha por subtópico com a coluna `chave` (ou o `id` estável) e os campos a alterar "
+               "(teoria, questoes, revisao, num_questoes, dificuldade, notes, ...). Células vazias mantêm o "
+               "valor atual. O arquivo de progresso exportado acima serve de backup e pode ser importado de volta.")
+    with st.form("import_form"):
+        uploaded = st.file_uploader("Arquivo CSV ou Parquet", type=["csv", "parquet"])
+        somar = st.checkbox("➕ Somar num_questoes ao valor atual (ex.: exportação de um banco de questões)")
+        history = st.checkbox("📈 Contar no histórico de estudo", value=True,
+                              help="Desmarque ao restaurar um backup: o histórico já vem no arquivo.")
+        ignorar_erros = st.checkbox("Importar as linhas válidas mesmo se houver linhas com erro")
+        submitted = st.form_submit_button("✅ Validar e importar", type="primary")
+
+    if submitted and uploaded is not None:
+        result = read_import(uploaded, somar)
+        if result["n_erros"]:
+            st.warning(f"⚠️ {result['n_erros']} de {result['linhas']} linha(s) com erro"
+                       + (" foram ignoradas." if ignorar_erros else ". Nada foi importado."))
+            st.code("\n".join(result["erros"]), language=None)
+        if not result["n_erros"] or ignorar_erros:
+            n_entries, n_raw = apply_import(result, somar, history)
+            st.success(f"✅ {result['linhas']} linha(s) lidas: {n_entries} subtópico(s) alterado(s) e "
+                       f"{n_raw} outra(s) chave(s) gravados numa única gravação.")
+
+# --- DIAGNÓSTICO (ADMIN) ---
+elif page == "⚙️ Diagnóstico":
+    st.header("⚙️ Diagnóstico")
+    import pandas as pd
+    snap = METRICS.snapshot()
+    st.caption(f"Métricas coletadas desde {snap['desde']} (registro compartilhado por todas as sessões do processo).")
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Backend", STORE.label if STORE is not None else "nenhum")
+    st.caption("📚 Editais carregados de " + EDITAIS_DIR + ": " + ", ".join(
+        f"{ed['nome']} v{ed['versao']} ({len(ed['keys'])} subtópicos)" for ed in EDITAIS.values()))
+    if WRITER is not None:
+        status = WRITER.status()
+        c2.metric("Gravações pendentes", status["pendentes"])
+        c3.metric("Atraso da fila", f"{status['atraso']:.1f}s")
+        if status["erro"]: st.error(f"Último erro: {status['erro']}")
+        if status["confirmado"] is not None:
+            st.caption(f"📓 Diário local ({JOURNAL_PATH}): backend confirmou até a sequência {status['confirmado']}.")
+        if status["descartados"]:
+            st.markdown("##### 🗑️ Fila morta (recusadas pelo backend)")
+            st.dataframe(pd.DataFrame(status["descartados"]), hide_index=True)
+            if WRITER.journal is not None:
+                st.caption(f"O conteúdo completo fica na tabela diario_morto de {JOURNAL_PATH}.")
+
+    if snap["summaries"]:
+        rows = []
+        for name, s in sorted(snap["summaries"].items()):
+            scale, unit = (1000, "ms") if name.endswith("_seconds") else (1, "")
+            rows.append({
+                "Métrica": name, "Unidade": unit, "Amostras": s["count"],
+                "Média": s["sum"] / s["count"] * scale, "Máx.": s["max"] * scale, "Última": s["last"] * scale,
+            })
+        st.dataframe(pd.DataFrame(rows), hide_index=True, column_config={
+            c: st.column_config.NumberColumn(format="%.2f") for c in ["Média", "Máx.", "Última"]
+        })
+    else:
+        st.info("Nenhuma medição ainda.")
+
+    if snap["counters"]:
+        st.dataframe(pd.DataFrame(sorted(snap["counters"].items()), columns=["Contador", "Valor"]), hide_index=True)
+
+    d1, d2 = st.columns(2)
+    d1.download_button("⬇️ Prometheus (.prom)", METRICS.to_prometheus(), file_name="estudamed.prom", mime="text/plain")
+    d2.download_button("⬇️ Log JSON (.jsonl)", METRICS.to_json_line() + "\n", file_name="estudamed-metrics.jsonl",
+                       mime="application/json")
+
+METRICS.observe("script_run_seconds", time.perf_counter() - _script_started)
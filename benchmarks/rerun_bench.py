@@ -0,0 +1,396 @@
+"""Benchmark de latência de rerun do appmed.py.
+
+Roda o app com o AppTest do Streamlit contra uma planilha falsa em memória
+(no lugar do gspread) e mede, para vários tamanhos de progresso:
+
+- cold start (primeira execução, incluindo o load_data);
+- rerun de cada página (Dashboard, Edital Vertical por matéria, Cronograma);
+- chamadas ao Sheets e bytes enviados por interação (incluindo a aba do log
+  de sessões de Pomodoro).
+
+Uso:
+    python benchmarks/rerun_bench.py                    # grava benchmarks/baseline.json
+    python benchmarks/rerun_bench.py --repeat 5 --output /tmp/bench.json
+    python benchmarks/rerun_bench.py --scenario vazio --scenario edital_completo
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import gspread
+import streamlit as st
+from oauth2client.service_account import ServiceAccountCredentials
+from streamlit.testing.v1 import AppTest
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "appmed.py"
+EDITAL_PATH = ROOT / "editais" / "cesap.json"
+DEFAULT_OUTPUT = Path(__file__).resolve().parent / "baseline.json"
+PAGES = ["📊 Dashboard Analytics", "📝 Edital Vertical", "📅 Cronograma"]
+DIFFICULTIES = ["Não avaliado", "🟢 Fácil", "🟡 Médio", "🔴 Difícil"]
+SETTLE_SECONDS = 1.0  # espera o write-behind gravar antes de contar as chamadas
+EXTRA_SESSIONS = 5    # sessões novas abertas no mesmo processo (mede o cache compartilhado)
+
+
+# --- PLANILHA FALSA ---
+class FakeWorksheet:
+    """Imita o pedaço do gspread.Worksheet que o app usa e conta o tráfego."""
+
+    def __init__(self, rows=None):
+        self.lock = threading.Lock()
+        self.cells = {}
+        self.row_count = 1000
+        for r, row in enumerate(rows or [], start=1):
+            for c, value in enumerate(row, start=1):
+                if value != "":
+                    self.cells[(r, c)] = value
+        self.row_count = max(self.row_count, len(rows or []))
+        self.reset_counters()
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def _count(self, sent=None, received=None):
+        self.calls += 1
+        if sent is not None:
+            self.bytes_sent += len(json.dumps(sent, ensure_ascii=False).encode("utf-8"))
+        if received is not None:
+            self.bytes_received += len(json.dumps(received, ensure_ascii=False).encode("utf-8"))
+
+    def get_all_values(self):
+        with self.lock:
+            if not self.cells:
+                values = []
+            else:
+                max_r = max(r for r, _ in self.cells)
+                max_c = max(c for _, c in self.cells)
+                values = [[self.cells.get((r, c), "") for c in range(1, max_c + 1)] for r in range(1, max_r + 1)]
+            self._count(received=values)
+            return values
+
+    def cell(self, row, col):
+        with self.lock:
+            value = self.cells.get((row, col), "")
+            self._count(received=value)
+            return mock.Mock(value=value)
+
+    def get(self, range_name):
+        # Só células únicas ("C1") — é o que o app lê para checar a versão
+        with self.lock:
+            col, row = ord(range_name[0]) - 64, int(range_name[1:])
+            value = self.cells.get((row, col), "")
+            values = [[value]] if value != "" else [[]]
+            self._count(received=values)
+            return values
+
+    def batch_update(self, data, **kwargs):
+        with self.lock:
+            self._count(sent=data)
+            for item in data:
+                start, _, _ = item["range"].partition(":")
+                col = ord(start[0]) - 64
+                row = int(start[1:])
+                for i, values in enumerate(item["values"]):
+                    for j, value in enumerate(values):
+                        if value == "":
+                            self.cells.pop((row + i, col + j), None)
+                        else:
+                            self.cells[(row + i, col + j)] = value
+            return {}
+
+    def update(self, *args, **kwargs):
+        values = kwargs.get("values")
+        range_name = kwargs.get("range_name")
+        for arg in args:
+            if isinstance(arg, str):
+                range_name = arg
+            else:
+                values = arg
+        return self.batch_update([{"range": range_name or "A1", "values": values}])
+
+    def add_rows(self, rows):
+        with self.lock:
+            self._count()
+            self.row_count += rows
+
+    def append_rows(self, values, **kwargs):
+        with self.lock:
+            self._count(sent=values)
+            start = max((r for r, _ in self.cells), default=0) + 1
+            for i, row in enumerate(values):
+                for j, value in enumerate(row):
+                    self.cells[(start + i, j + 1)] = str(value)
+            return {}
+
+    def batch_clear(self, ranges):
+        with self.lock:
+            self._count(sent=ranges)
+            for rng in ranges:
+                first_row = int(rng.split(":")[0][1:])
+                for cell in [c for c in self.cells if c[0] >= first_row]:
+                    del self.cells[cell]
+            return {}
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.sheet1 = worksheet
+        self.worksheets = {}
+        worksheet.spreadsheet = self
+
+    def worksheet(self, title):
+        if title not in self.worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        # As abas extras dividem os contadores com a principal
+        ws = self.worksheets[title] = FakeWorksheet()
+        ws.lock, ws.spreadsheet = self.sheet1.lock, self
+        ws._count = self.sheet1._count
+        return ws
+
+
+class FakeClient:
+    def __init__(self, worksheet):
+        self.spreadsheet = FakeSpreadsheet(worksheet)
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+    def open(self, title):
+        return self.spreadsheet
+
+
+# --- DADOS SINTÉTICOS ---
+def load_syllabus():
+    # Edital original (prefixo "" = chaves "matéria-tópico-subtópico"), no formato {matéria: {tópico: [subtópicos]}}
+    edital = json.loads(EDITAL_PATH.read_text(encoding="utf-8"))
+    return {m["nome"]: {t["nome"]: [s if isinstance(s, str) else s["nome"] for s in t["subtopicos"]]
+                        for t in m["topicos"]} for m in edital["materias"]}
+
+
+def syllabus_keys(syllabus):
+    return [f"{m}-{t}-{s}" for m, topicos in syllabus.items() for t, subs in topicos.items() for s in subs]
+
+
+def make_entry(rng, now, notes_len=0):
+    return {
+        "teoria": rng.random() < 0.8,
+        "questoes": rng.random() < 0.6,
+        "revisao": rng.random() < 0.4,
+        "num_questoes": rng.choice([0, 5, 10, 20, 40]),
+        "dificuldade": rng.choice(DIFFICULTIES),
+        "notes": "".join(rng.choice("abcdefghij ") for _ in range(notes_len)),
+        "last_modified": (now - timedelta(days=rng.randint(0, 720), minutes=rng.randint(0, 1440))).isoformat(),
+    }
+
+
+def make_sessions(rng, now, days, per_day):
+    return [
+        {"date": (now - timedelta(days=d, minutes=rng.randint(0, 600))).isoformat(), "minutes": rng.choice([25, 50])}
+        for d in range(days) for _ in range(per_day)
+    ]
+
+
+def build_scenarios(syllabus):
+    rng = random.Random(42)
+    now = datetime.now()
+    keys = syllabus_keys(syllabus)
+    crono = {d: "Revisar cardio + 40 questões" for d in
+             ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]}
+    full = {k: make_entry(rng, now) for k in keys}
+    return {
+        "vazio": {},
+        "edital_completo": {**full, "crono_text": crono, "pomodoro_sessions": make_sessions(rng, now, 30, 4)},
+        "pomodoro_3_anos": {**full, "crono_text": crono, "pomodoro_sessions": make_sessions(rng, now, 3 * 365, 6)},
+        "notas_longas": {k: make_entry(rng, now, notes_len=2000) for k in keys},
+    }
+
+
+def sheet_rows(progress):
+    # Mesmo layout do SheetsStore: cabeçalho + uma linha [chave, JSON] por chave
+    if not progress:
+        return []
+    return [["chave", "valor"]] + [[k, json.dumps(v, ensure_ascii=False)] for k, v in progress.items()]
+
+
+# --- EXECUÇÃO ---
+CURRENT = {"worksheet": None}  # planilha devolvida pelo gspread.authorize falso
+
+
+def new_app(worksheet, timeout):
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    CURRENT["worksheet"] = worksheet
+    # Snapshot e diário locais novos: um cenário não herda o estado do anterior
+    local = tempfile.mkdtemp(prefix="estudamed-local-")
+    os.environ["ESTUDAMED_SNAPSHOT_DIR"] = local
+    os.environ["ESTUDAMED_JOURNAL_PATH"] = os.path.join(local, "journal.db")
+    at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+    at.secrets["gcp_service_account"] = {"type": "service_account"}
+    return at
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def check(at, label):
+    if at.exception:
+        raise RuntimeError(f"{label}: {at.exception[0].message}")
+
+
+def measure_interaction(at, worksheet, action):
+    time.sleep(SETTLE_SECONDS)
+    worksheet.reset_counters()
+    ms = timed(action)
+    time.sleep(SETTLE_SECONDS)
+    return {"ms": round(ms, 2), "sheets_calls": worksheet.calls, "bytes_sent": worksheet.bytes_sent}
+
+
+def measure_new_sessions(worksheet, timeout):
+    # Sem limpar os caches: cada AppTest é um visitante novo no mesmo servidor
+    time.sleep(SETTLE_SECONDS)
+    worksheet.reset_counters()
+    for _ in range(EXTRA_SESSIONS):
+        at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        at.secrets["gcp_service_account"] = {"type": "service_account"}
+        at.run()
+        check(at, "new_session")
+    return {"sessions": EXTRA_SESSIONS, "sheets_calls": worksheet.calls, "bytes_received": worksheet.bytes_received}
+
+
+def open_all_topics(at, syllabus, materia):
+    for topico in syllabus[materia]:
+        at.session_state[f"exp_{materia}_{topico}"] = True
+
+
+def run_scenario(name, progress, syllabus, repeat, timeout):
+    rows = sheet_rows(progress)
+    result = {
+        "progress_keys": len(progress),
+        "payload_bytes": sum(len(v.encode("utf-8")) for _, v in rows[1:]),
+        "cold_start_ms": [],
+        "pages_ms": {},
+        "interactions": {},
+    }
+    pages = {}
+
+    for _ in range(repeat):
+        worksheet = FakeWorksheet(rows)
+        at = new_app(worksheet, timeout)
+        result["cold_start_ms"].append(timed(at.run))
+        check(at, f"{name}/cold_start")
+        result["cold_start_load"] = {"sheets_calls": worksheet.calls, "bytes_received": worksheet.bytes_received}
+        result["new_sessions_load"] = measure_new_sessions(worksheet, timeout)
+
+        at.sidebar.radio[0].set_value(PAGES[0]).run()
+        pages.setdefault("dashboard", []).append(timed(at.run))
+
+        at.sidebar.radio[0].set_value(PAGES[1]).run()
+        for materia in syllabus:
+            at.selectbox[0].set_value(materia).run()
+            pages.setdefault(f"edital/{materia}/fechado", []).append(timed(at.run))
+            open_all_topics(at, syllabus, materia)
+            pages.setdefault(f"edital/{materia}/aberto", []).append(timed(at.run))
+            check(at, f"{name}/edital/{materia}")
+
+        at.sidebar.radio[0].set_value(PAGES[2]).run()
+        pages.setdefault("cronograma_historico", []).append(timed(at.run))
+        check(at, f"{name}/cronograma")
+
+    # Interações (uma vez só: alteram o estado)
+    worksheet = FakeWorksheet(rows)
+    at = new_app(worksheet, timeout)
+    at.run()
+    materia = next(iter(syllabus))
+    topico, subtopicos = next(iter(syllabus[materia].items()))
+    key = f"{materia}-{topico}-{subtopicos[0]}"
+    at.sidebar.radio[0].set_value(PAGES[1]).run()
+    # O AppTest não guarda o estado dos expanders entre execuções: reabre a cada run
+    open_all_topics(at, syllabus, materia)
+    at.run()
+
+    def toggle_checkbox():
+        open_all_topics(at, syllabus, materia)
+        box = at.checkbox(key=f"t{key}")
+        box.uncheck() if box.value else box.check()
+        box.run()
+
+    result["interactions"]["edital_checkbox"] = measure_interaction(at, worksheet, toggle_checkbox)
+    check(at, f"{name}/edital_checkbox")
+
+    at.sidebar.radio[0].set_value(PAGES[2]).run()
+    result["interactions"]["cronograma_texto"] = measure_interaction(
+        at, worksheet, lambda: at.text_area[0].input(f"bench {time.time()}").run())
+
+    def finish_pomodoro():
+        at.sidebar.button[0].click().run()
+        at.session_state["pomo_deadline"] = time.time() - 1
+        at.run()
+
+    result["interactions"]["pomodoro_fim"] = measure_interaction(at, worksheet, finish_pomodoro)
+    check(at, f"{name}/pomodoro_fim")
+
+    result["cold_start_ms"] = summarize(result["cold_start_ms"])
+    result["pages_ms"] = {page: summarize(values) for page, values in pages.items()}
+    return result
+
+
+def summarize(values):
+    return {"mediana": round(statistics.median(values), 2), "min": round(min(values), 2), "max": round(max(values), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de rerun do appmed.py com dados sintéticos")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="arquivo JSON de saída")
+    parser.add_argument("--repeat", type=int, default=3, help="repetições por medida (usa a mediana)")
+    parser.add_argument("--scenario", action="append", help="roda só os cenários informados")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout do AppTest por execução (s)")
+    args = parser.parse_args()
+
+    os.environ["ESTUDAMED_STORAGE"] = "sheets"
+    syllabus = load_syllabus()
+    scenarios = build_scenarios(syllabus)
+    selected = args.scenario or list(scenarios)
+
+    report = {
+        "meta": {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "repeat": args.repeat,
+        },
+        "scenarios": {},
+    }
+    with mock.patch.object(ServiceAccountCredentials, "from_json_keyfile_dict", return_value=object()), \
+         mock.patch.object(gspread, "authorize", side_effect=lambda creds: FakeClient(CURRENT["worksheet"])):
+        # Aquecimento: o primeiro run paga os imports pesados do próprio processo
+        new_app(FakeWorksheet(), args.timeout).run()
+        for name in selected:
+            result = run_scenario(name, scenarios[name], syllabus, args.repeat, args.timeout)
+            report["scenarios"][name] = result
+            print(f"✔ {name}: cold start {result['cold_start_ms']['mediana']} ms", file=sys.stderr)
+
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"Baseline gravado em {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
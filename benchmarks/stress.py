@@ -0,0 +1,801 @@
+"""Teste de carga concorrente do appmed.py contra um Sheets falso local.
+
+Sobe um servidor HTTP local que imita o pedaço da API do Google Sheets (v4)
+usado pelo gspread e liga o app nele (o gspread de verdade faz as chamadas,
+só o host muda). O servidor tem latência, cotas por minuto (429) e falhas
+aleatórias (503) configuráveis. Em cima dele, várias sessões simultâneas (um
+AppTest por thread) percorrem as páginas do app:
+
+- rerun do Dashboard e do Cronograma;
+- Edital Vertical: abre o tópico e soma 1 questão num subtópico (chaves
+  próprias de cada sessão e, com --contencao, uma chave disputada por todas);
+- Pomodoro: inicia e, no passo seguinte, conclui a sessão de foco.
+
+Relatório: vazão (execuções do script por segundo), p50/p99 da latência de
+rerun (geral e por ação), atualizações perdidas (o que as sessões gravaram
+comparado ao que uma sessão nova lê do Sheets depois que o diário esvazia),
+sessões de Pomodoro perdidas no log e ocupação de threads (sessões, write-behind,
+carga em segundo plano, handlers do servidor) amostrada durante a carga.
+
+Uso:
+    python benchmarks/stress.py
+    python benchmarks/stress.py --sessions 16 --steps 30 --latency 0.2 --write-quota 60
+    python benchmarks/stress.py --fail-rate 0.05 --alunos 4 --output /tmp/stress.json
+"""
+import argparse
+import ast
+import contextlib
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import unquote, urlsplit
+
+import gspread
+import requests
+import streamlit as st
+from oauth2client.service_account import ServiceAccountCredentials
+from streamlit import logger as st_logger
+from streamlit.components.v2.component_manager import BidiComponentManager
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest, app_test
+from streamlit.testing.v1.util import patch_config_options
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import rerun_bench as rb  # noqa: E402
+
+SPREADSHEET_ID = "estudamed-stress"
+SHEETS_HOST = "https://sheets.googleapis.com"
+SHARED_SHEET = "Página1"  # sheet1: progresso compartilhado (aluno vazio)
+SESSION_LOG_SHEET = "pomodoro_log"  # mesma aba do app (+ "_<aluno>")
+DASHBOARD, EDITAL, CRONOGRAMA = rb.PAGES
+ACTIONS = {"dashboard": 3, "incremento": 4, "cronograma": 2, "pomodoro": 1}  # pesos do sorteio
+SAMPLE_SECONDS = 0.1
+
+
+# --- SHEETS FALSO (HTTP) ---
+A1_RE = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def col_number(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def col_letters(n):
+    s = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def split_range(name):
+    # "'aba'!A2:B" -> ("aba", "A2:B"); sem "!" é a aba inteira
+    if "!" in name:
+        title, a1 = name.rsplit("!", 1)
+    else:
+        title, a1 = name, ""
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title, a1
+
+
+def parse_a1(a1):
+    # -> (linha1, coluna1, linha2, coluna2); None = aberto (até o fim dos dados)
+    if not a1:
+        return 1, 1, None, None
+    start, _, end = a1.partition(":")
+    c1, r1 = A1_RE.match(start).groups()
+    if not end:
+        return int(r1 or 1), col_number(c1) if c1 else 1, int(r1) if r1 else None, col_number(c1) if c1 else None
+    c2, r2 = A1_RE.match(end).groups()
+    return int(r1 or 1), col_number(c1) if c1 else 1, int(r2) if r2 else None, col_number(c2) if c2 else None
+
+
+class FakeSheetsState:
+    """Planilha em memória: abas com células {(linha, coluna): texto}."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sheets = {}  # título -> {"id", "rows", "cols", "cells"}
+        self.next_id = 0
+
+    def add_sheet(self, title, rows=1000, cols=26, values=()):
+        sheet = {"id": self.next_id, "rows": max(rows, len(values)), "cols": cols, "cells": {}}
+        self.next_id += 1
+        self.sheets[title] = sheet
+        self._write(sheet, 1, 1, values)
+        return sheet
+
+    def properties(self, title):
+        sheet = self.sheets[title]
+        return {"sheetId": sheet["id"], "title": title, "index": list(self.sheets).index(title), "sheetType": "GRID",
+                "gridProperties": {"rowCount": sheet["rows"], "columnCount": sheet["cols"]}}
+
+    def metadata(self):
+        return {"spreadsheetId": SPREADSHEET_ID,
+                "properties": {"title": "EstudaMed", "locale": "pt_BR", "timeZone": "America/Sao_Paulo"},
+                "sheets": [{"properties": self.properties(t)} for t in self.sheets]}
+
+    def _sheet(self, name):
+        title, a1 = split_range(name)
+        if title not in self.sheets:
+            raise ApiFailure(400, f"Unable to parse range: {name}", "INVALID_ARGUMENT")
+        return title, self.sheets[title], parse_a1(a1)
+
+    @staticmethod
+    def _last_row(sheet):
+        return max((r for r, _ in sheet["cells"]), default=0)
+
+    @staticmethod
+    def _check(sheet, r1, c1, values):
+        if values and (r1 + len(values) - 1 > sheet["rows"] or c1 + max(map(len, values)) - 1 > sheet["cols"]):
+            raise ApiFailure(400, f"Range exceeds grid limits. Max rows: {sheet['rows']}, max columns: {sheet['cols']}",
+                             "INVALID_ARGUMENT")
+
+    def _write(self, sheet, r1, c1, values):
+        self._check(sheet, r1, c1, values)
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                text = "" if value is None else str(value)
+                if text:
+                    sheet["cells"][(r1 + i, c1 + j)] = text
+                else:
+                    sheet["cells"].pop((r1 + i, c1 + j), None)
+        return len(values)
+
+    def get_values(self, name):
+        title, sheet, (r1, c1, r2, c2) = self._sheet(name)
+        cells = sheet["cells"]
+        r2 = r2 or self._last_row(sheet)
+        c2 = c2 or max((c for _, c in cells), default=0)
+        values = []
+        for r in range(r1, r2 + 1):
+            row = [cells.get((r, c), "") for c in range(c1, c2 + 1)]
+            while row and row[-1] == "":
+                row.pop()
+            values.append(row)
+        while values and not values[-1]:
+            values.pop()
+        result = {"range": f"'{title}'!{col_letters(c1)}{r1}:{col_letters(max(c1, c2))}{max(r1, r2)}",
+                  "majorDimension": "ROWS"}
+        if values:
+            result["values"] = values
+        return result
+
+    def update_values(self, name, values):
+        title, sheet, (r1, c1, _, _) = self._sheet(name)
+        return self._write(sheet, r1, c1, values)
+
+    def batch_update_values(self, data):
+        # Como na API: um range inválido derruba o lote inteiro, sem gravar nada
+        targets = [(self._sheet(d["range"]), d.get("values", [])) for d in data]
+        for (_, sheet, (r1, c1, _, _)), values in targets:
+            self._check(sheet, r1, c1, values)
+        return {"spreadsheetId": SPREADSHEET_ID,
+                "totalUpdatedRows": sum(self._write(sheet, r1, c1, values) for (_, sheet, (r1, c1, _, _)), values in targets)}
+
+    def append_values(self, name, values):
+        title, sheet, (_, c1, _, _) = self._sheet(name)
+        start = self._last_row(sheet) + 1
+        sheet["rows"] = max(sheet["rows"], start + len(values) - 1)  # o append cria linhas
+        self._write(sheet, start, c1, values)
+        end = f"{col_letters(c1 + max(map(len, values), default=1) - 1)}{start + len(values) - 1}"
+        return {"spreadsheetId": SPREADSHEET_ID, "tableRange": f"'{title}'!A1",
+                "updates": {"spreadsheetId": SPREADSHEET_ID, "updatedRange": f"'{title}'!{col_letters(c1)}{start}:{end}",
+                            "updatedRows": len(values)}}
+
+    def clear_values(self, name):
+        title, sheet, (r1, c1, r2, c2) = self._sheet(name)
+        for r, c in list(sheet["cells"]):
+            if r >= r1 and c >= c1 and (r2 is None or r <= r2) and (c2 is None or c <= c2):
+                del sheet["cells"][(r, c)]
+
+    def batch_clear(self, ranges):
+        for name in ranges:
+            self.clear_values(name)
+        return {"spreadsheetId": SPREADSHEET_ID, "clearedRanges": ranges}
+
+    def batch_update(self, body):
+        replies = []
+        for request in body.get("requests", []):
+            if "addSheet" in request:
+                props = request["addSheet"]["properties"]
+                if props["title"] in self.sheets:
+                    raise ApiFailure(400, f"A sheet with the name \"{props['title']}\" already exists.",
+                                     "INVALID_ARGUMENT")
+                grid = props.get("gridProperties", {})
+                self.add_sheet(props["title"], grid.get("rowCount", 1000), grid.get("columnCount", 26))
+                replies.append({"addSheet": {"properties": self.properties(props["title"])}})
+            elif "updateSheetProperties" in request:
+                props = request["updateSheetProperties"]["properties"]
+                sheet = next(s for s in self.sheets.values() if s["id"] == props["sheetId"])
+                grid = props.get("gridProperties", {})
+                sheet["rows"] = grid.get("rowCount", sheet["rows"])
+                sheet["cols"] = grid.get("columnCount", sheet["cols"])
+                replies.append({})
+            else:
+                raise ApiFailure(400, f"Pedido não suportado pelo Sheets falso: {sorted(request)}", "INVALID_ARGUMENT")
+        return {"spreadsheetId": SPREADSHEET_ID, "replies": replies}
+
+
+class ApiFailure(Exception):
+    def __init__(self, code, message, status):
+        super().__init__(message)
+        self.code, self.status = code, status
+
+
+class Faults:
+    """Latência, cotas por minuto (janela deslizante) e falhas 503 aleatórias."""
+
+    def __init__(self, latency, jitter, read_quota, write_quota, fail_rate, seed):
+        self.latency, self.jitter, self.fail_rate = latency, jitter, fail_rate
+        self.quotas = {"read": read_quota, "write": write_quota}
+        self.windows = {"read": deque(), "write": deque()}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def disable(self):
+        with self.lock:
+            self.fail_rate = 0.0
+            self.quotas = {"read": 0, "write": 0}
+
+    def check(self, kind):
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            quota, window, now = self.quotas[kind], self.windows[kind], time.monotonic()
+            while window and now - window[0] > 60:
+                window.popleft()
+            if quota and len(window) >= quota:
+                failure = ApiFailure(429, f"Quota exceeded for quota metric '{kind.title()} requests' "
+                                          "and limit 'per minute per user'.", "RESOURCE_EXHAUSTED")
+            elif self.rng.random() < self.fail_rate:
+                failure = ApiFailure(503, "The service is currently unavailable.", "UNAVAILABLE")
+            else:
+                failure = None
+                window.append(now)
+        time.sleep(delay)
+        if failure is not None:
+            raise failure
+
+
+class FakeSheetsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state, faults):
+        super().__init__(("127.0.0.1", 0), FakeSheetsHandler)
+        self.state, self.faults = state, faults
+        self.stats_lock = threading.Lock()
+        self.requests = defaultdict(Counter)   # rota -> {status: n}
+        self.latencies = defaultdict(list)     # rota -> [ms]
+        self.writes_applied = 0
+        self.failures = Counter()              # (rota, status, mensagem) -> n
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def record(self, route, status, ms, message=None):
+        with self.stats_lock:
+            self.requests[route][status] += 1
+            self.latencies[route].append(ms)
+            if message is not None:
+                self.failures[(route, status, message)] += 1
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: o pool do requests reaproveita as conexões
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_api("GET")
+
+    def do_POST(self):
+        self.handle_api("POST")
+
+    def do_PUT(self):
+        self.handle_api("PUT")
+
+    def handle_api(self, method):
+        started = time.perf_counter()
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        route = "?"
+        try:
+            route, call = self.route(method, urlsplit(self.path).path, body)
+            self.server.faults.check("read" if method == "GET" else "write")
+            with self.server.state.lock:
+                result = call()
+            if method != "GET":
+                with self.server.stats_lock:
+                    self.server.writes_applied += 1
+            status = 200
+        except ApiFailure as e:
+            status = e.code
+            result = {"error": {"code": e.code, "message": str(e), "status": e.status}}
+        except Exception as e:  # bug do servidor falso: vira 500 visível no relatório
+            status = 500
+            result = {"error": {"code": 500, "message": f"{type(e).__name__}: {e}", "status": "INTERNAL"}}
+        payload = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.record(route, status, (time.perf_counter() - started) * 1000,
+                           result["error"]["message"] if status != 200 else None)
+
+    def route(self, method, path, body):
+        # O gspread codifica o range (":" vira %3A), então os sufixos ":append" etc. são literais
+        prefix = f"/v4/spreadsheets/{SPREADSHEET_ID}"
+        if not path.startswith(prefix):
+            raise ApiFailure(404, "Requested entity was not found.", "NOT_FOUND")
+        rest, state = path[len(prefix):], self.server.state
+        if rest == "" and method == "GET":
+            return "metadata", state.metadata
+        if rest == ":batchUpdate":
+            return "batchUpdate", lambda: state.batch_update(body)
+        if rest == "/values:batchUpdate":
+            return "values.batchUpdate", lambda: state.batch_update_values(body.get("data", []))
+        if rest == "/values:batchClear":
+            return "values.batchClear", lambda: state.batch_clear(body.get("ranges", []))
+        if rest.startswith("/values/"):
+            name, _, verb = rest[len("/values/"):].partition(":")
+            name = unquote(name)
+            if verb == "append":
+                return "values.append", lambda: state.append_values(name, body.get("values", []))
+            if verb == "clear":
+                return "values.clear", lambda: state.clear_values(name) or {"clearedRange": name}
+            if method == "GET":
+                return "values.get", lambda: state.get_values(name)
+            if method == "PUT":
+                return "values.update", lambda: {"updatedRows": state.update_values(name, body.get("values", []))}
+        raise ApiFailure(404, f"Rota não suportada pelo Sheets falso: {method} {rest}", "NOT_FOUND")
+
+
+class LocalSession(requests.Session):
+    """Sessão HTTP do gspread apontada para o servidor local."""
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(SHEETS_HOST):
+            url = self.base_url + url[len(SHEETS_HOST):]
+        return super().request(method, url, *args, **kwargs)
+
+
+# --- SESSÕES SIMULADAS ---
+AST_LOCK = threading.Lock()
+_ast_parse = ast.parse
+
+
+def locked_ast_parse(*args, **kwargs):
+    with AST_LOCK:
+        return _ast_parse(*args, **kwargs)
+
+
+def shared_runtime():
+    # O AppTest monta e desfaz, a cada execução, um Runtime falso, os secrets e a
+    # config em variáveis globais: com várias sessões em threads, o fim de uma
+    # execução desmontava as outras. Aqui tudo é montado uma vez, como num servidor
+    # de verdade: um Runtime e um cache do script para todas as sessões. O ast.parse
+    # do CPython 3.11 não aguenta threads simultâneas ("AST constructor recursion
+    # depth mismatch" ao compilar o script ou formatar um traceback): vai serializado.
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    secrets = Secrets()
+    secrets._secrets = {"gcp_service_account": {"type": "service_account"}}
+    script_cache = ScriptCache()
+    return [
+        mock.patch.object(Runtime, "_instance", runtime),
+        mock.patch.object(app_test, "Runtime", type("RuntimeDoAppTest", (), {"_instance": None})),
+        mock.patch.object(app_test, "ScriptCache", lambda: script_cache),
+        mock.patch.object(st, "secrets", secrets),
+        patch_config_options({"global.appTest": True}),
+        mock.patch.object(ast, "parse", locked_ast_parse),
+    ]
+
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 1)
+
+    return {"n": len(ordered), "p50": rank(50), "p99": rank(99), "max": round(ordered[-1], 1),
+            "media": round(statistics.fmean(ordered), 1)}
+
+
+class Session(threading.Thread):
+    def __init__(self, number, aluno, keys, hot_key, topics, args, tracker):
+        super().__init__(name=f"sessao-{number}", daemon=True)
+        self.aluno, self.keys, self.hot_key, self.topics = aluno, keys, hot_key, topics
+        self.args, self.tracker = args, tracker
+        self.rng = random.Random(args.seed * 1000 + number)
+        self.runs = []                  # (ação, ms)
+        self.errors = []
+        self.increments = Counter()     # chave -> incrementos confirmados pela sessão
+        self.uncertain = Counter()      # chave -> incrementos cuja execução falhou no meio
+        self.pomodoros = 0
+        self.open_topic = None
+
+    def run(self):
+        self.at = AppTest.from_file(str(rb.APP_PATH), default_timeout=self.args.timeout)
+        self.at.session_state["aluno"] = self.aluno
+        self.at.session_state["pagina"] = DASHBOARD
+        self.execute("abrir")
+        actions, weights = zip(*ACTIONS.items())
+        for _ in range(self.args.steps):
+            action = self.rng.choices(actions, weights)[0]
+            try:
+                getattr(self, f"do_{action}")()
+            except Exception as e:
+                self.errors.append(f"{action}: {type(e).__name__}: {e}")
+            if self.args.think:
+                time.sleep(self.rng.uniform(0, self.args.think))
+
+    def execute(self, action):
+        with self.tracker.running():
+            started = time.perf_counter()
+            self.at.run()
+            self.runs.append((action, (time.perf_counter() - started) * 1000))
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def goto(self, page):
+        self.at.session_state["pagina"] = page
+        if self.open_topic:
+            self.at.session_state[self.open_topic] = page == EDITAL
+
+    def do_dashboard(self):
+        self.goto(DASHBOARD)
+        self.execute("dashboard")
+
+    def do_cronograma(self):
+        self.goto(CRONOGRAMA)
+        self.execute("cronograma")
+
+    def questions(self, key):
+        return self.at.session_state["progress"].get(key, {}).get("num_questoes", 0)
+
+    def question_input(self, key):
+        # Sob carga o AppTest às vezes monta o expander fechado: reabre e roda de novo
+        for _ in range(3):
+            try:
+                return self.at.number_input(key=f"nq{key}")
+            except KeyError:
+                self.at.session_state[self.open_topic] = True
+                self.execute("edital")
+        raise RuntimeError(f"subtópico {key} não apareceu no Edital")
+
+    def do_incremento(self):
+        key = self.hot_key if self.hot_key and self.rng.random() < self.args.contencao else self.rng.choice(self.keys)
+        materia, topico = self.topics[key]
+        if self.open_topic and self.open_topic != f"exp_{materia}_{topico}":
+            self.at.session_state[self.open_topic] = False
+        self.open_topic = f"exp_{materia}_{topico}"
+        self.goto(EDITAL)
+        self.execute("edital")
+        target = int(self.question_input(key).value) + 1
+        for _ in range(3):
+            # Expander fechado nesta execução = o campo sumiu e a edição não chegou ao app
+            self.question_input(key).set_value(target)
+            self.at.session_state[self.open_topic] = True
+            try:
+                self.execute("incremento")
+            except Exception:
+                # Erro depois da edição: a gravação pode ou não ter entrado na fila
+                if self.questions(key) == target:
+                    self.uncertain[key] += 1
+                raise
+            # Só conta o que o app aceitou (a sessão já mostra o valor novo)
+            if self.questions(key) == target:
+                self.increments[key] += 1
+                return
+        raise RuntimeError(f"edição de {key} não aplicada")
+
+    def do_pomodoro(self):
+        self.goto(DASHBOARD)
+        if "pomo_deadline" in self.at.session_state and self.at.session_state["pomo_deadline"] is not None:
+            # Conclui a sessão em andamento sem esperar os minutos de foco
+            self.at.session_state["pomo_deadline"] = time.time() - 1
+            self.execute("pomodoro_fim")
+            self.pomodoros += 1
+        else:
+            next(b for b in self.at.button if b.label == "▶️").click()
+            self.execute("pomodoro_inicio")
+
+
+class ThreadTracker:
+    """Amostra as threads vivas (por tipo) e as execuções de script em andamento."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.samples = []
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._sample, name="amostrador", daemon=True)
+
+    @contextlib.contextmanager
+    def running(self):
+        with self.lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def kind(thread):
+        name = thread.name
+        if name.startswith("sessao-"):
+            return "sessoes"
+        if name in ("write-behind", "store-prefetch"):
+            return name
+        if "process_request" in name:
+            return "servidor_http"
+        if "ScriptRunner" in name or "scriptThread" in name:
+            return "script"
+        return "outras"
+
+    def _sample(self):
+        while not self.stop.wait(SAMPLE_SECONDS):
+            threads = threading.enumerate()
+            sample = Counter(self.kind(t) for t in threads)
+            sample["total"] = len(threads)
+            with self.lock:
+                sample["execucoes_em_andamento"] = self.in_flight
+            self.samples.append(sample)
+
+    def summary(self):
+        names = sorted({k for s in self.samples for k in s})
+        return {k: {"max": max(s[k] for s in self.samples),
+                    "media": round(statistics.fmean(s[k] for s in self.samples), 1)} for k in names}
+
+
+# --- EXECUÇÃO ---
+def journal_pending(path):
+    if not os.path.exists(path):
+        return 0
+    with sqlite3.connect(path) as conn:
+        try:
+            return conn.execute("SELECT COUNT(*) FROM diario").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+
+
+def drain(journal_path, timeout):
+    # Tudo confirmado pelo backend = diário local vazio (as confirmadas saem dele)
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if journal_pending(journal_path) == 0:
+            time.sleep(rb.SETTLE_SECONDS)
+            if journal_pending(journal_path) == 0:
+                break
+        time.sleep(0.25)
+    return round(time.monotonic() - started, 1), journal_pending(journal_path)
+
+
+def read_back(aluno, timeout):
+    # Sessão nova, sem snapshot nem diário: o que ela lê é o que está no Sheets
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    local = tempfile.mkdtemp(prefix="estudamed-verifica-")
+    os.environ["ESTUDAMED_SNAPSHOT_DIR"] = local
+    os.environ["ESTUDAMED_JOURNAL_PATH"] = os.path.join(local, "journal.db")
+    at = AppTest.from_file(str(rb.APP_PATH), default_timeout=timeout)
+    at.session_state["aluno"] = aluno
+    at.run()
+    rb.check(at, f"leitura final ({aluno or 'compartilhado'})")
+    return at.session_state["progress"]
+
+
+def lost_updates(expected, uncertain, baseline, actual):
+    # expected: incrementos confirmados; incertos podem ou não ter sido gravados
+    result = {"incrementos": sum(expected.values()), "incertos": sum(uncertain.values()),
+              "perdidos": 0, "excedentes": 0, "chaves_divergentes": {}}
+    for key in set(expected) | set(uncertain):
+        base = baseline.get(key, {}).get("num_questoes", 0)
+        got = actual.get(key, {}).get("num_questoes", 0) - base
+        lost = max(0, expected[key] - got)
+        extra = max(0, got - expected[key] - uncertain[key])
+        result["perdidos"] += lost
+        result["excedentes"] += extra
+        if lost or extra:
+            result["chaves_divergentes"][key] = {"esperado": expected[key], "gravado": got}
+    return result
+
+
+def log_rows(state, title, since):
+    # Linhas do log com data (coluna A, ISO) a partir do início da carga
+    sheet = state.sheets.get(title)
+    if sheet is None:
+        return 0
+    return sum(1 for (r, c), value in sheet["cells"].items() if c == 1 and r > 1 and value >= since)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="sessões simultâneas")
+    parser.add_argument("--steps", type=int, default=15, help="ações por sessão")
+    parser.add_argument("--alunos", type=int, default=1, help="namespaces de aluno (1 = todos no compartilhado)")
+    parser.add_argument("--keys", type=int, default=3, help="subtópicos próprios de cada sessão")
+    parser.add_argument("--contencao", type=float, default=0.2,
+                        help="fração dos incrementos na chave disputada por todas as sessões do aluno")
+    parser.add_argument("--think", type=float, default=0.2, help="pausa máxima entre ações (s)")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência por chamada ao Sheets falso (s)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="latência extra aleatória (s)")
+    parser.add_argument("--read-quota", type=int, default=0, help="leituras por minuto antes do 429 (0 = sem cota)")
+    parser.add_argument("--write-quota", type=int, default=0, help="gravações por minuto antes do 429 (0 = sem cota)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="probabilidade de 503 por chamada")
+    parser.add_argument("--drain-timeout", type=float, default=180, help="espera máxima pelo diário esvaziar (s)")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout do AppTest por execução (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="grava o relatório em JSON")
+    args = parser.parse_args()
+
+    syllabus = rb.load_syllabus()
+    materia = next(iter(syllabus))
+    topics = {f"{materia}-{t}-{s}": (materia, t) for t, subs in syllabus[materia].items() for s in subs}
+    alunos = [""] if args.alunos <= 1 else [f"aluno{i + 1}" for i in range(args.alunos)]
+    per_aluno = math.ceil(args.sessions / len(alunos))
+    pool = list(topics)
+    random.Random(args.seed).shuffle(pool)
+    hot_key = pool.pop() if args.contencao > 0 else None
+    if per_aluno * args.keys > len(pool):
+        parser.error(f"{per_aluno} sessões por aluno x {args.keys} chaves > {len(pool)} subtópicos de {materia}")
+
+    # Planilha inicial: o mesmo progresso sintético do rerun_bench para cada aluno
+    baseline = rb.build_scenarios(syllabus)["edital_completo"]
+    state = FakeSheetsState()
+    for aluno in alunos:
+        state.add_sheet(f"progresso_{aluno}" if aluno else SHARED_SHEET, values=rb.sheet_rows(baseline))
+    faults = Faults(args.latency, args.jitter, args.read_quota, args.write_quota, args.fail_rate, args.seed)
+    server = FakeSheetsServer(state, faults)
+    threading.Thread(target=server.serve_forever, name="sheets-falso", daemon=True).start()
+
+    local = tempfile.mkdtemp(prefix="estudamed-stress-")
+    journal_path = os.path.join(local, "journal.db")
+    os.environ.update({"ESTUDAMED_STORAGE": "sheets", "ESTUDAMED_SPREADSHEET_ID": SPREADSHEET_ID,
+                       "ESTUDAMED_SNAPSHOT_DIR": local, "ESTUDAMED_JOURNAL_PATH": journal_path,
+                       "ESTUDAMED_ALUNOS": ",".join(alunos)})
+    patches = [
+        mock.patch.object(ServiceAccountCredentials, "from_json_keyfile_dict", return_value=object()),
+        mock.patch.object(gspread, "authorize",
+                          side_effect=lambda creds: gspread.Client(None, session=LocalSession(server.base_url))),
+        *shared_runtime(),
+    ]
+    stack = contextlib.ExitStack()
+    for p in patches:
+        stack.enter_context(p)
+    # Avisos repetidos a cada execução de cada sessão (contexto de thread, API depreciada)
+    for name in ("streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.deprecation_util"):
+        st_logger.get_logger(name).disabled = True
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    tracker = ThreadTracker()
+    sessions = []
+    for i in range(args.sessions):
+        aluno, slot = alunos[i % len(alunos)], i // len(alunos)
+        keys = pool[slot * args.keys:(slot + 1) * args.keys]
+        sessions.append(Session(i, aluno, keys, hot_key, topics, args, tracker))
+    print(f"{args.sessions} sessões x {args.steps} ações, {len(alunos)} aluno(s), Sheets falso em {server.base_url}")
+    tracker.thread.start()
+    load_started = datetime.now().isoformat()
+    started = time.perf_counter()
+    for s in sessions:
+        s.start()
+    for s in sessions:
+        s.join()
+    elapsed = time.perf_counter() - started
+    drain_s, pending = drain(journal_path, args.drain_timeout)
+    tracker.stop.set()
+
+    # Verificação sem falhas injetadas: a leitura final não pode ser barrada pela cota
+    faults.disable()
+    report_lost = {}
+    for aluno in alunos:
+        actual = read_back(aluno, args.timeout)
+        group = [s for s in sessions if s.aluno == aluno]
+        own, own_unc, hot, hot_unc = Counter(), Counter(), Counter(), Counter()
+        for s in group:
+            for key, n in s.increments.items():
+                (hot if key == hot_key else own)[key] += n
+            for key, n in s.uncertain.items():
+                (hot_unc if key == hot_key else own_unc)[key] += n
+        suffix = f"_{aluno}" if aluno else ""
+        completed = sum(s.pomodoros for s in group)
+        logged = log_rows(state, SESSION_LOG_SHEET + suffix, load_started)
+        report_lost[aluno or "compartilhado"] = {
+            "chaves_proprias": lost_updates(own, own_unc, baseline, actual),
+            "chave_disputada": lost_updates(hot, hot_unc, baseline, actual),
+            "pomodoro": {"concluidos": completed, "no_log": logged,
+                         "perdidos": max(0, completed - logged)},
+        }
+    stack.close()
+    server.shutdown()
+
+    runs = [(a, ms) for s in sessions for a, ms in s.runs]
+    by_action = defaultdict(list)
+    for action, ms in runs:
+        by_action[action].append(ms)
+    errors = [e for s in sessions for e in s.errors]
+    report = {
+        "config": vars(args),
+        "duracao_s": round(elapsed, 1),
+        "execucoes": len(runs),
+        "vazao_execucoes_s": round(len(runs) / elapsed, 2),
+        "rerun_ms": percentiles([ms for action, ms in runs if action != "abrir"]),
+        "por_acao_ms": {a: percentiles(v) for a, v in sorted(by_action.items())},
+        "erros": {"total": len(errors), "exemplos": sorted(Counter(errors).items(), key=lambda x: -x[1])[:5]},
+        "dreno_s": drain_s,
+        "pendentes_no_fim": pending,
+        "atualizacoes_perdidas": report_lost,
+        "threads": tracker.summary(),
+        "servidor": {
+            "requisicoes": {route: dict(c) for route, c in sorted(server.requests.items())},
+            "latencia_ms": {route: percentiles(v) for route, v in sorted(server.latencies.items())},
+            "gravacoes_aplicadas": server.writes_applied,
+            "erros": [{"rota": r, "status": c, "mensagem": m, "n": n} for (r, c, m), n in server.failures.most_common()],
+        },
+    }
+
+    print(f"duração {report['duracao_s']} s, {report['execucoes']} execuções, "
+          f"vazão {report['vazao_execucoes_s']} execuções/s, {len(errors)} erro(s)")
+    r = report["rerun_ms"]
+    print(f"rerun: p50 {r.get('p50')} ms  p99 {r.get('p99')} ms  max {r.get('max')} ms")
+    for action, p in report["por_acao_ms"].items():
+        print(f"  {action:16} n={p['n']:4}  p50 {p['p50']:8.1f} ms  p99 {p['p99']:8.1f} ms")
+    for name, lost in report_lost.items():
+        own, hot, pomo = lost["chaves_proprias"], lost["chave_disputada"], lost["pomodoro"]
+        print(f"{name}: chaves próprias {own['perdidos']}/{own['incrementos']} perdidos, "
+              f"chave disputada {hot['perdidos']}/{hot['incrementos']} perdidos, "
+              f"pomodoro {pomo['perdidos']}/{pomo['concluidos']} fora do log")
+    print(f"diário esvaziado em {drain_s} s ({pending} pendente(s))")
+    print("threads (max/média): " + ", ".join(f"{k} {v['max']}/{v['media']}" for k, v in report["threads"].items()))
+    status = Counter()
+    for c in server.requests.values():
+        status.update(c)
+    print(f"servidor: {sum(status.values())} requisições, por status {dict(sorted(status.items()))}")
+    for e, n in report["erros"]["exemplos"]:
+        print(f"  erro x{n}: {e[:200]}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Infraestrutura do EstudaMed usada pelo appmed.py: armazenamento, codec, Sheets e métricas."""
@@ -0,0 +1,174 @@
+"""Codificação compacta das células do progresso (formato 2) e chaves por ID."""
+
+import base64
+import calendar
+import hashlib
+import json
+import re
+import zlib
+from datetime import datetime, timedelta, timezone
+
+# --- CODIFICAÇÃO COMPACTA DAS CÉLULAS (FORMATO 2) ---
+# Chaves de subtópico viram IDs numéricos estáveis ("#" + hash de 64 bits em base 36) e as
+# entradas viram "~2|flags|questões|dificuldade|alterado|ease|intervalo|repetições|próxima|notas"
+# (teoria/questões/revisão em bits, datas em epoch base 36). Só entra no formato o que
+# volta idêntico; o resto, e outros valores grandes, vão como JSON (zlib + base64,
+# "~z...", quando compensa). Células antigas em JSON continuam legíveis.
+DIFFICULTY_OPTIONS = ["Não avaliado", "🟢 Fácil", "🟡 Médio", "🔴 Difícil"]
+COMPACT_PREFIX = "~2|"
+ZLIB_PREFIX = "~z"
+ID_PREFIX = "#"
+ZLIB_MIN_BYTES = 160
+STATUS_FLAGS = {"teoria": 1, "questoes": 2, "revisao": 4}
+# Bit de ausência: a entrada não tem o campo (células antigas têm sempre os três)
+STATUS_ABSENT = {f: bit << 3 for f, bit in STATUS_FLAGS.items()}
+COMPACT_FIELDS = set(STATUS_FLAGS) | {"num_questoes", "dificuldade", "last_modified", "notes",
+                                      "ease", "intervalo", "repeticoes", "proxima_revisao"}
+
+def b36(n):
+    digits, out = "0123456789abcdefghijklmnopqrstuvwxyz", ""
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+def syllabus_id(key):
+    # 64 bits: com dezenas de milhares de subtópicos a chance de colisão é desprezível
+    # (crc32 chegava a ~1% com 10 mil chaves). Cabe nos 13 caracteres do ID
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return b36(int.from_bytes(digest, "big"))
+
+def legacy_syllabus_id(key):
+    # ID das versões anteriores (crc32): só para ler as linhas "#<id>" já gravadas
+    return b36(zlib.crc32(key.encode("utf-8")))
+
+# Datas: epoch em base 36, com ".microssegundos" e "+/-minutos do fuso" (base 36)
+# só quando existem. Sem fuso (o que o app grava com datetime.now()) o epoch é do
+# horário de parede, como se fosse UTC: a célula volta igual em servidores com fusos
+# diferentes. Células antigas têm só o epoch e continuam legíveis.
+EPOCH_RE = re.compile(r"([0-9a-z]+)(?:\.([0-9a-z]+))?(?:([+-])([0-9a-z]+))?")
+
+def _epoch(iso):
+    # ValueError (-> entrada vai em JSON) se o texto não voltaria idêntico do formato
+    # compacto: data antes de 1970, fuso com segundos, ISO fora da forma canônica...
+    if not iso:
+        return ""
+    d = datetime.fromisoformat(iso)
+    if d.tzinfo is None:
+        seconds = calendar.timegm(d.timetuple())
+    else:
+        seconds = int(d.replace(microsecond=0).timestamp())
+    if seconds < 0:
+        raise ValueError(f"data antes de 1970: {iso!r}")
+    out = b36(seconds) + (f".{b36(d.microsecond)}" if d.microsecond else "")
+    offset = d.utcoffset()
+    if offset is not None:
+        minutes = int(offset.total_seconds() // 60)
+        out += ("-" if minutes < 0 else "+") + b36(abs(minutes))
+    if _from_epoch(out) != iso:
+        raise ValueError(f"data sem representação compacta exata: {iso!r}")
+    return out
+
+def _from_epoch(text):
+    seconds, micro, sign, minutes = EPOCH_RE.fullmatch(text).groups()
+    if sign:
+        tz = timezone(timedelta(minutes=int(minutes, 36) * (-1 if sign == "-" else 1)))
+        d = datetime.fromtimestamp(int(seconds, 36), tz)
+    else:
+        d = datetime.fromtimestamp(int(seconds, 36), timezone.utc).replace(tzinfo=None)
+    return d.replace(microsecond=int(micro, 36) if micro else 0).isoformat()
+
+def _exact_int(v, scale=1):
+    # Inteiro guardado no formato compacto (v * scale); ValueError se não voltaria igual
+    if isinstance(v, bool):
+        raise ValueError(f"{v!r} não cabe no formato compacto")
+    n = round(v * scale)
+    if (n / scale if scale != 1 else n) != v:
+        raise ValueError(f"{v!r} não cabe no formato compacto")
+    return str(n)
+
+def encode_entry(value):
+    # None quando a entrada tem algo que o formato compacto não representa
+    if not set(value) <= COMPACT_FIELDS or value.get("dificuldade", "Não avaliado") not in DIFFICULTY_OPTIONS:
+        return None
+    # Campo presente volta presente: flags só bool, datas só texto não vazio
+    if not all(isinstance(value[f], bool) for f in STATUS_FLAGS if f in value):
+        return None
+    if any(f in value and not value[f] for f in ("last_modified", "proxima_revisao")):
+        return None
+    try:
+        flags = sum(bit for f, bit in STATUS_FLAGS.items() if value.get(f))
+        flags += sum(bit for f, bit in STATUS_ABSENT.items() if f not in value)
+        fields = [
+            str(flags),
+            _exact_int(value["num_questoes"]) if "num_questoes" in value else "",
+            str(DIFFICULTY_OPTIONS.index(value["dificuldade"])) if "dificuldade" in value else "",
+            _epoch(value.get("last_modified")),
+            _exact_int(value["ease"], 100) if "ease" in value else "",
+            _exact_int(value["intervalo"]) if "intervalo" in value else "",
+            _exact_int(value["repeticoes"]) if "repeticoes" in value else "",
+            _epoch(value.get("proxima_revisao")),
+        ]
+    except (TypeError, ValueError, OverflowError):
+        return None
+    notes = value.get("notes")
+    if not isinstance(notes, (str, type(None))):
+        return None
+    return COMPACT_PREFIX + "|".join(fields) + ("|" + notes if notes is not None else "")
+
+def decode_entry(cell):
+    parts = cell[len(COMPACT_PREFIX):].split("|", 8)
+    flags, nq, dif, lm, ease, intervalo, reps, proxima = parts[:8]
+    entry = {f: bool(int(flags) & bit) for f, bit in STATUS_FLAGS.items() if not int(flags) & STATUS_ABSENT[f]}
+    if nq: entry["num_questoes"] = int(nq)
+    if dif: entry["dificuldade"] = DIFFICULTY_OPTIONS[int(dif)]
+    if len(parts) > 8: entry["notes"] = parts[8]
+    if lm: entry["last_modified"] = _from_epoch(lm)
+    if ease: entry["ease"] = int(ease) / 100
+    if intervalo: entry["intervalo"] = int(intervalo)
+    if reps: entry["repeticoes"] = int(reps)
+    if proxima: entry["proxima_revisao"] = _from_epoch(proxima)
+    return entry
+
+def encode_value(key, value, index):
+    if key in index["keys"] and isinstance(value, dict):
+        cell = encode_entry(value)
+        if cell is not None:
+            return cell
+    text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    if len(text) >= ZLIB_MIN_BYTES:
+        packed = ZLIB_PREFIX + base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+        if len(packed) < len(text):
+            return packed
+    return text
+
+def unpack_cell(cell):
+    # Entrada compacta -> dict plano; o resto -> texto JSON (formato 1 ou descomprimido)
+    if cell.startswith(COMPACT_PREFIX):
+        return decode_entry(cell)
+    if cell.startswith(ZLIB_PREFIX):
+        return zlib.decompress(base64.b64decode(cell[len(ZLIB_PREFIX):])).decode("utf-8")
+    return cell
+
+def decode_value(cell):
+    value = unpack_cell(cell)
+    return dict(value) if isinstance(value, dict) else json.loads(value)
+
+def physical_key(key, index):
+    info = index["keys"].get(key)
+    return ID_PREFIX + info["id"] if info is not None else key
+
+def key_for_id(sid, index):
+    # IDs antigos (crc32) ainda resolvem; a linha é regravada com o ID novo na próxima gravação
+    key = index["ids"].get(sid)
+    return key if key is not None else index.get("legacy_ids", {}).get(sid)
+
+def logical_key(stored, index):
+    if stored.startswith(ID_PREFIX):
+        key = key_for_id(stored[len(ID_PREFIX):], index)
+        return key if key is not None else stored
+    return stored
+
+# Índice sem edital: toda chave fica como está e todo valor vai em JSON
+EMPTY_INDEX = {"keys": {}, "ids": {}, "legacy_ids": {}}
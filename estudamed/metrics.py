@@ -0,0 +1,84 @@
+"""Métricas internas do EstudaMed: spans de tempo e contadores por processo."""
+
+import contextlib
+import json
+import threading
+import time
+from datetime import datetime
+
+# --- MÉTRICAS (REGISTRO ÚNICO POR PROCESSO) ---
+# Spans de tempo e contadores dos caminhos quentes. Desligado, span() devolve um
+# contexto vazio reaproveitado e observe()/inc() retornam na primeira linha.
+class _Span:
+    __slots__ = ("registry", "name", "started")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(f"{self.name}_seconds", time.perf_counter() - self.started)
+        return False
+
+_NO_SPAN = contextlib.nullcontext()
+
+class MetricsRegistry:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.summaries = {}  # nome -> {"count", "sum", "max", "last"}
+        self.counters = {}
+        self.started = datetime.now()
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def observe(self, name, value):
+        if not self.enabled: return
+        with self.lock:
+            s = self.summaries.get(name)
+            if s is None:
+                s = self.summaries[name] = {"count": 0, "sum": 0.0, "max": value, "last": value}
+            s["count"] += 1
+            s["sum"] += value
+            s["max"] = max(s["max"], value)
+            s["last"] = value
+
+    def inc(self, name, value=1):
+        if not self.enabled: return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "desde": self.started.isoformat(timespec="seconds"),
+                "agora": datetime.now().isoformat(timespec="seconds"),
+                "summaries": {k: dict(v) for k, v in self.summaries.items()},
+                "counters": dict(self.counters),
+            }
+
+    def to_prometheus(self):
+        snap = self.snapshot()
+        lines = []
+        for name, s in sorted(snap["summaries"].items()):
+            metric = f"estudamed_{name}"
+            lines += [f"# TYPE {metric} summary",
+                      f"{metric}_count {s['count']}",
+                      f"{metric}_sum {s['sum']:.6f}",
+                      f"# TYPE {metric}_max gauge",
+                      f"{metric}_max {s['max']:.6f}"]
+        for name, value in sorted(snap["counters"].items()):
+            metric = f"estudamed_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def to_json_line(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+# Registro desligado: padrão das classes de armazenamento quando ninguém passa um
+NO_METRICS = MetricsRegistry(False)
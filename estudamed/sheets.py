@@ -0,0 +1,176 @@
+"""Acesso ao Google Sheets: cota por balde de tokens, retry com backoff e disjuntor.
+
+gspread, oauth2client e requests só são importados na primeira chamada real.
+"""
+
+import copy
+import random
+import threading
+import time
+
+from estudamed.metrics import NO_METRICS
+
+# --- CLIENTE DO SHEETS COM COTA, RETRY E CIRCUIT BREAKER ---
+# Cota do Sheets: 60 leituras e 60 escritas por minuto por usuário. Cada chamada
+# passa por um balde de tokens; 429/5xx/timeout são repetidos com backoff
+# exponencial + jitter (acréscimos ao log só no 429, o único que garante que nada entrou), e falhas seguidas abrem o disjuntor: enquanto ele estiver
+# aberto nenhuma chamada sai (as gravações ficam na fila do write-behind).
+SHEETS_RETRY_STATUS = {429, 500, 502, 503, 504}
+SHEETS_READ_METHODS = {"get", "get_all_values", "cell", "acell", "row_values", "col_values", "worksheet"}
+SHEETS_APPEND_METHODS = {"append_row", "append_rows"}  # não idempotentes: repetir pode duplicar linhas
+
+class BackendUnavailable(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = max(1.0, per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Devolve quantos segundos esperou pelo token
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+class SheetsGuard:
+    def __init__(self, reads_per_min=60, writes_per_min=60, max_attempts=5, base_delay=1.0, max_delay=32.0,
+                 failure_threshold=5, cooldown=30.0, metrics=NO_METRICS):
+        self.buckets = {"read": TokenBucket(reads_per_min), "write": TokenBucket(writes_per_min)}
+        self.metrics = metrics
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = 0         # falhas transitórias seguidas
+        self.open_until = 0.0     # disjuntor aberto até este instante (monotonic)
+        self.last_error = None
+
+    def retry_in(self):
+        with self.lock:
+            return max(0.0, self.open_until - time.monotonic())
+
+    def call(self, kind, fn, *args, **kwargs):
+        import gspread
+        import requests
+        for attempt in range(self.max_attempts):
+            wait = self.retry_in()
+            if wait > 0:
+                self.metrics.inc("sheets_circuit_rejected")
+                raise BackendUnavailable(f"Google Sheets instável ({self.last_error})", wait)
+            self.metrics.observe("sheets_throttle_seconds", self.buckets["read" if kind == "read" else "write"].acquire())
+            self.metrics.inc(f"sheets_{kind}_calls")
+            try:
+                # Cópia por tentativa: o gspread altera argumentos no lugar (batch_update
+                # absolutiza os ranges) e a repetição mandaria "'aba'!'aba'!A1"
+                result = fn(*copy.deepcopy(args), **copy.deepcopy(kwargs))
+            except gspread.exceptions.APIError as e:
+                if e.code not in SHEETS_RETRY_STATUS:
+                    raise
+                error = e
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = e
+            else:
+                with self.lock:
+                    self.failures = 0
+                return result
+            self._record_failure(error)
+            if kind == "append" and getattr(error, "code", None) != 429:
+                # Resposta incerta (timeout, queda, 5xx): as linhas podem ter entrado. Não
+                # repete aqui; o write-behind confere o log antes de reenviar
+                raise error
+            self.metrics.inc("sheets_retries")
+            if attempt + 1 < self.max_attempts:
+                # Full jitter: espalha as novas tentativas de várias sessões
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+        raise error
+
+    def _record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.failures >= self.failure_threshold:
+                # Meia-abertura: passado o cooldown, a próxima chamada serve de teste
+                self.open_until = time.monotonic() + self.cooldown
+                self.failures = self.failure_threshold - 1
+                self.metrics.inc("sheets_circuit_opened")
+
+class GuardedSheet:
+    # Envolve Worksheet/Spreadsheet do gspread: métodos passam pelo SheetsGuard e
+    # abas devolvidas (worksheet, add_worksheet, .spreadsheet) saem já envolvidas
+    def __init__(self, target, guard):
+        self._target = target
+        self._guard = guard
+
+    def _wrap(self, value):
+        if hasattr(value, "get_all_values") or hasattr(value, "add_worksheet"):
+            return GuardedSheet(value, self._guard)
+        return value
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return self._wrap(attr)
+        kind = "read" if name in SHEETS_READ_METHODS else "append" if name in SHEETS_APPEND_METHODS else "write"
+        def guarded(*args, **kwargs):
+            return self._wrap(self._guard.call(kind, attr, *args, **kwargs))
+        return guarded
+
+# --- CONEXÃO ROBUSTA COM GOOGLE SHEETS ---
+# A conexão é preguiçosa: nada de rede na execução do script. Quem abre a planilha
+# é a primeira leitura (em segundo plano, ver ProgressStore.prefetch).
+class SheetsConnection:
+    def __init__(self, credentials, spreadsheet_id, guard, timeout=20):
+        self.credentials = credentials
+        self.spreadsheet_id = spreadsheet_id
+        self.guard = guard
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._spreadsheet = None
+
+    def spreadsheet(self):
+        with self.lock:
+            if self._spreadsheet is None:
+                with self.guard.metrics.span("sheets_connect"):
+                    self._spreadsheet = self._open()
+            return self._spreadsheet
+
+    def _open(self):
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(self.credentials, scope)
+        client = gspread.authorize(creds)
+        if hasattr(client, "set_timeout"):
+            client.set_timeout(self.timeout)
+        try:
+             spreadsheet = client.open_by_key(self.spreadsheet_id)
+        except:
+             spreadsheet = client.open("EstudaMed")
+        return GuardedSheet(spreadsheet, self.guard)
+
+def open_worksheet(spreadsheet, title, header):
+    import gspread
+    try:
+        return spreadsheet.worksheet(title)
+    except gspread.WorksheetNotFound:
+        ws = spreadsheet.add_worksheet(title, rows=1000, cols=max(len(header), 3))
+        ws.append_rows([header], value_input_option="RAW")
+        return ws
@@ -0,0 +1,1029 @@
+"""Armazenamento do progresso: backends, merge de gravações concorrentes, diário local e write-behind.
+
+Nada aqui depende do Streamlit: o appmed.py cria os objetos (um por processo, via
+st.cache_resource) e passa as configurações lidas de st.secrets/ambiente.
+"""
+
+import atexit
+import collections
+import contextlib
+import copy
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from estudamed.codec import (EMPTY_INDEX, decode_value, encode_value, logical_key, physical_key,
+                             unpack_cell)
+from estudamed.metrics import NO_METRICS
+from estudamed.sheets import BackendUnavailable, SHEETS_RETRY_STATUS, open_worksheet
+
+# --- ARMAZENAMENTO PLUGÁVEL ---
+# Todo backend guarda uma linha por chave (subtópico, "crono_text",
+# "pomodoro_rollup") com o valor em JSON. A classe base detecta o que mudou
+# e cada backend só implementa como ler e gravar essas linhas. As sessões de
+# Pomodoro vão para um log separado, só de acréscimos.
+# Valores que os widgets assumem quando o campo não existe na entrada
+ENTRY_DEFAULTS = {"teoria": False, "questoes": False, "revisao": False, "num_questoes": 0,
+                  "dificuldade": "Não avaliado", "notes": ""}
+
+def merge_entry(current, base, ours):
+    # Campo a campo: o que esta sessão alterou (ours != base) prevalece,
+    # o resto vem do valor atual do armazenamento
+    merged = dict(current)
+    for field, value in ours.items():
+        if base.get(field, ENTRY_DEFAULTS.get(field)) != value:
+            merged[field] = value
+    return merged
+
+# Baldes do histórico de estudo (ver appmed.py, HISTÓRICO DE ESTUDO)
+HISTORY_WEEK_PREFIX = "hist_semana:"
+HISTORY_MONTHS_KEY = "hist_meses"
+
+def is_counter_key(key):
+    # Rollup do Pomodoro e baldes do histórico: contadores somados por várias sessões
+    return key == "pomodoro_rollup" or key == HISTORY_MONTHS_KEY or key.startswith(HISTORY_WEEK_PREFIX)
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def merge_counters(current, base, ours):
+    # Números: soma ao valor atual só o que esta sessão acrescentou (ours - base), para
+    # dois incrementos simultâneos não se sobrescreverem. Subdicionários recursivamente;
+    # o resto como em merge_entry, e o que esta sessão apagou (compactação) sai
+    merged = dict(current)
+    for field, value in ours.items():
+        old, now = base.get(field), current.get(field)
+        if isinstance(value, dict):
+            merged[field] = merge_counters(now if isinstance(now, dict) else {},
+                                           old if isinstance(old, dict) else {}, value)
+        elif (_is_number(value) and (old is None or _is_number(old)) and (now is None or _is_number(now))):
+            merged[field] = (now or 0) + value - (old or 0)
+        elif old != value:
+            merged[field] = value
+    for field in set(base) - set(ours):
+        merged.pop(field, None)
+    return merged
+
+# Carimbo de versão: "versão" ou "versão|gravador:seq,gravador:seq". Cada gravador
+# (um diário local, ou um processo sem diário) deixa ali a maior sequência que já
+# gravou, na mesma escrita das linhas. Um lote repetido depois de uma falha sem
+# resposta (ou relido do diário após uma queda) não é aplicado de novo: nos
+# contadores, somar a diferença duas vezes contaria a mesma sessão em dobro.
+APPLIED_MAX = 32  # gravadores lembrados no carimbo (os mais recentes)
+
+def format_stamp(version, applied):
+    marks = ",".join(f"{writer}:{seq}" for writer, seq in applied.items())
+    return f"{version}|{marks}" if marks else str(version)
+
+def parse_stamp(text):
+    # -> (versão, {gravador: seq})
+    version, _, marks = str(text or "").partition("|")
+    applied = {}
+    for mark in filter(None, marks.split(",")):
+        writer, _, seq = mark.rpartition(":")
+        applied[writer] = int(seq)
+    return int(version or 0), applied
+
+def with_applied(applied, token):
+    # Cópia do carimbo com token = (gravador, seq); o gravador vai para o fim
+    applied = dict(applied)
+    if token is not None:
+        writer, seq = token
+        applied[writer] = max(seq, applied.pop(writer, 0))
+        while len(applied) > APPLIED_MAX:
+            del applied[next(iter(applied))]
+    return applied
+
+class ProgressStore:
+    label = "armazenamento"
+    deferred = False  # True: a primeira leitura é lenta e vale mostrar o snapshot antes
+
+    def __init__(self, index=None, metrics=NO_METRICS, cache_ttl=30.0, cache_max_age=600.0):
+        # index: função que devolve o índice do edital (IDs das chaves no codec)
+        self.index = index or (lambda: EMPTY_INDEX)
+        self.metrics = metrics
+        # Até cache_ttl segundos confia na cópia do processo; depois só confere a versão
+        # (1 célula) e relê tudo se ela mudou ou se a cópia passou de cache_max_age
+        self.cache_ttl = cache_ttl
+        self.cache_max_age = cache_max_age
+        self.lock = threading.Lock()     # só a cópia em memória; nunca fica preso durante I/O
+        self.lock_io = threading.Lock()  # serializa as leituras e gravações no backend
+        self.lock_prefetch = threading.Lock()
+        self.saved = {}     # chave -> última célula gravada (para detectar mudanças)
+        self.physical = {}  # chave -> como ela está gravada no backend (formato antigo ou "#id")
+        self.unpacked = {}  # chave -> célula já decodificada (dict plano ou texto JSON)
+        self.snapshot_path = None  # última cópia em disco (sobrevive a reinícios do app)
+        self.prefetch_thread = None
+        self.prefetch_error = None
+        self.version = 0    # versão do namespace quando lemos/gravamos pela última vez
+        self.applied = {}   # gravador -> maior seq já gravada (ver format_stamp)
+        self.conflicts = 0  # gravações que encontraram uma versão mais nova e foram mescladas
+        self.checked_at = None  # última vez que a cópia local foi conferida com o armazenamento
+        self.loaded_at = None   # última leitura completa
+
+    def load(self):
+        # Read-through: a rede roda sob lock_io (sessões simultâneas esperam ali e
+        # reaproveitam a mesma leitura); self.lock só protege a cópia em memória, então
+        # quem encontra o cache válido nunca espera uma leitura ou gravação em curso.
+        # Falha sem cópia local sobe como exceção (nunca vira "progresso vazio").
+        with self.lock:
+            fresh = self.loaded_at is not None and time.monotonic() - self.checked_at <= self.cache_ttl
+        if fresh:
+            self.metrics.inc("cache_hits")
+        else:
+            with self.lock_io:
+                self._revalidate()
+        with self.lock:
+            # Cada sessão recebe a própria cópia (o progresso é alterado no lugar): as
+            # entradas compactas já decodificadas saem com um dict() barato
+            return {k: dict(v) if isinstance(v, dict) else json.loads(v) for k, v in self.unpacked.items()}
+
+    def _revalidate(self):
+        # Sob lock_io: quem esperava pode encontrar o cache já renovado por outra sessão
+        now = time.monotonic()
+        with self.lock:
+            loaded_at, checked_at, version = self.loaded_at, self.checked_at, self.version
+        try:
+            if loaded_at is None or now - loaded_at > self.cache_max_age:
+                self._refresh(now)
+            elif now - checked_at > self.cache_ttl:
+                if self._read_version() != version:
+                    self._refresh(now)
+                else:
+                    self.metrics.inc("cache_revalidated")
+                    with self.lock:
+                        self.checked_at = now
+            else:
+                self.metrics.inc("cache_hits")
+        except Exception:
+            if loaded_at is None:
+                raise
+            self.metrics.inc("cache_stale_served")
+
+    def ready(self):
+        return self.loaded_at is not None
+
+    def prefetch(self):
+        # Primeira leitura em segundo plano (uma por processo e namespace)
+        with self.lock_prefetch:
+            if self.ready() or (self.prefetch_thread is not None and self.prefetch_thread.is_alive()):
+                return
+            self.prefetch_thread = threading.Thread(target=self._prefetch, name="store-prefetch", daemon=True)
+            self.prefetch_thread.start()
+
+    def _prefetch(self):
+        try:
+            self.load()
+            self.prefetch_error = None
+        except Exception as e:
+            self.prefetch_error = f"{type(e).__name__}: {e}"
+
+    def load_snapshot(self):
+        if not self.snapshot_path:
+            return None
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                rows = json.load(f)["linhas"]
+        except (OSError, ValueError, KeyError):
+            return None
+        index = self.index()
+        return {logical_key(stored, index): decode_value(cell) for stored, cell in rows.items()}
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp = f"{self.snapshot_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"versao": self.version,
+                           "linhas": {self.physical[k]: cell for k, cell in self.saved.items()}}, f, ensure_ascii=False)
+            os.replace(tmp, self.snapshot_path)
+        except OSError:
+            pass
+
+    def _refresh(self, now):
+        # Sob lock_io; a troca da cópia em memória é o único trecho sob self.lock
+        self.metrics.inc("cache_misses")
+        rows, version, applied = self._read()
+        index = self.index()
+        saved, physical, unpacked = {}, {}, {}
+        for stored, cell in rows.items():
+            key = logical_key(stored, index)
+            saved[key], physical[key] = cell, stored
+            unpacked[key] = unpack_cell(cell)
+        with self.lock:
+            self.saved, self.physical, self.unpacked, self.version = saved, physical, unpacked, version
+            self.applied = applied
+            self.loaded_at = self.checked_at = now
+        self._save_snapshot()
+
+    def applied_seq(self, writer):
+        # Maior seq deste gravador já no backend (lida agora, não do cache). Se a versão
+        # mudou (a gravação sem resposta entrou), a cópia em memória é relida também
+        with self.lock_io:
+            version, applied = self._read_stamp()
+            if self.loaded_at is not None and version != self.version:
+                self._refresh(time.monotonic())
+        return applied.get(writer, 0)
+
+    def save(self, data, keys=None, bases=None, token=None):
+        # keys=None compara tudo; senão só as chaves informadas são codificadas.
+        # bases: chave -> valor que a sessão viu antes de editar (ativa o merge por campo;
+        # nos contadores, a soma da diferença ao valor relido).
+        # token: (gravador, seq) registrado no carimbo; se já estiver lá, nada é gravado.
+        # Compare-and-swap: se a versão remota mudou desde a nossa última leitura,
+        # relemos tudo e mesclamos em vez de sobrescrever.
+        bases = bases or {}
+        index = self.index()
+        with self.lock_io:
+            with self._transaction():
+                remote = self._read_version()
+                if self.loaded_at is None:
+                    # Nunca lemos este namespace: sem a cópia atual não há como comparar
+                    self._refresh(time.monotonic())
+                elif remote != self.version:
+                    self.conflicts += 1
+                    self.metrics.inc("version_conflicts")
+                    self._refresh(time.monotonic())
+                if token is not None and self.applied.get(token[0], 0) >= token[1]:
+                    self.metrics.inc("save_already_applied")
+                    return 0
+
+                keys = set(data) | set(self.saved) if keys is None else set(keys)
+                updates, deleted = {}, []
+                for k in keys:
+                    if k in data:
+                        value = data[k]
+                        if k in bases and k in self.saved and isinstance(value, dict):
+                            current = decode_value(self.saved[k])
+                            if isinstance(current, dict):
+                                merge = merge_counters if is_counter_key(k) else merge_entry
+                                value = merge(current, bases[k] or {}, value)
+                        encoded = encode_value(k, value, index)
+                        if self.saved.get(k) != encoded:
+                            updates[k] = encoded
+                    elif k in self.saved:
+                        deleted.append(k)
+
+                if not updates and not deleted:
+                    return 0
+                # Linhas em formato antigo são regravadas com o ID novo e a antiga é apagada
+                stored_updates = {physical_key(k, index): v for k, v in updates.items()}
+                stored_deleted = [self.physical[k] for k in deleted]
+                stored_deleted += [self.physical[k] for k in updates
+                                   if self.physical.get(k, physical_key(k, index)) != physical_key(k, index)]
+                self.metrics.observe("save_payload_bytes", sum(len(k) + len(v) for k, v in stored_updates.items()))
+                self.metrics.inc("rows_written", len(stored_updates) + len(stored_deleted))
+                applied = with_applied(self.applied, token)
+                self._write(stored_updates, stored_deleted, self.version + 1, applied)
+
+            # A gravação atualiza o cache: outras sessões já leem o valor novo
+            with self.lock:
+                self.version += 1
+                self.applied = applied
+                self.checked_at = time.monotonic()
+                self.saved.update(updates)
+                for k, cell in updates.items():
+                    self.physical[k] = physical_key(k, index)
+                    self.unpacked[k] = unpack_cell(cell)
+                for k in deleted:
+                    self.saved.pop(k, None)
+                    self.physical.pop(k, None)
+                    self.unpacked.pop(k, None)
+            self._save_snapshot()
+            return len(updates) + len(deleted)
+
+    def _transaction(self):
+        return contextlib.nullcontext()
+
+    def append_sessions(self, records):
+        with self.lock_io:
+            self._append_sessions([[r["date"], r["minutes"]] for r in records])
+
+    def clear_sessions(self):
+        with self.lock_io:
+            self._clear_sessions()
+
+    def load_sessions(self):
+        with self.lock_io:
+            return [{"date": d, "minutes": int(m)} for d, m in self._read_sessions()]
+
+    def append_events(self, events):
+        with self.lock_io:
+            self._append_events([[e["t"], e["k"], e["f"], e["dq"]] for e in events])
+
+    def clear_events(self):
+        with self.lock_io:
+            self._clear_events()
+
+    def load_events(self):
+        with self.lock_io:
+            return [{"t": t, "k": k, "f": f, "dq": int(dq)} for t, k, f, dq in self._read_events()]
+
+    def _read(self):
+        # -> ({chave como gravada: célula}, versão, {gravador: seq})
+        raise NotImplementedError
+
+    def _read_version(self):
+        return self._read_stamp()[0]
+
+    def _read_stamp(self):
+        # -> (versão, {gravador: seq})
+        raise NotImplementedError
+
+    def _write(self, updates, deleted, version, applied):
+        raise NotImplementedError
+
+    def _append_sessions(self, rows):
+        raise NotImplementedError
+
+    def _clear_sessions(self):
+        raise NotImplementedError
+
+    def _read_sessions(self):
+        raise NotImplementedError
+
+    def _append_events(self, rows):
+        raise NotImplementedError
+
+    def _clear_events(self):
+        raise NotImplementedError
+
+    def _read_events(self):
+        raise NotImplementedError
+
+# Layout da planilha: linha 1 = cabeçalho (C1 = carimbo de versão), demais linhas = [chave, valor em JSON].
+SHEET_HEADER = ["chave", "valor"]
+# Aba separada com uma linha por sessão de Pomodoro: [data ISO, minutos]
+SESSION_LOG_SHEET = "pomodoro_log"
+SESSION_LOG_HEADER = ["data", "minutos"]
+# Log de eventos de estudo (só acrescenta): [data ISO, chave, campos alterados, delta de questões]
+EVENT_LOG_SHEET = "eventos"
+EVENT_LOG_HEADER = ["data", "chave", "campos", "dq"]
+
+class SheetsStore(ProgressStore):
+    label = "Google Sheets"
+
+    deferred = True  # primeira leitura lenta (rede): carrega em segundo plano
+
+    def __init__(self, opener, suffix="", **options):
+        super().__init__(**options)
+        self.opener = opener  # abre a aba de progresso na primeira leitura
+        self._sheet = None
+        self.suffix = suffix  # "_<aluno>" nas abas de log de cada aluno
+        self.rows = {}       # chave -> número da linha na planilha
+        self.free_rows = []  # linhas apagadas que podem ser reaproveitadas
+        self.next_row = 2
+        self.logs = {}       # abas de log (abertas/criadas na primeira escrita)
+
+    @property
+    def sheet(self):
+        if self._sheet is None:
+            self._sheet = self.opener()
+        return self._sheet
+
+    def _read(self):
+        values = self.sheet.get_all_values()
+        first = values[0][0] if values and values[0] else ""
+
+        # Migração única: formato antigo com o dicionário inteiro na célula A1
+        if first.startswith("{"):
+            return self._migrate_legacy(json.loads(first))
+
+        saved = {}
+        self.rows, self.free_rows = {}, []
+        for i, row in enumerate(values[1:], start=2):
+            if len(row) < 2 or not row[0]:
+                self.free_rows.append(i)
+                continue
+            saved[row[0]] = row[1]
+            self.rows[row[0]] = i
+        self.next_row = len(values) + 1 if values else 2
+        stamp = values[0][2] if values and len(values[0]) > 2 else ""
+        return (saved, *parse_stamp(stamp))
+
+    def _read_stamp(self):
+        # Uma leitura de célula só: bem mais barata que reler a aba inteira
+        values = self.sheet.get("C1")
+        return parse_stamp(values[0][0] if values and values[0] else "")
+
+    def _migrate_legacy(self, data):
+        index = self.index()
+        encoded = {physical_key(k, index): encode_value(k, v, index) for k, v in data.items()}
+        table = [SHEET_HEADER] + [[k, v] for k, v in encoded.items()]
+        self._ensure_rows(len(table))
+        self.sheet.batch_update([{"range": f"A1:B{len(table)}", "values": table}])
+        self.rows = {k: i for i, k in enumerate(encoded, start=2)}
+        self.free_rows = []
+        self.next_row = len(table) + 1
+        return encoded, 0, {}
+
+    def _ensure_rows(self, last_row):
+        if last_row > self.sheet.row_count:
+            self.sheet.add_rows(last_row - self.sheet.row_count)
+
+    def _write(self, updates, deleted, version, applied):
+        for k in updates:
+            if k not in self.rows:
+                self.rows[k] = self.free_rows.pop() if self.free_rows else self._append_row()
+
+        batch = [{"range": "A1:C1", "values": [SHEET_HEADER + [format_stamp(version, applied)]]}]
+        batch += [{"range": f"A{self.rows[k]}:B{self.rows[k]}", "values": [[k, v]]} for k, v in updates.items()]
+        batch += [{"range": f"A{self.rows[k]}:B{self.rows[k]}", "values": [["", ""]]} for k in deleted]
+        self._ensure_rows(self.next_row - 1)
+        self.sheet.batch_update(batch)
+
+        for k in deleted:
+            self.free_rows.append(self.rows.pop(k))
+
+    def _append_row(self):
+        self.next_row += 1
+        return self.next_row - 1
+
+    def _log_sheet(self, title=SESSION_LOG_SHEET, header=SESSION_LOG_HEADER):
+        if title not in self.logs:
+            self.logs[title] = open_worksheet(self.sheet.spreadsheet, title + self.suffix, header)
+        return self.logs[title]
+
+    def _append_sessions(self, rows):
+        self._log_sheet().append_rows(rows, value_input_option="RAW")
+
+    def _clear_sessions(self):
+        self._log_sheet().batch_clear(["A2:B"])
+
+    def _read_sessions(self):
+        return [row[:2] for row in self._log_sheet().get_all_values()[1:] if len(row) >= 2 and row[0]]
+
+    def _append_events(self, rows):
+        self._log_sheet(EVENT_LOG_SHEET, EVENT_LOG_HEADER).append_rows(rows, value_input_option="RAW")
+
+    def _clear_events(self):
+        self._log_sheet(EVENT_LOG_SHEET, EVENT_LOG_HEADER).batch_clear(["A2:D"])
+
+    def _read_events(self):
+        rows = self._log_sheet(EVENT_LOG_SHEET, EVENT_LOG_HEADER).get_all_values()[1:]
+        return [row[:4] for row in rows if len(row) >= 4 and row[0]]
+
+class SQLiteStore(ProgressStore):
+    label = "SQLite local"
+
+    def __init__(self, path, aluno="", **options):
+        super().__init__(**options)
+        self.path = path
+        self.aluno = aluno
+        # isolation_level=None: as transações são abertas explicitamente (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            self._create_schema()
+
+    def _create_schema(self):
+        cols = [r[1] for r in self.conn.execute("PRAGMA table_info(progress)")]
+        if cols and "aluno" not in cols:
+            # Migração: tabelas sem namespace viram o namespace "" (progresso compartilhado)
+            self.conn.execute("ALTER TABLE progress RENAME TO progress_v1")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS progress ("
+                          "aluno TEXT NOT NULL DEFAULT '', chave TEXT NOT NULL, valor TEXT NOT NULL, "
+                          "PRIMARY KEY (aluno, chave))")
+        if cols and "aluno" not in cols:
+            self.conn.execute("INSERT INTO progress (aluno, chave, valor) SELECT '', chave, valor FROM progress_v1")
+            self.conn.execute("DROP TABLE progress_v1")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pomodoro_log ("
+                          "id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, minutos INTEGER NOT NULL)")
+        if "aluno" not in [r[1] for r in self.conn.execute("PRAGMA table_info(pomodoro_log)")]:
+            self.conn.execute("ALTER TABLE pomodoro_log ADD COLUMN aluno TEXT NOT NULL DEFAULT ''")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS versoes (aluno TEXT PRIMARY KEY, versao INTEGER NOT NULL)")
+        if "aplicados" not in [r[1] for r in self.conn.execute("PRAGMA table_info(versoes)")]:
+            self.conn.execute("ALTER TABLE versoes ADD COLUMN aplicados TEXT NOT NULL DEFAULT ''")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS eventos ("
+                          "id INTEGER PRIMARY KEY AUTOINCREMENT, aluno TEXT NOT NULL DEFAULT '', "
+                          "data TEXT NOT NULL, chave TEXT NOT NULL, campos TEXT NOT NULL, dq INTEGER NOT NULL)")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE trava a escrita: a checagem de versão e a gravação são atômicas
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+
+    def _read(self):
+        rows = dict(self.conn.execute("SELECT chave, valor FROM progress WHERE aluno = ?", (self.aluno,)))
+        return (rows, *self._read_stamp())
+
+    def _read_stamp(self):
+        row = self.conn.execute("SELECT versao, aplicados FROM versoes WHERE aluno = ?", (self.aluno,)).fetchone()
+        return parse_stamp(f"{row[0]}|{row[1]}") if row else (0, {})
+
+    def _write(self, updates, deleted, version, applied):
+        self.conn.executemany(
+            "INSERT INTO progress (aluno, chave, valor) VALUES (?, ?, ?) "
+            "ON CONFLICT(aluno, chave) DO UPDATE SET valor = excluded.valor",
+            [(self.aluno, k, v) for k, v in updates.items()],
+        )
+        self.conn.executemany("DELETE FROM progress WHERE aluno = ? AND chave = ?",
+                              [(self.aluno, k) for k in deleted])
+        marks = format_stamp(version, applied).partition("|")[2]
+        self.conn.execute("INSERT INTO versoes (aluno, versao, aplicados) VALUES (?, ?, ?) "
+                          "ON CONFLICT(aluno) DO UPDATE SET versao = excluded.versao, aplicados = excluded.aplicados",
+                          (self.aluno, version, marks))
+
+    def _append_sessions(self, rows):
+        with self._transaction():
+            self.conn.executemany("INSERT INTO pomodoro_log (aluno, data, minutos) VALUES (?, ?, ?)",
+                                  [(self.aluno, d, m) for d, m in rows])
+
+    def _clear_sessions(self):
+        with self._transaction():
+            self.conn.execute("DELETE FROM pomodoro_log WHERE aluno = ?", (self.aluno,))
+
+    def _read_sessions(self):
+        return self.conn.execute("SELECT data, minutos FROM pomodoro_log WHERE aluno = ? ORDER BY id",
+                                 (self.aluno,)).fetchall()
+
+    def _append_events(self, rows):
+        with self._transaction():
+            self.conn.executemany("INSERT INTO eventos (aluno, data, chave, campos, dq) VALUES (?, ?, ?, ?, ?)",
+                                  [(self.aluno, *row) for row in rows])
+
+    def _clear_events(self):
+        with self._transaction():
+            self.conn.execute("DELETE FROM eventos WHERE aluno = ?", (self.aluno,))
+
+    def _read_events(self):
+        return self.conn.execute("SELECT data, chave, campos, dq FROM eventos WHERE aluno = ? ORDER BY id",
+                                 (self.aluno,)).fetchall()
+
+class MemoryStore(ProgressStore):
+    # Backend falso para testes e uso sem rede: vive enquanto o processo viver
+    label = "memória"
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.rows = {}
+        self.sessions = []
+        self.events = []
+        self.remote_version = 0
+        self.remote_applied = {}
+
+    def _read(self):
+        return dict(self.rows), self.remote_version, dict(self.remote_applied)
+
+    def _read_stamp(self):
+        return self.remote_version, dict(self.remote_applied)
+
+    def _write(self, updates, deleted, version, applied):
+        self.rows.update(updates)
+        for k in deleted:
+            self.rows.pop(k, None)
+        self.remote_version, self.remote_applied = version, dict(applied)
+
+    def _append_sessions(self, rows):
+        self.sessions.extend(rows)
+
+    def _clear_sessions(self):
+        self.sessions = []
+
+    def _read_sessions(self):
+        return list(self.sessions)
+
+    def _append_events(self, rows):
+        self.events.extend(rows)
+
+    def _clear_events(self):
+        self.events = []
+
+    def _read_events(self):
+        return list(self.events)
+
+# --- DIÁRIO LOCAL (WRITE-AHEAD) ---
+# Toda alteração é gravada (fsync) num SQLite local antes de entrar na fila do
+# write-behind e só sai do diário quando o backend confirma a gravação. Se o
+# processo cair, o que sobrou é reenviado em ordem de sequência na próxima partida.
+
+class Journal:
+    def __init__(self, path, namespace, metrics=NO_METRICS):
+        self.namespace = namespace
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")  # cada commit vai para o disco
+        self.conn.execute("CREATE TABLE IF NOT EXISTS diario ("
+                          "seq INTEGER PRIMARY KEY AUTOINCREMENT, ns TEXT NOT NULL, tipo TEXT NOT NULL, "
+                          "dados TEXT NOT NULL, criado REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS diario_ns ON diario (ns, seq)")
+        # Maior sequência já confirmada pelo backend (as confirmadas saem do diário)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS diario_ack (ns TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+        # Fila morta: itens que o backend recusou de vez saem do diário e ficam aqui
+        self.conn.execute("CREATE TABLE IF NOT EXISTS diario_morto ("
+                          "seq INTEGER PRIMARY KEY, ns TEXT NOT NULL, tipo TEXT NOT NULL, dados TEXT NOT NULL, "
+                          "criado REAL NOT NULL, erro TEXT NOT NULL, descartado REAL NOT NULL)")
+        # Identidade deste diário no carimbo de versão: as seqs só valem junto com ela
+        self.conn.execute("CREATE TABLE IF NOT EXISTS diario_meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO diario_meta (chave, valor) VALUES ('id', ?)", (uuid.uuid4().hex[:12],))
+        self.writer_id = self.conn.execute("SELECT valor FROM diario_meta WHERE chave = 'id'").fetchone()[0]
+
+    def append(self, kind, payload):
+        dados = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        with self.lock, self.metrics.span("journal_append"):
+            return self.conn.execute("INSERT INTO diario (ns, tipo, dados, criado) VALUES (?, ?, ?, ?)",
+                                     (self.namespace, kind, dados, time.time())).lastrowid
+
+    def ack(self, seqs):
+        seqs = [q for q in seqs if q is not None]
+        if not seqs:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("DELETE FROM diario WHERE seq = ?", [(q,) for q in seqs])
+                self.conn.execute("INSERT INTO diario_ack (ns, seq) VALUES (?, ?) "
+                                  "ON CONFLICT (ns) DO UPDATE SET seq = MAX(seq, excluded.seq)",
+                                  (self.namespace, max(seqs)))
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def dead(self, seq, reason):
+        # Move o item para a fila morta: não bloqueia a fila nem volta num reinício
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT OR REPLACE INTO diario_morto (seq, ns, tipo, dados, criado, erro, descartado) "
+                                  "SELECT seq, ns, tipo, dados, criado, ?, ? FROM diario WHERE seq = ?",
+                                  (reason, time.time(), seq))
+                self.conn.execute("DELETE FROM diario WHERE seq = ?", (seq,))
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def pending(self):
+        # -> [(seq, tipo, dados)] ainda não confirmados, na ordem em que aconteceram
+        with self.lock:
+            rows = self.conn.execute("SELECT seq, tipo, dados FROM diario WHERE ns = ? ORDER BY seq",
+                                     (self.namespace,)).fetchall()
+        return [(seq, kind, journal_payload(kind, json.loads(dados))) for seq, kind, dados in rows]
+
+    def acked(self):
+        with self.lock:
+            row = self.conn.execute("SELECT seq FROM diario_ack WHERE ns = ?", (self.namespace,)).fetchone()
+        return row[0] if row else 0
+
+def journal_payload(kind, payload):
+    # JSON não tem tupla: (presente, valor, base) volta como lista
+    if kind == "keys":
+        return {k: tuple(v) for k, v in payload.items()}
+    return payload
+
+def overlay_journal(progress, pending):
+    # Aplica sobre o progresso lido as alterações que o backend ainda não confirmou
+    for _, kind, payload in pending:
+        if kind == "full":
+            progress = copy.deepcopy(payload)
+        elif kind == "keys":
+            for k, (present, value, _) in payload.items():
+                if present: progress[k] = copy.deepcopy(value)
+                else: progress.pop(k, None)
+    return progress
+
+# --- GRAVAÇÃO EM SEGUNDO PLANO (WRITE-BEHIND) ---
+# save_data só coloca a alteração numa fila limitada; uma thread junta as rajadas
+# de edições (vale sempre o último valor de cada chave) e grava tudo de uma vez
+# depois de uma pequena janela sem novas alterações.
+def is_transient_error(error):
+    # Vale tentar de novo: backend fora do ar, cota, rede, banco ocupado ou sem
+    # permissão (configuração). O resto (valor que o backend recusa, erro de
+    # codificação) falharia igual em toda tentativa e iria bloquear a fila.
+    if isinstance(error, (BackendUnavailable, OSError, sqlite3.OperationalError)):
+        return True
+    gspread = sys.modules.get("gspread")  # sem gspread importado não há erro da API
+    if gspread is not None:
+        if isinstance(error, gspread.exceptions.APIError):
+            return error.code in SHEETS_RETRY_STATUS or error.code in (401, 403)
+    return False
+
+def appended_prefix(rows, log):
+    # Quantas linhas do início de rows já estão no fim do log: cada acréscimo entra
+    # inteiro ou não entra, sempre no fim
+    for n in range(min(len(rows), len(log)), 0, -1):
+        if log[-n:] == rows[:n]:
+            return n
+    return 0
+
+class WriteBehind:
+    def __init__(self, store, journal=None, maxsize=500, debounce=0.5, max_delay=3.0, retry_delay=5.0):
+        self.store = store
+        self.journal = journal
+        self.metrics = store.metrics
+        # Sem diário as seqs recomeçam a cada processo: a identidade também
+        self.writer_id = journal.writer_id if journal is not None else uuid.uuid4().hex[:12]
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        self.pending = 0        # alterações enviadas à fila e ainda não gravadas
+        self.oldest = None      # instante da alteração mais antiga ainda não gravada
+        self.last_error = None
+        self.last_flush = None
+        self.last_duration = None  # segundos da última gravação no backend
+        self.replayed_upto = 0  # seq até onde os itens vieram do diário de uma execução anterior
+        self.unwritten = {}     # sem diário: seq local -> item ainda não gravado (ver unconfirmed)
+        self.dead = collections.deque(maxlen=100)  # itens recusados de vez pelo backend (fila morta)
+        self.local_seq = 0
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+        if journal is not None:
+            self._replay()
+
+    def _replay(self):
+        pending = self.journal.pending()
+        if not pending:
+            return
+        self.metrics.inc("journal_replayed", len(pending))
+        self.replayed_upto = pending[-1][0]
+        for seq, kind, payload in pending:
+            self._enqueue((kind, payload), seq)
+
+    def submit(self, data, keys=None, bases=None):
+        # Copia os valores agora: o dicionário da sessão continua sendo alterado
+        bases = bases or {}
+        if keys is None:
+            item = ("full", copy.deepcopy(data))
+        else:
+            item = ("keys", {k: (k in data, copy.deepcopy(data.get(k)), copy.deepcopy(bases.get(k)))
+                             for k in keys})
+        self._enqueue(item)  # bloqueia se a fila encher (contrapressão)
+
+    def append_sessions(self, records):
+        self._enqueue(("append", [dict(r) for r in records]))
+
+    def append_events(self, events):
+        self._enqueue(("events", [dict(e) for e in events]))
+
+    def clear_logs(self):
+        # Apaga o log de sessões e o de eventos (usado no "apagar tudo")
+        self._enqueue(("clear_log", None))
+
+    def _enqueue(self, item, seq=None):
+        # Primeiro o diário (durável), depois a fila: o que foi aceito não se perde
+        if seq is None and self.journal is not None:
+            seq = self.journal.append(*item)
+        with self.lock:
+            if self.journal is None:
+                self.local_seq += 1
+                seq = self.local_seq
+                self.unwritten[seq] = item
+            self.pending += 1
+            if self.oldest is None:
+                self.oldest = time.time()
+        self.queue.put((*item, seq))
+
+    def flush(self, timeout=10, wait=True):
+        done = threading.Event() if wait else None
+        self.queue.put(("flush", done, None))
+        return done.wait(timeout) if wait else True
+
+    def unconfirmed(self):
+        # -> [(seq, tipo, dados)] aceitos e ainda não gravados no backend
+        if self.journal is not None:
+            return self.journal.pending()
+        with self.lock:
+            return [(seq, *item) for seq, item in sorted(self.unwritten.items())]
+
+    def status(self):
+        with self.lock:
+            return {
+                "pendentes": self.pending,
+                "atraso": time.time() - self.oldest if self.oldest else 0.0,
+                "erro": self.last_error,
+                "ultimo": self.last_flush,
+                "duracao": self.last_duration,
+                "conflitos": self.store.conflicts,
+                "confirmado": self.journal.acked() if self.journal is not None else None,
+                "descartados": list(self.dead),
+            }
+
+    def _new_batch(self):
+        # seqs: entradas do diário cobertas por cada etapa (confirmadas quando ela termina)
+        # items: (tipo, dados, seq) na ordem de chegada, para isolar um item com erro permanente
+        return {"full": None, "changes": {}, "appends": [], "events": [], "clear_log": False, "count": 0,
+                "items": [], "check_logs": False, "check_saved": False, "seqs": {"save": [], "appends": [], "events": [], "clear_log": []}}
+
+    def _run(self):
+        batch, waiters = self._new_batch(), []
+        deadline = hard_deadline = None
+        while True:
+            try:
+                if batch["count"] or waiters:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                else:
+                    item = self.queue.get()
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                now = time.monotonic()
+                kind, payload, seq = item
+                if kind == "flush":
+                    if payload is not None:
+                        waiters.append(payload)
+                    deadline = hard_deadline = now
+                    continue
+                if not batch["count"] and not waiters:
+                    hard_deadline = now + self.max_delay
+                deadline = min(now + self.debounce, hard_deadline)
+                self._add(batch, kind, payload, seq)
+                continue
+
+            error = None
+            try:
+                if batch["count"]:
+                    started = time.perf_counter()
+                    self._write(batch)
+                    self.last_duration = time.perf_counter() - started
+                    self.metrics.observe("store_write_seconds", self.last_duration)
+                    self.metrics.inc("store_writes")
+            except Exception as e:
+                self.metrics.inc("store_write_errors")
+                error = e
+                if not is_transient_error(e):
+                    # Repetir não adianta: separa o item culpado e grava o resto do lote
+                    batch, error = self._isolate(batch)
+            if error is not None:
+                # A falha pode ter sido numa gravação que chegou ao backend sem resposta
+                batch["check_logs"] = bool(batch["appends"] or batch["events"])
+                batch["check_saved"] = bool(batch["seqs"]["save"])
+                with self.lock:
+                    self.last_error = f"{type(error).__name__}: {error}"
+                # Disjuntor aberto: só tenta de novo quando ele for liberar uma chamada
+                delay = max(self.retry_delay, getattr(error, "retry_after", 0))
+                deadline = hard_deadline = time.monotonic() + delay
+                for w in waiters: w.set()
+                waiters = []
+                continue
+
+            with self.lock:
+                self.pending -= batch["count"]
+                self.oldest = None if self.pending <= 0 else time.time()
+                self.last_error = None
+                self.last_flush = datetime.now()
+            for w in waiters: w.set()
+            batch, waiters = self._new_batch(), []
+
+    def _add(self, batch, kind, payload, seq):
+        batch["count"] += 1
+        batch["items"].append((kind, payload, seq))
+        seqs = batch["seqs"]
+        if seq is not None and seq <= self.replayed_upto:
+            # Do diário: a queda pode ter sido depois da gravação e antes da confirmação
+            batch["check_logs" if kind in ("append", "events") else "check_saved"] = True
+        if kind == "full":
+            # Cópia rasa: _write mescla as chaves no lote sem tocar o item (unconfirmed)
+            batch["full"], batch["changes"] = dict(payload), {}
+        elif kind == "keys":
+            for k, (present, value, base) in payload.items():
+                # Mantém a base mais antiga: é o que a sessão viu antes da rajada
+                if k in batch["changes"]:
+                    base = batch["changes"][k][2]
+                batch["changes"][k] = (present, value, base)
+        elif kind == "append":
+            batch["appends"].extend(payload)
+        elif kind == "events":
+            batch["events"].extend(payload)
+        elif kind == "clear_log":
+            batch["appends"], batch["events"], batch["clear_log"] = [], [], True
+            # Acréscimos anteriores morrem com a limpeza: confirmados junto com ela
+            seqs["clear_log"] += seqs["appends"] + seqs["events"]
+            seqs["appends"], seqs["events"] = [], []
+        step = {"full": "save", "keys": "save", "append": "appends"}.get(kind, kind)
+        seqs[step].append(seq)
+
+    def _isolate(self, batch):
+        # Erro permanente: as etapas que ainda faltam são refeitas item a item, e só o
+        # item que falha sozinho vai para a fila morta. -> (lote restante, erro transitório)
+        missing = {seq for step in batch["seqs"].values() for seq in step}
+        items = [item for item in batch["items"] if item[2] in missing]
+        with self.lock:
+            self.pending -= batch["count"] - len(items)  # itens de etapas já gravadas
+        for i, item in enumerate(items):
+            single = self._new_batch()
+            self._add(single, *item)
+            try:
+                self._write(single)
+            except Exception as e:
+                if is_transient_error(e):
+                    rest = self._new_batch()
+                    for later in items[i:]:
+                        self._add(rest, *later)
+                    return rest, e
+                self._dead_letter(item, e)
+            with self.lock:
+                self.pending -= 1
+        return self._new_batch(), None
+
+    def _dead_letter(self, item, error):
+        kind, payload, seq = item
+        reason = f"{type(error).__name__}: {error}"
+        self.metrics.inc("store_dead_letters")
+        if self.journal is not None:
+            self.journal.dead(seq, reason)
+        with self.lock:
+            self.unwritten.pop(seq, None)
+            self.dead.append({"seq": seq, "tipo": kind, "erro": reason, "quando": datetime.now()})
+
+    def _done(self, batch, step):
+        if self.journal is not None:
+            self.journal.ack(batch["seqs"][step])
+        else:
+            with self.lock:
+                for seq in batch["seqs"][step]:
+                    self.unwritten.pop(seq, None)
+        batch["seqs"][step] = []
+
+    def _skip_saved(self, batch):
+        # Itens cuja seq o carimbo do backend já registra foram gravados: são só
+        # confirmados, e o lote é remontado com o resto (cada um com a própria base)
+        upto = self.store.applied_seq(self.writer_id)
+        saved = [seq for seq in batch["seqs"]["save"] if seq <= upto]
+        if not saved:
+            return
+        self.metrics.inc("store_saves_skipped", len(saved))
+        rest = self._new_batch()
+        for kind, payload, seq in batch["items"]:
+            if kind in ("full", "keys") and seq in batch["seqs"]["save"] and seq > upto:
+                self._add(rest, kind, payload, seq)
+        batch["full"], batch["changes"] = rest["full"], rest["changes"]
+        batch["seqs"]["save"] = saved
+        self._done(batch, "save")
+        batch["seqs"]["save"] = rest["seqs"]["save"]
+
+    def _write(self, batch):
+        # Cada etapa concluída é retirada do lote e confirmada no diário: numa nova
+        # tentativa (ou na releitura do diário após uma queda) nada é repetido
+        if batch["clear_log"]:
+            self.store.clear_sessions()
+            self.store.clear_events()
+            batch["clear_log"] = False
+        self._done(batch, "clear_log")
+        if batch["check_logs"]:
+            # Vindos do diário ou de uma tentativa sem resposta: o acréscimo pode ter
+            # entrado, então o que já está no fim do log do backend não é reenviado
+            if batch["appends"]:
+                log = [(r["date"], r["minutes"]) for r in self.store.load_sessions()]
+                rows = [(r["date"], int(r["minutes"])) for r in batch["appends"]]
+                del batch["appends"][:appended_prefix(rows, log)]
+            if batch["events"]:
+                log = [(e["t"], e["k"], e["f"], e["dq"]) for e in self.store.load_events()]
+                rows = [(e["t"], e["k"], e["f"], int(e["dq"])) for e in batch["events"]]
+                del batch["events"][:appended_prefix(rows, log)]
+            batch["check_logs"] = False
+        if batch["check_saved"]:
+            self._skip_saved(batch)
+            batch["check_saved"] = False
+        full, changes = batch["full"], batch["changes"]
+        token = (self.writer_id, max(batch["seqs"]["save"])) if batch["seqs"]["save"] else None
+        if full is not None:
+            for k, (present, value, _) in changes.items():
+                if present: full[k] = value
+                else: full.pop(k, None)
+            self.store.save(full, token=token)
+        elif changes:
+            self.store.save({k: v for k, (present, v, _) in changes.items() if present}, list(changes),
+                            {k: base for k, (_, _, base) in changes.items() if base is not None}, token)
+        batch["full"], batch["changes"] = None, {}
+        self._done(batch, "save")
+        if batch["appends"]:
+            self.store.append_sessions(batch["appends"])
+            batch["appends"] = []
+        self._done(batch, "appends")
+        if batch["events"]:
+            self.store.append_events(batch["events"])
+            batch["events"] = []
+        self._done(batch, "events")
+
+def journal_namespaces(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [ns for (ns,) in conn.execute("SELECT DISTINCT ns FROM diario")]
+    except sqlite3.OperationalError:  # diário ainda não criado
+        return []
+    finally:
+        conn.close()
+
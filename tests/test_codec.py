@@ -0,0 +1,140 @@
+import os
+import time
+
+import pytest
+
+from estudamed.codec import (COMPACT_PREFIX, EMPTY_INDEX, decode_value, encode_entry, encode_value, key_for_id,
+                             legacy_syllabus_id, logical_key, physical_key, syllabus_id)
+
+KEY = "Medicina-1. Cuidados gerais-1.1 Nutrição"
+INDEX = {"keys": {KEY: {"id": "abc"}}, "ids": {"abc": KEY}}
+# UTC e fusos com deslocamento negativo e fracionário: nada no codec pode depender do fuso do servidor
+TIMEZONES = ["UTC", "America/Sao_Paulo", "Asia/Kolkata"]
+
+ROUND_TRIP = [
+    {"teoria": True, "questoes": False, "revisao": False},
+    {"teoria": True, "questoes": True, "revisao": True, "num_questoes": 12, "dificuldade": "🔴 Difícil",
+     "notes": "a|b ~2| ção\nfim", "last_modified": "2026-01-01T10:00:00.123456", "ease": 2.36,
+     "intervalo": 6, "repeticoes": 2, "proxima_revisao": "2026-01-07T10:00:00"},
+    {"teoria": False, "questoes": True, "revisao": False, "last_modified": "2026-03-01T08:30:00+03:00",
+     "proxima_revisao": "2026-03-02T08:30:00.000001-05:30"},
+    {"teoria": False, "questoes": False, "revisao": True, "last_modified": "2026-06-30T23:59:59+00:00",
+     "ease": 1.3, "notes": ""},
+    {"num_questoes": 3},
+    {"teoria": True, "last_modified": "2026-10-25T02:30:00"},
+]
+# Não cabem exatos no formato compacto: precisam sair em JSON
+JSON_FALLBACK = [
+    {"teoria": True, "ease": 2.555},
+    {"teoria": True, "num_questoes": 2.5},
+    {"teoria": True, "num_questoes": True},
+    {"teoria": 1},
+    {"teoria": True, "last_modified": None},
+    {"teoria": True, "last_modified": "1969-12-31T23:00:00"},
+    {"teoria": True, "last_modified": "2026-01-01 10:00:00"},
+    {"teoria": True, "last_modified": "2026-01-01T10:00:00+01:00:30"},
+    {"teoria": True, "ease": float("inf")},
+    {"teoria": True, "intervalo": float("nan")},
+]
+# Células gravadas por versões anteriores -> valor esperado (em qualquer fuso)
+LEGACY = [
+    ("~2|3|12|2|t86js0|250|6|2|t8hns0|nota",
+     {"teoria": True, "questoes": True, "revisao": False, "num_questoes": 12, "dificuldade": "🟡 Médio",
+      "last_modified": "2026-01-01T10:00:00", "ease": 2.5, "intervalo": 6, "repeticoes": 2,
+      "proxima_revisao": "2026-01-07T10:00:00", "notes": "nota"}),
+    ("~2|1|||t86js0||||", {"teoria": True, "questoes": False, "revisao": False,
+                           "last_modified": "2026-01-01T10:00:00"}),
+    ("~2|4|||||||", {"teoria": False, "questoes": False, "revisao": True}),
+    ('{"teoria": true, "num_questoes": 3}', {"teoria": True, "num_questoes": 3}),
+    ("~zeJyrVgpOTS/NS0lUslJyTixKycxXSFXISy0tylfSUQpJLTq8HCSTklqcnJhXnK9UCwCSuRDW",
+     {"Segunda": "Cardio e neuro", "Terça": "descanso"}),
+]
+
+
+def set_timezone(name):
+    os.environ["TZ"] = name
+    time.tzset()
+
+
+@pytest.fixture
+def restore_tz():
+    previous = os.environ.get("TZ")
+    yield
+    if previous is None:
+        os.environ.pop("TZ", None)
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+@pytest.fixture(params=TIMEZONES)
+def server_tz(request, restore_tz):
+    set_timezone(request.param)
+    return request.param
+
+
+def same(a, b):
+    # nan != nan: compara campo a campo
+    return a == b or (a.keys() == b.keys() and all(v == b[k] or (v != v and b[k] != b[k]) for k, v in a.items()))
+
+
+@pytest.mark.parametrize("entry", ROUND_TRIP)
+def test_compact_round_trip(server_tz, entry):
+    cell = encode_value(KEY, entry, INDEX)
+    assert cell.startswith(COMPACT_PREFIX)
+    assert decode_value(cell) == entry
+
+
+@pytest.mark.parametrize("entry", JSON_FALLBACK)
+def test_inexact_entries_fall_back_to_json(server_tz, entry):
+    assert encode_entry(entry) is None
+    assert same(decode_value(encode_value(KEY, entry, INDEX)), entry)
+
+
+@pytest.mark.parametrize("cell, expected", LEGACY)
+def test_legacy_cells_still_decode(server_tz, cell, expected):
+    assert decode_value(cell) == expected
+
+
+@pytest.mark.parametrize("entry", ROUND_TRIP)
+def test_cell_reads_the_same_on_servers_in_other_timezones(restore_tz, entry):
+    set_timezone("UTC")
+    cell = encode_value(KEY, entry, INDEX)
+    for name in TIMEZONES:
+        set_timezone(name)
+        assert decode_value(cell) == entry, name
+
+
+def test_other_keys_stay_json():
+    value = {"Segunda": "Cardio"}
+    assert encode_value("crono_text", value, INDEX) == '{"Segunda":"Cardio"}'
+    assert encode_value(KEY, {"teoria": True}, EMPTY_INDEX) == '{"teoria":true}'
+
+
+def test_large_values_are_compressed():
+    value = {f"2026-01-{d:02d}": d for d in range(1, 29)}
+    cell = encode_value("pomodoro_rollup", value, INDEX)
+    assert cell.startswith("~z")
+    assert decode_value(cell) == value
+
+
+def test_physical_and_logical_keys():
+    assert physical_key(KEY, INDEX) == "#abc"
+    assert logical_key("#abc", INDEX) == KEY
+    assert logical_key(KEY, INDEX) == KEY  # linha em formato antigo
+    assert physical_key("crono_text", INDEX) == "crono_text"
+
+
+def test_syllabus_ids_are_wide_and_fit_the_id_column():
+    keys = [f"Medicina-Tópico {t}-Subtópico {n}" for t in range(200) for n in range(100)]
+    ids = {syllabus_id(k) for k in keys}
+    assert len(ids) == len(keys)
+    assert max(len(i) for i in ids) <= 13
+
+
+def test_legacy_ids_still_resolve():
+    old = legacy_syllabus_id(KEY)
+    index = dict(INDEX, legacy_ids={old: KEY})
+    assert logical_key("#" + old, index) == KEY
+    assert key_for_id("abc", index) == KEY
+    assert logical_key("#zzz", index) == "#zzz"
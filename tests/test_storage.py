@@ -0,0 +1,239 @@
+import sqlite3
+import time
+
+import pytest
+
+from estudamed.storage import (Journal, MemoryStore, SQLiteStore, WriteBehind, appended_prefix, merge_counters,
+                               merge_entry, overlay_journal)
+
+KEY = "Medicina-1. Cuidados gerais-1.1 Nutrição"
+
+
+# --- MERGE ---
+def test_merge_entry_keeps_fields_changed_elsewhere():
+    current = {"teoria": True, "questoes": False, "notes": "outra sessão"}
+    base = {"teoria": False, "questoes": False}
+    ours = {"teoria": False, "questoes": True}
+    assert merge_entry(current, base, ours) == {"teoria": True, "questoes": True, "notes": "outra sessão"}
+
+
+def test_merge_counters_adds_only_our_delta():
+    current = {"total_min": 50, "dias": {"2026-01-01": 50}}
+    base = {"total_min": 25, "dias": {"2026-01-01": 25}}
+    ours = {"total_min": 50, "dias": {"2026-01-01": 50, "2026-01-02": 10}}
+    assert merge_counters(current, base, ours) == {"total_min": 75, "dias": {"2026-01-01": 75, "2026-01-02": 10}}
+
+
+def test_merge_counters_drops_fields_we_removed():
+    current = {"n": 3, "itens": {"a": {"q": 1}}}
+    assert merge_counters(current, {"n": 2, "itens": {"a": {"q": 1}}}, {"n": 2}) == {"n": 3}
+
+
+def test_appended_prefix():
+    assert appended_prefix([1, 2, 3], [0, 1, 2]) == 2
+    assert appended_prefix([1, 2], [5, 6]) == 0
+
+
+# --- STORES ---
+def test_sqlite_concurrent_saves_merge_by_field(tmp_path):
+    path = str(tmp_path / "p.db")
+    a, b = SQLiteStore(path), SQLiteStore(path)
+    a.save({KEY: {"teoria": False, "questoes": False}})
+    seen_a, seen_b = a.load(), b.load()
+
+    a.save({KEY: {"teoria": True, "questoes": False}}, [KEY], {KEY: seen_a[KEY]})
+    b.save({KEY: {"teoria": False, "questoes": True}}, [KEY], {KEY: seen_b[KEY]})
+
+    assert b.conflicts == 1
+    assert SQLiteStore(path).load()[KEY] == {"teoria": True, "questoes": True}
+
+
+def test_sqlite_namespaces_are_isolated(tmp_path):
+    path = str(tmp_path / "p.db")
+    SQLiteStore(path, "ana").save({"crono_text": {"Segunda": "x"}})
+    assert SQLiteStore(path, "bia").load() == {}
+
+
+def test_rows_with_legacy_ids_are_rewritten_with_the_new_id():
+    index = {"keys": {KEY: {"id": "novo"}}, "ids": {"novo": KEY}, "legacy_ids": {"velho": KEY}}
+    store = MemoryStore(index=lambda: index)
+    store.rows["#velho"] = '{"teoria":true}'
+    assert store.load()[KEY] == {"teoria": True}
+    store.save({KEY: {"teoria": True, "questoes": True}}, [KEY])
+    assert set(store.rows) == {"#novo"}
+
+
+def test_load_returns_independent_copies():
+    store = MemoryStore()
+    store.save({KEY: {"teoria": True}})
+    store.load()[KEY]["teoria"] = False
+    assert store.load()[KEY] == {"teoria": True}
+
+
+def test_snapshot_round_trip(tmp_path):
+    store = MemoryStore()
+    store.snapshot_path = str(tmp_path / "snap.json")
+    store.save({"crono_text": {"Segunda": "x"}})
+    assert store.load_snapshot() == {"crono_text": {"Segunda": "x"}}
+
+
+# --- DIÁRIO ---
+def test_journal_pending_ack_and_dead(tmp_path):
+    journal = Journal(str(tmp_path / "j.db"), "memory:")
+    first = journal.append("keys", {KEY: [True, {"teoria": True}, None]})
+    second = journal.append("append", [{"date": "2026-01-01", "minutes": 25}])
+    third = journal.append("events", [])
+    assert [seq for seq, _, _ in journal.pending()] == [first, second, third]
+    assert journal.pending()[0][2] == {KEY: (True, {"teoria": True}, None)}
+
+    journal.ack([first])
+    journal.dead(second, "ValueError: recusado")
+    assert [seq for seq, _, _ in journal.pending()] == [third]
+    assert journal.acked() == first
+    conn = sqlite3.connect(str(tmp_path / "j.db"))
+    assert conn.execute("SELECT seq, erro FROM diario_morto").fetchall() == [(second, "ValueError: recusado")]
+
+
+def test_overlay_journal_applies_unconfirmed_changes():
+    pending = [(1, "keys", {KEY: (True, {"teoria": True}, None), "crono_text": (False, None, None)})]
+    assert overlay_journal({"crono_text": {}}, pending) == {KEY: {"teoria": True}}
+
+
+# --- WRITE-BEHIND ---
+class FlakyStore(MemoryStore):
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+
+    def _write(self, updates, deleted, version, applied):
+        if self.errors:
+            raise self.errors.pop(0)
+        super()._write(updates, deleted, version, applied)
+
+
+def make_writer(store, journal=None):
+    return WriteBehind(store, journal, debounce=0.01, max_delay=0.05, retry_delay=0.05)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_write_behind_coalesces_and_acks(tmp_path):
+    store = MemoryStore()
+    journal = Journal(str(tmp_path / "j.db"), "memory:")
+    writer = make_writer(store, journal)
+    for n in range(5):
+        writer.submit({KEY: {"num_questoes": n}}, [KEY])
+    assert writer.flush()
+    assert store.load()[KEY] == {"num_questoes": 4}
+    assert store.version == 1
+    assert journal.pending() == []
+
+
+def test_write_behind_retries_transient_errors():
+    store = FlakyStore([OSError("rede")])
+    writer = make_writer(store)
+    writer.submit({KEY: {"teoria": True}}, [KEY])
+    assert wait_until(lambda: store.rows and writer.status()["pendentes"] == 0)
+    assert writer.status()["erro"] is None
+    assert writer.unconfirmed() == []
+
+
+def test_write_behind_dead_letters_only_the_bad_item(tmp_path):
+    journal = Journal(str(tmp_path / "j.db"), "memory:")
+    store = FlakyStore([ValueError("recusado"), ValueError("recusado")])
+    writer = make_writer(store, journal)
+    writer.submit({KEY: {"teoria": True}}, [KEY])
+    writer.append_sessions([{"date": "2026-01-01", "minutes": 25}])
+    writer.flush()
+    assert wait_until(lambda: writer.status()["descartados"])
+    assert [d["tipo"] for d in writer.status()["descartados"]] == ["keys"]
+    assert store.sessions == [["2026-01-01", 25]]
+    assert journal.pending() == []
+
+
+def test_write_behind_replays_journal(tmp_path):
+    path = str(tmp_path / "j.db")
+    Journal(path, "memory:").append("keys", {KEY: [True, {"teoria": True}, None]})
+    store = MemoryStore()
+    writer = make_writer(store, Journal(path, "memory:"))
+    assert writer.replayed_upto == 1
+    writer.flush()
+    assert wait_until(lambda: store.rows)
+    assert store.load()[KEY] == {"teoria": True}
+
+
+@pytest.mark.parametrize("kind", ["append", "events"])
+def test_replayed_appends_are_not_duplicated(tmp_path, kind):
+    path = str(tmp_path / "j.db")
+    store = MemoryStore()
+    if kind == "append":
+        payload = [{"date": "2026-01-01", "minutes": 25}]
+        store.append_sessions(payload)
+    else:
+        payload = [{"t": "2026-01-01T10:00:00", "k": KEY, "f": "teoria", "dq": 0}]
+        store.append_events(payload)
+    Journal(path, "memory:").append(kind, payload)  # a queda foi depois do acréscimo
+    writer = make_writer(store, Journal(path, "memory:"))
+    assert writer.flush()
+    assert len(store.sessions if kind == "append" else store.events) == 1
+
+
+class AppliedThenFailingStore(MemoryStore):
+    # A gravação chega ao backend, mas a resposta se perde (timeout)
+    def __init__(self, failures=1):
+        super().__init__()
+        self.failures = failures
+
+    def _write(self, updates, deleted, version, applied):
+        super()._write(updates, deleted, version, applied)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("timeout depois de gravar")
+
+
+def add_pomodoro(writer, minutes, seen):
+    ours = {"total_min": seen["total_min"] + minutes}
+    writer.submit({"pomodoro_rollup": ours}, ["pomodoro_rollup"], {"pomodoro_rollup": seen})
+
+
+def test_retry_after_applied_write_does_not_count_twice():
+    store = AppliedThenFailingStore(failures=0)
+    store.save({"pomodoro_rollup": {"total_min": 0}})
+    store.failures = 1
+    writer = make_writer(store)
+    add_pomodoro(writer, 25, {"total_min": 0})
+    assert wait_until(lambda: writer.status()["pendentes"] == 0)
+    assert store.load()["pomodoro_rollup"] == {"total_min": 25}
+    assert writer.unconfirmed() == []
+
+
+def test_replay_after_crash_before_ack_does_not_count_twice(tmp_path):
+    path = str(tmp_path / "j.db")
+    store = MemoryStore()
+    store.save({"pomodoro_rollup": {"total_min": 0}})
+    # Gravou no backend e caiu antes de confirmar no diário
+    journal = Journal(path, "memory:")
+    seq = journal.append("keys", {"pomodoro_rollup": [True, {"total_min": 25}, {"total_min": 0}]})
+    store.save({"pomodoro_rollup": {"total_min": 25}}, ["pomodoro_rollup"], {"pomodoro_rollup": {"total_min": 0}},
+               (journal.writer_id, seq))
+
+    writer = make_writer(store, Journal(path, "memory:"))
+    add_pomodoro(writer, 10, {"total_min": 25})
+    assert writer.flush()
+    assert store.load()["pomodoro_rollup"] == {"total_min": 35}
+    assert writer.journal.pending() == []
+
+
+def test_stamp_is_kept_by_sqlite(tmp_path):
+    path = str(tmp_path / "p.db")
+    SQLiteStore(path).save({"crono_text": {"Segunda": "x"}}, token=("abc", 7))
+    store = SQLiteStore(path)
+    assert store.applied_seq("abc") == 7
+    assert store.save({"crono_text": {"Segunda": "y"}}, token=("abc", 7)) == 0